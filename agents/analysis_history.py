@@ -0,0 +1,233 @@
+"""
+图片分析历史模块
+把每次完整的图片分析（视觉分析、搭配建议、搜索关键词和商品快照）压缩后保存到本地SQLite，
+按图片内容摘要和用户会话索引。用户再次上传同一张图片时直接返回历史结果，不再调用模型；
+商品快照（价格、优惠券）过期时只按保存的关键词重新搜索
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
+
+
+class HistorySettings(BaseModel):
+    """分析历史配置，对应 config.yaml 中的 history"""
+
+    enabled: bool = Field(True, description="是否保存并复用图片分析结果")
+    sqlite_path: str = Field("cache/analysis_history.sqlite", description="SQLite文件路径")
+    share_across_sessions: bool = Field(True, description="其他会话分析过同一张图片时也复用其结果")
+    product_ttl: float = Field(1800.0, description="商品快照的有效期（秒），过期后按保存的关键词重新搜索")
+    retention_days: float = Field(30.0, description="分析记录的保留天数")
+    max_entries: int = Field(20000, description="最多保留的记录数，超过时按最近访问时间淘汰")
+    prune_interval: float = Field(3600.0, description="两次清理之间的最短间隔（秒）")
+    compress_level: int = Field(6, description="zlib压缩级别")
+
+
+class HistoryEntry(BaseModel):
+    """一条分析记录"""
+
+    image_hash: str
+    session_id: str
+    version: str = Field(..., description="视觉模型、建议模型和提示词版本，变化后不再复用")
+    analysis: Dict[str, Any] = Field(default_factory=dict, description="image_analysis、recommendations、search_terms")
+    products: Dict[str, Any] = Field(default_factory=dict, description="product_suggestions 快照")
+    created_at: float
+    products_at: float
+    hits: int = 0
+
+
+class AnalysisHistory:
+    """图片分析历史（SQLite，线程安全）
+
+    主键为 (image_hash, session_id)，另有按图片、按会话和按创建时间的索引，
+    分别用于跨会话复用、列出会话历史和按保留期清理。
+    """
+
+    def __init__(self, settings: HistorySettings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "pruned": 0}
+        self._last_prune = 0.0
+        self._conn = self._open_sqlite(settings.sqlite_path)
+        self.prune()
+
+    @staticmethod
+    def _open_sqlite(path: str) -> sqlite3.Connection:
+        """打开（必要时创建）历史库"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analyses (
+                image_hash TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                version TEXT NOT NULL,
+                analysis BLOB NOT NULL,
+                products BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                products_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (image_hash, session_id)
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_image ON analyses(image_hash, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_session ON analyses(session_id, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses(created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_last_access ON analyses(last_access)")
+        conn.commit()
+        return conn
+
+    def _pack(self, value: Dict[str, Any]) -> bytes:
+        return zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"), self.settings.compress_level)
+
+    @staticmethod
+    def _unpack(blob: bytes) -> Dict[str, Any]:
+        return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+    def _row_to_entry(self, row: tuple) -> HistoryEntry:
+        image_hash, session_id, version, analysis, products, created_at, products_at, hits = row
+        return HistoryEntry(
+            image_hash=image_hash,
+            session_id=session_id,
+            version=version,
+            analysis=self._unpack(analysis),
+            products=self._unpack(products),
+            created_at=created_at,
+            products_at=products_at,
+            hits=hits
+        )
+
+    def lookup(self, image_hash: str, session_id: Optional[str], version: str) -> Optional[HistoryEntry]:
+        """查找同一张图片当前版本的分析记录，优先本会话，其次（允许时）其他会话中最新的一条"""
+        session_id = session_id or ""
+        cutoff = time.time() - self.settings.retention_days * 86400
+        columns = "image_hash, session_id, version, analysis, products, created_at, products_at, hits"
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {columns} FROM analyses WHERE image_hash = ? AND session_id = ? AND version = ? AND created_at >= ?",
+                (image_hash, session_id, version, cutoff)
+            ).fetchone()
+            if row is None and self.settings.share_across_sessions:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM analyses WHERE image_hash = ? AND version = ? AND created_at >= ? "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (image_hash, version, cutoff)
+                ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute(
+                "UPDATE analyses SET last_access = ?, hits = hits + 1 WHERE image_hash = ? AND session_id = ?",
+                (time.time(), row[0], row[1])
+            )
+            self._conn.commit()
+            self._stats["hits"] += 1
+        try:
+            return self._row_to_entry(row)
+        except (zlib.error, ValueError) as e:
+            print(f"⚠️ 分析历史记录损坏，已忽略: {str(e)}")
+            return None
+
+    def products_stale(self, entry: HistoryEntry) -> bool:
+        """商品快照是否已超过有效期"""
+        return time.time() - entry.products_at >= self.settings.product_ttl
+
+    def save(
+        self,
+        image_hash: str,
+        session_id: Optional[str],
+        version: str,
+        analysis: Dict[str, Any],
+        products: Dict[str, Any],
+        products_at: Optional[float] = None,
+        created_at: Optional[float] = None
+    ):
+        """保存（覆盖）本会话中这张图片的分析记录
+
+        Args:
+            products_at: 商品快照的获取时间，默认为当前时间；传0表示下次读取时重新搜索
+            created_at: 分析时间，默认为当前时间；复制其他会话的记录时沿用原记录的时间，保留期从原始分析算起
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analyses "
+                "(image_hash, session_id, version, analysis, products, created_at, products_at, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (
+                    image_hash, session_id or "", version, self._pack(analysis), self._pack(products),
+                    now if created_at is None else created_at, now if products_at is None else products_at, now
+                )
+            )
+            self._conn.commit()
+            self._stats["writes"] += 1
+        if now - self._last_prune >= self.settings.prune_interval:
+            self.prune()
+
+    def update_products(self, image_hash: str, session_id: str, products: Dict[str, Any]):
+        """更新一条记录的商品快照"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE analyses SET products = ?, products_at = ? WHERE image_hash = ? AND session_id = ?",
+                (self._pack(products), time.time(), image_hash, session_id)
+            )
+            self._conn.commit()
+
+    def recent(self, session_id: Optional[str], limit: int = 20) -> List[HistoryEntry]:
+        """会话中最近的分析记录，按创建时间倒序"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT image_hash, session_id, version, analysis, products, created_at, products_at, hits "
+                "FROM analyses WHERE session_id = ? ORDER BY created_at DESC LIMIT ?",
+                (session_id or "", limit)
+            ).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def prune(self) -> int:
+        """删除超过保留期的记录，并按最近访问时间淘汰超出容量的记录，返回删除数量"""
+        cutoff = time.time() - self.settings.retention_days * 86400
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM analyses WHERE created_at < ?", (cutoff,)).rowcount
+            overflow = self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0] - self.settings.max_entries
+            if overflow > 0:
+                removed += self._conn.execute(
+                    "DELETE FROM analyses WHERE rowid IN "
+                    "(SELECT rowid FROM analyses ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                ).rowcount
+            self._conn.commit()
+            self._stats["pruned"] += removed
+            self._last_prune = time.time()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """命中、未命中、写入和清理计数，以及记录数和库文件大小"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        if os.path.exists(self.settings.sqlite_path):
+            stats["file_bytes"] = os.path.getsize(self.settings.sqlite_path)
+        return stats
+
+    @classmethod
+    def from_settings(cls, settings: HistorySettings) -> Optional["AnalysisHistory"]:
+        """按配置创建，未启用或无法打开数据库时返回None"""
+        if not settings.enabled:
+            return None
+        try:
+            return cls(settings)
+        except Exception as e:
+            print(f"⚠️ 分析历史库初始化失败，不复用历史结果: {str(e)}")
+            return None
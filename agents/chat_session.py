@@ -0,0 +1,112 @@
+"""
+多轮对话会话模块
+保存每个会话的消息历史（有长度上限），通过 /api/chat 发送，
+系统提示词固定不变，同一会话尽量落在同一个Ollama后端，使追问时可以复用已缓存的前缀
+"""
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+from pydantic import BaseModel, Field
+
+
+class ChatSettings(BaseModel):
+    """对话会话配置，对应 config.yaml 中的 chat"""
+
+    max_turns: int = Field(8, description="每个会话保留的最大对话轮数（一问一答为一轮）")
+    max_sessions: int = Field(256, description="同时保留的会话数，超过时淘汰最久未使用的会话")
+    ttl_seconds: float = Field(3600.0, description="会话闲置超过该秒数后丢弃")
+
+
+class ChatSession:
+    """一个对话会话"""
+
+    def __init__(self, session_id: str, system_prompt: str, max_turns: int):
+        self.session_id = session_id
+        self.system_prompt = system_prompt
+        self.max_turns = max_turns
+        self.history: List[Dict[str, str]] = []
+        # 上一轮处理请求的Ollama地址，下一轮优先发往该地址以复用缓存
+        self.backend: Optional[str] = None
+        self.last_active = time.monotonic()
+        # 同一会话的消息依次处理
+        self.lock = threading.Lock()
+
+    @property
+    def turns(self) -> int:
+        return len(self.history) // 2
+
+    def messages_for(self, user_message: str) -> List[Dict[str, str]]:
+        """本轮发送给模型的完整消息列表：系统提示词 + 历史 + 新问题"""
+        return [
+            {"role": "system", "content": self.system_prompt},
+            *self.history,
+            {"role": "user", "content": user_message}
+        ]
+
+    def append_turn(self, user_message: str, answer: str, backend: Optional[str] = None):
+        """记录一轮对话
+
+        超过 max_turns 时一次丢弃一半最早的对话，而不是每轮丢一条，
+        这样历史前缀能在接下来几轮保持不变，Ollama可以继续复用缓存。
+        """
+        self.history.append({"role": "user", "content": user_message})
+        self.history.append({"role": "assistant", "content": answer})
+        if self.turns > self.max_turns:
+            keep = max(1, self.max_turns // 2)
+            self.history = self.history[-keep * 2:]
+        if backend:
+            self.backend = backend
+        self.last_active = time.monotonic()
+
+
+class ChatSessionStore:
+    """内存中的会话表，按最近使用淘汰（线程安全）"""
+
+    def __init__(self, system_prompt: str, settings: Optional[ChatSettings] = None):
+        self.system_prompt = system_prompt
+        self.settings = settings or ChatSettings()
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def get(self, session_id: Optional[str] = None) -> ChatSession:
+        """获取会话，不存在或已过期时新建
+
+        Args:
+            session_id: 会话ID，为空时生成新ID
+        """
+        session_id = session_id or uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChatSession(session_id, self.system_prompt, self.settings.max_turns)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.settings.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_active = now
+            return session
+
+    def reset(self, session_id: str):
+        """清空会话历史"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _expire(self, now: float):
+        """丢弃闲置过久的会话（调用方持有锁）"""
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_active < self.settings.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "turns": sum(session.turns for session in self._sessions.values())
+            }
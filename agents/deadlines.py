@@ -0,0 +1,63 @@
+"""
+请求时限模块
+为图片分析流程的视觉分析、搭配建议和京东搜索各阶段分配时间，
+各阶段都不能超过整次请求的总预算
+"""
+import time
+from typing import List
+from pydantic import BaseModel, Field
+
+
+class StageDeadlines(BaseModel):
+    """各阶段时限（秒），对应 config.yaml 中的 deadlines"""
+
+    vision: float = Field(120.0, description="视觉模型分析图片")
+    advice: float = Field(90.0, description="文本模型生成搭配建议")
+    jd: float = Field(15.0, description="京东商品搜索")
+    total: float = Field(180.0, description="整次请求的总预算")
+
+
+class RequestBudget:
+    """一次请求的时间预算，记录超时的阶段"""
+
+    def __init__(self, deadlines: StageDeadlines):
+        self.deadlines = deadlines
+        self.start = time.monotonic()
+        self.timed_out: List[str] = []
+        self._stage = ""
+        self._stage_end = self.start
+
+    def begin(self, stage: str) -> float:
+        """开始一个阶段，返回该阶段可用的秒数"""
+        now = time.monotonic()
+        seconds = max(0.0, min(
+            getattr(self.deadlines, stage),
+            self.deadlines.total - (now - self.start)
+        ))
+        self._stage = stage
+        self._stage_end = now + seconds
+        return seconds
+
+    @property
+    def stage_deadline(self) -> float:
+        """当前阶段的截止时间（time.monotonic()）"""
+        return self._stage_end
+
+    @property
+    def total_deadline(self) -> float:
+        """整次请求的截止时间（time.monotonic()）"""
+        return self.start + self.deadlines.total
+
+    def remaining(self) -> float:
+        """当前阶段剩余秒数"""
+        return max(0.0, self._stage_end - time.monotonic())
+
+    def expired(self) -> bool:
+        """当前阶段是否已到时限"""
+        return time.monotonic() >= self._stage_end
+
+    def mark_timeout(self, stage: str = ""):
+        """记录超时的阶段"""
+        stage = stage or self._stage
+        if stage not in self.timed_out:
+            self.timed_out.append(stage)
@@ -3,14 +3,61 @@ Fashion Agent 主协调器
 负责整合文本、图像和工具，提供完整的服务
 """
 import os
-import yaml
 import json
-from typing import Dict, List, Any, Optional
-from PIL import Image
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple, Type
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 from models.text_agent import TextAgent
-from models.image import ImageModel
+from models.image import ImageModel, is_error_result
+from models.image_preprocess import ImageInput, image_digest
+from models.config import load_config
+from models.registry import ModelRegistry, get_registry
+from models.residency import ModelKeeper, warmup_models
+from models.admission import admission_stats, is_server_busy
+from models.backend_pool import backend_stats
+from models.generation_metrics import GenerationMetrics, metrics_summary
+from models.tracing import (
+    TracingSettings,
+    annotate,
+    bind_context,
+    configure_tracing,
+    current_trace_id,
+    get_trace,
+    span,
+    trace_iter,
+    traced,
+)
+from agents.deadlines import RequestBudget, StageDeadlines
+from agents.chat_session import ChatSettings, ChatSessionStore
+from agents.prompts import RenderedPrompt, prompt_registry
+from agents.single_flight import SingleFlight, SingleFlightSettings, normalize_key
+from agents.quick_answers import QuickAnswerSettings, QuickAnswerStore
+from agents.model_routing import RoutingSettings, TaskRouter
+from agents.analysis_history import AnalysisHistory, HistorySettings
+from agents.product_search import (
+    ProductSearchSettings,
+    asearch_keyword,
+    asearch_products,
+    search_keyword,
+    search_keywords_list,
+    search_products,
+)
+from agents.structured_output import (
+    EarlySearchSettings,
+    OutfitAdvice,
+    QueryAdvice,
+    SearchKeywords,
+    StructuredOutputSettings,
+    normalize_keywords,
+    parse_partial,
+    parse_structured,
+    response_format,
+    split_keywords,
+)
 
 # 导入京东工具
 from agents.tools.jindon_tools import JdUnionGoodsQueryTool
@@ -20,17 +67,64 @@ from agents.tools.jindon_tools import JdUnionGoodsQueryTool
 # 确保工具被注册
 # from agents.mcp_tools import taobao_integration, xiaohongshu_api, jingdong_tools
 
+# 与搭配建议并行的关键词生成和商品搜索（搜索本身在 product_search 的线程池中并发执行）
+_early_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="early-search")
+
 class FashionAgent:
     """时尚搭配智能体"""
     
     def __init__(self, config_path: str = "config.yaml"):
         """初始化智能体"""
-        # 加载配置
-        self.config = self._load_config(config_path)
+        # 加载配置（进程内共享的缓存配置）
+        self.config = load_config(config_path)
+        
+        # 模型注册表：模型封装懒加载，Ollama服务在后台探测
+        self.registry: ModelRegistry = get_registry(config_path)
+        
+        # 各阶段的链路追踪span（进程内共享）
+        configure_tracing(TracingSettings(**self.config.get("tracing", {})))
+        
+        # 视觉分析、搭配建议和京东搜索的阶段时限
+        self.deadlines = StageDeadlines(**self.config.get("deadlines", {}))
+        
+        # 非流式问答和搭配建议的JSON输出
+        self.structured_output = StructuredOutputSettings(**self.config.get("structured_output", {}))
+        
+        # 提前生成关键词并与搭配建议并行搜索商品
+        self.early_search = EarlySearchSettings(**self.config.get("early_search", {}))
+        
+        # 多个关键词的并发搜索
+        self.product_search = ProductSearchSettings(**self.config.get("product_search", {}))
         
-        # 初始化模型
-        self.text_model = None
-        self.vision_model = None
+        # 按任务选择文本模型（关键词等短任务使用小模型）和生成长度
+        self.router = TaskRouter(
+            RoutingSettings(**self.config.get("routing", {})),
+            self.registry.text_model_for
+        )
+        
+        # 相同的进行中请求（文本、视觉、京东搜索）只执行一次，等待方共享结果
+        self.single_flight = SingleFlight(SingleFlightSettings(**self.config.get("single_flight", {})))
+        
+        # 热门问题的预计算回答和商品推荐
+        self.quick_answers = QuickAnswerStore(
+            QuickAnswerSettings(**self.config.get("quick_answers", {})),
+            answer=self._answer_text_query,
+            search=self._recommend_for_analysis,
+            version=self._text_version
+        )
+        
+        # 图片分析历史：同一张图片再次上传时直接返回保存的结果，不再调用模型
+        self.history = AnalysisHistory.from_settings(HistorySettings(**self.config.get("history", {})))
+        
+        # 多轮对话会话（系统提示词固定，便于Ollama复用缓存的前缀）
+        self.chat_sessions = ChatSessionStore(
+            self._build_chat_system_prompt(),
+            ChatSettings(**self.config.get("chat", {}))
+        )
+        
+        # 模型预热结果和驻留线程
+        self.warmup_report = []
+        self.model_keeper = None
         
         # 初始化京东工具
         try:
@@ -42,54 +136,109 @@ class FashionAgent:
         # 完成初始化
         self._initialize()
     
-    def _load_config(self, config_path: str) -> Dict[str, Any]:
-        """加载配置文件"""
-        if not os.path.exists(config_path):
-            raise FileNotFoundError(f"配置文件 {config_path} 不存在")
-            
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
-            
-        return config
+    @property
+    def text_model(self) -> Optional[TextAgent]:
+        """文本模型，首次访问时由注册表创建"""
+        return self.registry.text_model
+    
+    @property
+    def vision_model(self) -> Optional[ImageModel]:
+        """视觉模型，首次访问时由注册表创建"""
+        return self.registry.vision_model
     
     def _initialize(self):
         """初始化模型和工具"""
         print("正在初始化Fashion Agent...")
         
-        # 初始化文本模型
-        try:
-            print("加载文本模型...")
-            self.text_model = TextAgent.from_config()
-        except Exception as e:
-            print(f"文本模型加载失败: {e}")
+        # 预热模型并启动驻留线程（均在后台进行，不阻塞启动）
+        self._start_residency()
         
-        # 初始化视觉模型
-        try:
-            print("加载视觉模型...")
-            self.vision_model = ImageModel.from_config()
-        except Exception as e:
-            print(f"视觉模型加载失败: {e}")
+        # 后台预计算热门问题
+        if self.text_model:
+            self.quick_answers.start()
         
         print("Fashion Agent 初始化完成")
     
-    def process_image(self, image_path: str) -> Dict[str, Any]:
-        """处理服装图片，返回完整分析结果"""
-        if not os.path.exists(image_path):
-            return {"error": f"图片 {image_path} 不存在"}
+    def _start_residency(self):
+        """预加载模型，并启动在模型被卸载前重新预热的后台线程"""
+        residency_config = self.config.get("models", {}).get("residency", {})
+        models = [
+            model for model in (self.text_model, self.registry.small_text_model, self.vision_model) if model
+        ]
+        if not models:
+            return
+        
+        if residency_config.get("warmup_on_startup", True):
+            if residency_config.get("blocking_warmup", False):
+                self.warmup_report = warmup_models(models)
+            else:
+                # 后台预热，不阻塞界面启动
+                threading.Thread(
+                    target=lambda: self.warmup_report.extend(warmup_models(models)),
+                    name="ollama-warmup",
+                    daemon=True
+                ).start()
+        
+        if residency_config.get("keeper_enabled", True):
+            self.model_keeper = ModelKeeper(
+                list(models),
+                check_interval=residency_config.get("check_interval", 60),
+                refresh_margin=residency_config.get("refresh_margin", 120)
+            )
+            self.model_keeper.start()
+    
+    @traced("agent.process_image")
+    def process_image(self, image: ImageInput) -> Dict[str, Any]:
+        """处理服装图片（路径、原始字节或PIL图像），返回完整分析结果"""
+        missing = self._missing_image(image)
+        if missing:
+            return {"error": missing}
             
         if not self.vision_model:
             return {"error": "视觉模型未加载，无法分析图片"}
         
         try:
-            comprehensive_analysis = self.vision_model.analyze_fashion(
-                image_path, 
-                "comprehensive_analysis"
-            )
+            metrics = {"vision": []}
+            comprehensive_analysis = self._analyze_image(image, metrics["vision"])
+            
+            if is_server_busy(comprehensive_analysis["raw_analysis"]):
+                return self._busy_result(comprehensive_analysis["raw_analysis"])
             
-            return {"analysis": comprehensive_analysis["raw_analysis"]}
+            return self._attach_metrics({"analysis": comprehensive_analysis["raw_analysis"]}, metrics)
         except Exception as e:
             return {"error": f"分析图片时出错: {str(e)}"}
     
+    def process_images(
+        self,
+        images: Iterable[ImageInput],
+        max_concurrency: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """批量处理服装图片，按完成顺序产出每张图片的分析结果
+
+        Args:
+            images: 图像路径、原始字节或PIL图像对象的可迭代对象
+            max_concurrency: 同时进行的模型请求数，默认使用配置中的 batch.max_concurrency
+
+        Yields:
+            Dict: index、source，以及 analysis 或 error
+        """
+        if not self.vision_model:
+            yield {"error": "视觉模型未加载，无法分析图片"}
+            return
+        
+        for item in self.vision_model.analyze_many(
+            images, "comprehensive_analysis", max_concurrency=max_concurrency
+        ):
+            result = {"index": item["index"], "source": item["source"]}
+            if "error" in item and is_server_busy(item["error"]):
+                result.update(self._busy_result(item["error"]))
+            elif "error" in item:
+                result["error"] = f"分析图片时出错: {item['error']}"
+            else:
+                result["analysis"] = item["raw_analysis"]
+            yield result
+    
+    @traced("agent.recommendations")
     def get_recommendations(self, query: str, max_results: int = 5) -> Dict[str, Any]:
         """获取商品推荐和搭配灵感"""
         result = {}
@@ -98,10 +247,7 @@ class FashionAgent:
         try:
             if self.jd_tool:
                 try:
-                    jd_results = self.jd_tool.run({
-                        "keyword": query, 
-                        "page_size": max_results
-                    })
+                    jd_results = search_keyword(self.jd_tool.run, query, max_results)
 
                     result = jd_results
                     print("成功获取京东商品推荐")
@@ -112,81 +258,336 @@ class FashionAgent:
         except Exception as e:
             return {"error": f"获取推荐时出错: {str(e)}"}
 
+    @traced("agent.text_query")
     def process_text_query(self, query: str) -> Dict[str, Any]:
-        """处理文本查询，提供时尚分析和商品推荐"""
+        """处理文本查询，提供时尚分析和商品推荐；热门问题直接返回预计算的结果（带 precomputed 字段）"""
         if not self.text_model:
             return {"error": "文本模型未加载"}
 
+        precomputed = self.quick_answers.get(query)
+        if precomputed is not None:
+            annotate(precomputed=True)
+            return precomputed
+        return self._answer_text_query(query)
+
+    def _answer_text_query(self, query: str) -> Dict[str, Any]:
+        """调用文本模型回答问题并搜索商品"""
         try:
-            # 构建提示词，让模型分析并生成关键词
-            prompt = f"""
-                    你是一位专业的时尚搭配顾问，具有丰富的服装搭配经验和对时尚趋势的深度理解。请分析以下关于时尚搭配的问题，并提供专业、实用的建议。
+            # 调用文本模型获取分析和关键词
+            metrics = {"answer": []}
+            analysis, keywords = self._invoke_text(
+                "text_query", QueryAdvice, metrics["answer"], query=query.strip()
+            )
+            if is_server_busy(analysis):
+                return self._busy_result(analysis)
+
+            result = {
+                "analysis": analysis
+            }
+            result.update(self._recommend_for_analysis(analysis, keywords))
+
+            return self._attach_metrics(result, metrics)
+        except Exception as e:
+            return {"error": f"处理文本查询时出错: {str(e)}"}
 
-                    用户问题：{query}
+    @traced("agent.analyze_and_recommend")
+    def analyze_and_recommend(self, image: ImageInput, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """分析图片并提供搭配建议和商品推荐
 
-                    请按照以下格式详细回复：
+        image 可以是图片路径、上传文件的原始字节或PIL图像，内存中的图像直接编码发送，不写临时文件。
+        各阶段受 deadlines 配置约束，超时时返回已完成部分，并带有 partial 和 timed_out 字段。
+        同一张图片分析过时直接返回分析历史中的结果（带 from_history 字段），不调用模型；
+        session_id 为用户会话，优先复用本会话的记录。
+        """
+        missing = self._missing_image(image)
+        if missing:
+            return {"error": missing}
 
-                    ## 时尚分析
-                    ### 风格定位
-                    [分析用户需求的风格定位，如商务、休闲、约会、运动等]
+        if not self.vision_model:
+            return {"error": "视觉模型未加载，无法分析图片"}
 
-                    ### 搭配建议
-                    [详细的搭配建议，包括：
-                    - 颜色搭配原则和推荐色彩
-                    - 款式选择和版型建议
-                    - 材质和面料推荐
-                    - 配饰搭配技巧]
+        if not self.text_model:
+            return {"error": "文本模型未加载，无法生成建议"}
 
-                    ### 场合适应性
-                    [分析适合的穿着场合和季节特点]
+        image_hash = self._history_key(image)
+        remembered = self._from_history(image_hash, session_id)
+        if remembered is not None:
+            return remembered
 
-                    ### 流行趋势
-                    [结合当前时尚趋势给出建议]
+        budget = RequestBudget(self.deadlines)
+        metrics = {"vision": [], "keywords": [], "advice": []}
+        try:
+            # 1. 使用视觉模型分析图片
+            vision_analysis = self._analyze_image(image, metrics["vision"], budget.begin("vision"))
 
-                    ## 搜索关键词
-                    keywords: [为商品搜索提供3-5个精准的关键词，用逗号分隔。关键词应该具体、实用，便于搜索到相关商品，如"春季外套,休闲西装,轻薄针织衫"]
+            image_analysis = vision_analysis["raw_analysis"]
+            if is_server_busy(image_analysis):
+                return self._busy_result(image_analysis)
+            if budget.expired():
+                return self._vision_timeout_result(budget)
 
-                    请确保建议专业、实用，关键词精准有效。
-"""
+            # 2. 提前生成关键词并在后台搜索商品，同时使用文本模型生成搭配建议
+            early = self._start_early_search(image_analysis, metrics["keywords"], budget)
+            text_response, search_terms = self._invoke_text(
+                "advice", OutfitAdvice, metrics["advice"],
+                timeout=budget.begin("advice"), image_analysis=image_analysis
+            )
+            if is_server_busy(text_response):
+                return self._busy_result(text_response)
+            if budget.expired():
+                # 建议超时时仍带上提前搜索到的商品，与流式版本一致
+                budget.mark_timeout()
+                found = self._finish_early_search(early, budget) or ([], {})
+                return self._finalize_image_result(
+                    self._compose_image_result(image_analysis, "", *found), budget, metrics
+                )
+
+            # 3. 搜索商品（或等待提前开始的搜索）并组合结果
+            found = self._finish_early_search(early, budget)
+            if found is not None:
+                result = self._compose_image_result(image_analysis, text_response, *found)
+            else:
+                result = self._build_image_result(image_analysis, text_response, budget, search_terms)
 
-            # 调用文本模型获取分析
-            analysis = self.text_model.invoke(prompt)
+            return self._remember(image_hash, session_id, self._finalize_image_result(result, budget, metrics))
+        except Exception as e:
+            return {"error": f"分析过程中出错: {str(e)}"}
 
-            # 提取搜索关键词
-            keywords = ""
-            if "搜索关键词" in analysis and "keywords:" in analysis:
-                keyword_section = analysis.split("## 搜索关键词")[1].strip()
-                keywords = keyword_section.split("keywords:")[
-                    1].strip() if ":" in keyword_section else keyword_section.strip()
+    @traced("agent.stream_text_query")
+    def stream_text_query(self, query: str) -> Iterator[Dict[str, Any]]:
+        """流式处理文本查询
+
+        先逐token产出已生成的回答（stage="answer"），回答结束后再搜索商品，
+        最后产出与 process_text_query 结构一致的完整结果（stage="done"）。
+        """
+        if not self.text_model:
+            yield {"stage": "done", "error": "文本模型未加载"}
+            return
+
+        precomputed = self.quick_answers.get(query)
+        if precomputed is not None:
+            annotate(precomputed=True)
+            yield {"stage": "done", **precomputed}
+            return
+
+        try:
+            prompt = self._build_text_query_prompt(query)
+
+            metrics = {"answer": []}
+            analysis = ""
+            for token in self._stream_text("text_query", prompt, system=prompt.system, metrics_sink=metrics["answer"]):
+                if not token:
+                    continue
+                if not analysis and is_server_busy(token):
+                    yield {"stage": "done", **self._busy_result(token)}
+                    return
+                analysis += token
+                yield {"stage": "answer", "analysis": analysis}
+            self._record_prompt(prompt, metrics["answer"])
 
             result = {
+                "stage": "done",
                 "analysis": analysis
             }
+            result.update(self._recommend_for_analysis(analysis))
 
-            # 如果有关键词且京东工具可用，则获取商品推荐
-            if keywords and self.jd_tool:
-                try:
-                    # 使用提取的关键词搜索商品
-                    jd_results = self.jd_tool.run({
-                        "keyword": keywords,
-                        "page_size": 5  # 获取5条商品信息
-                    })
-
-                    # 将商品信息添加到结果中
-                    result["recommendations"] = jd_results
-                    print(f"成功获取关键词'{keywords}'的商品推荐")
-                except Exception as e:
-                    print(f"获取商品推荐时出错: {str(e)}")
-                    result["recommendation_error"] = str(e)
+            yield self._attach_metrics(result, metrics)
+        except Exception as e:
+            yield {"stage": "done", "error": f"处理文本查询时出错: {str(e)}"}
 
-            return result
+    def chat(self, message: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """多轮对话，返回与 stream_chat 最后一项结构一致的结果"""
+        result = {}
+        for result in self.stream_chat(message, session_id):
+            pass
+        return result
+
+    @traced("agent.stream_chat")
+    def stream_chat(self, message: str, session_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """流式多轮对话
+
+        会话保留最近几轮的问答，追问时只需处理新增的消息。
+        先逐token产出回答（stage="answer"），结束后搜索回答中的关键词，
+        最后产出完整结果（stage="done"），均带有 session_id 供下一轮使用。
+        出错或服务繁忙时本轮不计入会话历史。
+        """
+        if not self.text_model:
+            yield {"stage": "done", "error": "文本模型未加载"}
+            return
+
+        session = self.chat_sessions.get(session_id)
+        with session.lock:
+            try:
+                metrics = {"answer": []}
+                answer = ""
+                model = self.router.model_for("chat")
+                kwargs = {"metrics_sink": metrics["answer"]}
+                num_predict = self.router.num_predict("chat")
+                if num_predict:
+                    kwargs["max_tokens"] = num_predict
+                messages = session.messages_for(message)
+                tokens = self._timed_stream("chat", model, model.stream_chat(
+                    messages,
+                    prefer_backend=session.backend,
+                    **kwargs
+                ), metrics["answer"])
+                for token in trace_iter(
+                    "text.stream", tokens, task="chat", model=model.model_name,
+                    messages=len(messages), prompt_chars=sum(len(m.get("content", "")) for m in messages)
+                ):
+                    if not answer and is_server_busy(token):
+                        yield {"stage": "done", "session_id": session.session_id, **self._busy_result(token)}
+                        return
+                    answer += token
+                    yield {"stage": "answer", "session_id": session.session_id, "analysis": answer}
+
+                if answer.startswith("模型调用失败"):
+                    yield {"stage": "done", "session_id": session.session_id, "error": answer}
+                    return
+
+                session.append_turn(
+                    message, answer, metrics["answer"][-1].backend if metrics["answer"] else None
+                )
+                result = {
+                    "stage": "done",
+                    "session_id": session.session_id,
+                    "turns": session.turns,
+                    "analysis": answer
+                }
+                result.update(self._recommend_for_analysis(answer))
+
+                yield self._attach_metrics(result, metrics)
+            except Exception as e:
+                yield {"stage": "done", "session_id": session.session_id, "error": f"对话时出错: {str(e)}"}
+
+    def reset_chat(self, session_id: str):
+        """清空会话历史"""
+        self.chat_sessions.reset(session_id)
+
+    @traced("agent.stream_analyze_and_recommend")
+    def stream_analyze_and_recommend(
+        self,
+        image: ImageInput,
+        session_id: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """流式分析图片并提供搭配建议和商品推荐
+
+        依次产出 stage 为 "vision"（图片分析完成）、"advice"（搭配建议生成中）、
+        "done"（与 analyze_and_recommend 结构一致的完整结果）的字典。
+        提前开始的商品搜索完成后，"advice" 阶段的字典会带上 search_terms 和 product_suggestions。
+        分析历史中有这张图片时直接产出 "done"。
+        """
+        missing = self._missing_image(image)
+        if missing:
+            yield {"stage": "done", "error": missing}
+            return
+
+        if not self.vision_model:
+            yield {"stage": "done", "error": "视觉模型未加载，无法分析图片"}
+            return
+
+        if not self.text_model:
+            yield {"stage": "done", "error": "文本模型未加载，无法生成建议"}
+            return
+
+        image_hash = self._history_key(image)
+        remembered = self._from_history(image_hash, session_id)
+        if remembered is not None:
+            yield {"stage": "done", **remembered}
+            return
+
+        budget = RequestBudget(self.deadlines)
+        metrics = {"vision": [], "keywords": [], "advice": []}
+        try:
+            vision_analysis = self._analyze_image(image, metrics["vision"], budget.begin("vision"))
+            image_analysis = vision_analysis["raw_analysis"]
+            if is_server_busy(image_analysis):
+                yield {"stage": "done", **self._busy_result(image_analysis)}
+                return
+            if budget.expired():
+                yield {"stage": "done", **self._vision_timeout_result(budget)}
+                return
+            yield {"stage": "vision", "image_analysis": image_analysis}
+
+            early = self._start_early_search(image_analysis, metrics["keywords"], budget)
+            products = {}
+            prompt = self._build_advice_prompt(image_analysis)
+
+            text_response = ""
+            for token in self._stream_text(
+                "advice", prompt, system=prompt.system,
+                timeout=budget.begin("advice"), metrics_sink=metrics["advice"]
+            ):
+                if budget.expired():
+                    # 到达时限后停止生成，已生成的部分照常用于搜索商品
+                    budget.mark_timeout()
+                    break
+                if not token:
+                    continue
+                if not text_response and is_server_busy(token):
+                    yield {"stage": "done", **self._busy_result(token)}
+                    return
+                text_response += token
+                if early is not None and not products and early.done() and not early.exception() and early.result():
+                    # 提前搜索完成时商品随建议一起展示，不必等建议生成完
+                    search_terms, product_suggestions = early.result()
+                    products = {"search_terms": search_terms, "product_suggestions": product_suggestions}
+                yield {
+                    "stage": "advice",
+                    "image_analysis": image_analysis,
+                    "recommendations": self._extract_advice(text_response),
+                    **products
+                }
+            else:
+                if budget.expired():
+                    budget.mark_timeout()
+            self._record_prompt(prompt, metrics["advice"])
+
+            found = self._finish_early_search(early, budget)
+            if found is not None:
+                result = self._compose_image_result(image_analysis, text_response, *found)
+            else:
+                result = self._build_image_result(image_analysis, text_response, budget)
+            result["stage"] = "done"
+
+            yield self._remember(image_hash, session_id, self._finalize_image_result(result, budget, metrics))
+        except Exception as e:
+            yield {"stage": "done", "error": f"分析过程中出错: {str(e)}"}
+
+    @traced("agent.text_query")
+    async def aprocess_text_query(self, query: str) -> Dict[str, Any]:
+        """异步处理文本查询，返回结构与 process_text_query 一致"""
+        if not self.text_model:
+            return {"error": "文本模型未加载"}
+
+        precomputed = self.quick_answers.get(query)
+        if precomputed is not None:
+            annotate(precomputed=True)
+            return precomputed
+
+        try:
+            metrics = {"answer": []}
+            analysis, keywords = await self._ainvoke_text(
+                "text_query", QueryAdvice, metrics["answer"], query=query.strip()
+            )
+            if is_server_busy(analysis):
+                return self._busy_result(analysis)
+
+            result = {
+                "analysis": analysis
+            }
+            result.update(await self._arecommend_for_analysis(analysis, keywords))
+
+            return self._attach_metrics(result, metrics)
         except Exception as e:
             return {"error": f"处理文本查询时出错: {str(e)}"}
 
-    def analyze_and_recommend(self, image_path: str) -> Dict[str, Any]:
-        """分析图片并提供搭配建议和商品推荐"""
-        if not os.path.exists(image_path):
-            return {"error": f"图片 {image_path} 不存在"}
+    @traced("agent.analyze_and_recommend")
+    async def aanalyze_and_recommend(self, image: ImageInput, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """异步分析图片并提供搭配建议和商品推荐，返回结构与 analyze_and_recommend 一致"""
+        missing = self._missing_image(image)
+        if missing:
+            return {"error": missing}
 
         if not self.vision_model:
             return {"error": "视觉模型未加载，无法分析图片"}
@@ -194,154 +595,762 @@ class FashionAgent:
         if not self.text_model:
             return {"error": "文本模型未加载，无法生成建议"}
 
+        image_hash = await asyncio.to_thread(self._history_key, image)
+        remembered = await asyncio.to_thread(self._from_history, image_hash, session_id)
+        if remembered is not None:
+            return remembered
+
+        budget = RequestBudget(self.deadlines)
+        metrics = {"vision": [], "keywords": [], "advice": []}
+        early = None
         try:
-            # 1. 使用视觉模型分析图片
-            vision_analysis = self.vision_model.analyze_fashion(
-                image_path,
-                "comprehensive_analysis"
+            try:
+                vision_analysis = await asyncio.wait_for(
+                    self._aanalyze_image(image, metrics["vision"]),
+                    budget.begin("vision")
+                )
+            except asyncio.TimeoutError:
+                return self._vision_timeout_result(budget)
+            image_analysis = vision_analysis["raw_analysis"]
+            if is_server_busy(image_analysis):
+                return self._busy_result(image_analysis)
+
+            early = self._astart_early_search(image_analysis, metrics["keywords"], budget)
+            try:
+                text_response, search_terms = await asyncio.wait_for(
+                    self._ainvoke_text(
+                        "advice", OutfitAdvice, metrics["advice"], image_analysis=image_analysis
+                    ),
+                    budget.begin("advice")
+                )
+            except asyncio.TimeoutError:
+                budget.mark_timeout()
+                found = await self._afinish_early_search(early, budget) or ([], {})
+                return self._finalize_image_result(
+                    self._compose_image_result(image_analysis, "", *found), budget, metrics
+                )
+            if is_server_busy(text_response):
+                return self._busy_result(text_response)
+
+            found = await self._afinish_early_search(early, budget)
+            if found is not None:
+                result = self._compose_image_result(image_analysis, text_response, *found)
+            else:
+                result = await self._abuild_image_result(image_analysis, text_response, budget, search_terms)
+            return await asyncio.to_thread(
+                self._remember, image_hash, session_id, self._finalize_image_result(result, budget, metrics)
             )
+        except Exception as e:
+            return {"error": f"分析过程中出错: {str(e)}"}
+        finally:
+            # 提前返回（繁忙、超时、出错）时不再需要提前搜索的结果
+            if early is not None and not early.done():
+                early.cancel()
 
-            image_analysis = vision_analysis["raw_analysis"]
+    def _history_key(self, image: ImageInput) -> Optional[str]:
+        """分析历史的键：图片内容摘要；未启用历史或无法读取图片时返回None"""
+        if self.history is None:
+            return None
+        try:
+            return image_digest(image)
+        except Exception:
+            return None
 
-            # 2. 使用文本模型生成搭配建议
-            prompt = f"""
-                    你是一位专业的时尚搭配顾问和服装分析师。请根据以下图片中的服装分析，提供专业的搭配建议和商品搜索关键词。
+    def _image_version(self) -> str:
+        """图片分析的版本标识：视觉模型、建议模型和提示词版本，变化时不再复用分析历史"""
+        prompts = ",".join(f"{name}@v{prompt_registry.get(name).version}" for name in ("advice", "advice_json"))
+        return f"{self.vision_model.model_name}+{self.router.model_for('advice').model_name}:{prompts}"
 
-                    ## 图片分析结果
-                    {image_analysis}
+    def _from_history(self, image_hash: Optional[str], session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """返回分析历史中这张图片的结果（带 from_history 和 analyzed_at），没有时返回None
 
-                    请按照以下格式提供专业建议：
+        商品快照过期时按保存的关键词重新搜索；从其他会话复用时在本会话中保存一份。
+        """
+        if image_hash is None:
+            return None
+        with span("history.lookup") as current:
+            try:
+                entry = self.history.lookup(image_hash, session_id, self._image_version())
+            except Exception as e:
+                print(f"⚠️ 读取分析历史失败: {str(e)}")
+                entry = None
+            current.set(hit=entry is not None)
+        if entry is None:
+            return None
 
-                    ## 搭配建议
-                    ### 现有单品分析
-                    [分析图片中已有服装的优点和特色]
+        products, products_at = entry.products, entry.products_at
+        if self.history.products_stale(entry) and self.jd_tool:
+            refreshed = self._search_products(
+                entry.analysis.get("search_terms") or [], time.monotonic() + self.deadlines.jd
+            )
+            if refreshed.get("goods") and not refreshed.get("timed_out"):
+                products, products_at = refreshed, time.time()
+                self.history.update_products(entry.image_hash, entry.session_id, products)
+        if entry.session_id != (session_id or ""):
+            self.history.save(
+                image_hash, session_id, entry.version, entry.analysis, products, products_at, entry.created_at
+            )
 
-                    ### 搭配补充建议
-                    [建议如何搭配其他单品来完善整体造型：
-                    - 上下装搭配建议
-                    - 颜色协调方案
-                    - 配饰推荐（鞋子、包包、饰品等）
-                    - 外套或内搭建议]
+        print(f"📚 使用分析历史中的结果（{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.created_at))}）")
+        result = {
+            **entry.analysis,
+            "product_suggestions": products,
+            "from_history": True,
+            "analyzed_at": entry.created_at
+        }
+        return self._attach_metrics(result, {})
 
-                    ### 风格提升
-                    [如何通过搭配提升整体风格和时尚度]
+    def _remember(self, image_hash: Optional[str], session_id: Optional[str], result: Dict[str, Any]) -> Dict[str, Any]:
+        """把完整的分析结果保存到分析历史；部分结果和模型调用失败的结果不保存"""
+        if image_hash is None or "error" in result or result.get("partial"):
+            return result
+        if is_error_result(result.get("image_analysis", "")) or is_error_result(result.get("recommendations", "")):
+            return result
+        analysis = {key: result.get(key) for key in ("image_analysis", "recommendations", "search_terms")}
+        products = result.get("product_suggestions") or {}
+        try:
+            # 没有商品（搜索失败或未配置京东工具）时下次读取会重新搜索
+            self.history.save(
+                image_hash, session_id, self._image_version(), analysis, products,
+                None if products.get("goods") else 0
+            )
+        except Exception as e:
+            print(f"⚠️ 保存分析历史失败: {str(e)}")
+        return result
 
-                    ### 场合适配
-                    [分析适合的穿着场合和如何调整搭配适应不同场合]
+    def get_analysis_history(self, session_id: Optional[str], limit: int = 20) -> List[Dict[str, Any]]:
+        """会话中最近分析过的图片（摘要、分析结果、商品快照和时间），按时间倒序"""
+        if self.history is None:
+            return []
+        return [entry.model_dump() for entry in self.history.recent(session_id, limit)]
 
-                    ## 搜索关键词
-                    keywords: [基于图片分析和搭配建议，提供5-8个精准的商品搜索关键词，用逗号分隔。包括具体的服装类型、颜色、风格等，如"白色衬衫,高腰牛仔裤,休闲外套,棕色皮鞋,简约手表"]
+    def get_history_stats(self) -> Optional[Dict[str, Any]]:
+        """分析历史的命中、写入和清理计数，未启用时返回None"""
+        return self.history.stats() if self.history else None
 
-                    请确保搭配建议实用可行，搜索关键词精准有效。
-"""
+    def _vision_timeout_result(self, budget: RequestBudget) -> Dict[str, Any]:
+        """视觉分析超时时没有可用的部分结果"""
+        budget.mark_timeout("vision")
+        return {"error": "图片分析超时，请稍后重试", "partial": True, "timed_out": budget.timed_out}
 
-            text_response = self.text_model.invoke(prompt)
-
-            # 3. 提取搜索关键词
-            search_terms = []
-            if "搜索关键词" in text_response and "keywords:" in text_response:
-                keyword_section = text_response.split("## 搜索关键词")[1].strip()
-                keywords_str = keyword_section.split("keywords:")[
-                    1].strip() if ":" in keyword_section else keyword_section.strip()
-                search_terms = [term.strip() for term in keywords_str.split("、") if term.strip()]
-
-            # 如果没有有效的关键词，使用默认关键词
-            if not search_terms:
-                search_terms = ["时尚", "服装"]
-
-            # 4. 使用关键词搜索商品
-            # product_suggestions = {}
-            # if self.jd_tool:
-            #     try:
-            #         # 使用提取的第一个关键词搜索商品
-            #         main_keyword = search_terms[0] if search_terms else "时尚服装"
-            #         jd_results = self.jd_tool.run({
-            #             "keyword": main_keyword,
-            #             "page_size": 5  # 获取5条商品信息
-            #         })
-
-            #         product_suggestions["jd_recommendations"] = jd_results
-            #         print(f"成功获取关键词'{main_keyword}'的商品推荐")
-            #     except Exception as e:
-            #         print(f"获取商品推荐时出错: {str(e)}")
-            #         product_suggestions["error"] = str(e)
-            product_suggestions = {}
-            if self.jd_tool:
+    def _finalize_image_result(
+        self,
+        result: Dict[str, Any],
+        budget: RequestBudget,
+        metrics: Dict[str, List[GenerationMetrics]]
+    ) -> Dict[str, Any]:
+        """附加各阶段耗时指标，有阶段超时时标记结果为部分结果"""
+        if result.get("product_suggestions", {}).get("timed_out"):
+            budget.mark_timeout("jd")
+        if budget.timed_out:
+            result["partial"] = True
+            result["timed_out"] = budget.timed_out
+        return self._attach_metrics(result, metrics)
+
+    def _attach_metrics(
+        self,
+        result: Dict[str, Any],
+        metrics: Dict[str, List[GenerationMetrics]]
+    ) -> Dict[str, Any]:
+        """把各阶段模型调用的Ollama耗时指标附加到结果的 metrics 字段（命中缓存的阶段没有指标），
+        启用链路追踪时附加 trace_id，可用 get_trace 查看各阶段耗时"""
+        stage_metrics = {stage: records[-1].to_dict() for stage, records in metrics.items() if records}
+        if stage_metrics:
+            result["metrics"] = stage_metrics
+        trace_id = current_trace_id()
+        if trace_id:
+            result["trace_id"] = trace_id
+        return result
+
+    def get_trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        """一个请求中各阶段的span（名称、父子关系、耗时和属性），按开始时间排序"""
+        return get_trace(trace_id)
+
+    def get_model_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """各模型累计的解码速度、提示词处理耗时和模型加载次数"""
+        return metrics_summary()
+
+    @staticmethod
+    def _missing_image(image: ImageInput) -> Optional[str]:
+        """图片路径不存在时返回错误信息；内存中的图像（PIL或字节）无需检查"""
+        if isinstance(image, str) and not os.path.exists(image):
+            return f"图片 {image} 不存在"
+        if isinstance(image, (bytes, bytearray)) and not image:
+            return "图片内容为空"
+        return None
+
+    def _busy_result(self, message: str) -> Dict[str, Any]:
+        """Ollama排队已满或排队超时时返回的结果，busy=True 供界面提示稍后重试"""
+        return {"error": message, "busy": True}
+
+    def get_load_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各Ollama地址的健康状态、在途请求、平均延迟、队列深度和排队耗时"""
+        stats: Dict[str, Dict[str, Any]] = {}
+        for url, backend in backend_stats().items():
+            stats.setdefault(url, {}).update(backend)
+        for url, admission in admission_stats().items():
+            stats.setdefault(url, {}).update(admission)
+        return stats
+
+    def _build_text_query_prompt(self, query: str) -> RenderedPrompt:
+        """构建文本查询的提示词（固定的系统前缀 + 用户问题）"""
+        return prompt_registry.render("text_query", query=query.strip())
+
+    def _build_chat_system_prompt(self) -> str:
+        """多轮对话的系统提示词（所有会话相同，不包含任何随请求变化的内容）"""
+        return prompt_registry.get("chat").system
+
+    def _build_advice_prompt(self, image_analysis: str) -> RenderedPrompt:
+        """根据图片分析结果构建搭配建议提示词（固定的系统前缀 + 图片分析结果）"""
+        return prompt_registry.render("advice", image_analysis=image_analysis)
+
+    def _text_request(
+        self,
+        name: str,
+        schema: Type[BaseModel],
+        sink: List[GenerationMetrics],
+        timeout: Optional[float] = None,
+        structured: Optional[bool] = None,
+        **values
+    ) -> Tuple[RenderedPrompt, Dict[str, Any]]:
+        """选择提示词并构建文本模型调用参数，启用结构化输出时使用JSON版本的提示词
+
+        name 同时是路由的任务名，任务配置了 num_predict 时以其为准；structured 为None时按配置决定。
+        """
+        if structured is None:
+            structured = self.structured_output.enabled
+        prompt = prompt_registry.render(f"{name}_json" if structured else name, **values)
+        kwargs = {"system": prompt.system, "metrics_sink": sink}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        if structured:
+            kwargs["format"] = response_format(schema, self.structured_output.mode)
+        num_predict = self.router.num_predict(name, self.structured_output.num_predict if structured else None)
+        if num_predict:
+            kwargs["max_tokens"] = num_predict
+        return prompt, kwargs
+
+    def _parse_text(self, text: str, schema: Type[BaseModel]) -> Tuple[Optional[str], Optional[List[str]]]:
+        """解析结构化输出，返回 (用于展示的Markdown文本, 关键词)
+
+        未启用结构化输出或调用失败时返回原始文本和None，由调用方从文本中提取关键词。
+        JSON不完整（如达到 num_predict 被截断）时取出已生成的字段；什么也取不出时返回 (None, None)，
+        由调用方不带JSON约束重新生成，不把原始JSON展示给用户。
+        """
+        if not self.structured_output.enabled or is_server_busy(text) or text.startswith("模型调用失败"):
+            return text, None
+        parsed = parse_structured(schema, text) or parse_partial(schema, text)
+        if parsed is None:
+            return None, None
+        return parsed.to_markdown(), parsed.keywords or None
+
+    def _invoke_text(
+        self,
+        name: str,
+        schema: Type[BaseModel],
+        sink: List[GenerationMetrics],
+        timeout: Optional[float] = None,
+        **values
+    ) -> Tuple[str, Optional[List[str]]]:
+        """调用文本模型生成回答和关键词（参数见 _text_request，返回值见 _parse_text）
+
+        结构化输出无法解析时在剩余时限内不带JSON约束重新生成一次。
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        prompt, kwargs = self._text_request(name, schema, sink, timeout, **values)
+        text, keywords = self._parse_text(self._generate_text(name, prompt, sink, **kwargs), schema)
+        if text is not None:
+            return text, keywords
+        remaining = self._retry_timeout(deadline)
+        if remaining is not None and remaining <= 0:
+            return "模型调用失败: 结构化输出不完整", None
+        print(f"⚠️ {name} 的结构化输出无法解析，改为自由文本重新生成")
+        prompt, kwargs = self._text_request(name, schema, sink, remaining, structured=False, **values)
+        return self._generate_text(name, prompt, sink, **kwargs), None
+
+    async def _ainvoke_text(
+        self,
+        name: str,
+        schema: Type[BaseModel],
+        sink: List[GenerationMetrics],
+        timeout: Optional[float] = None,
+        **values
+    ) -> Tuple[str, Optional[List[str]]]:
+        """异步版本的 _invoke_text"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        prompt, kwargs = self._text_request(name, schema, sink, timeout, **values)
+        text, keywords = self._parse_text(await self._agenerate_text(name, prompt, sink, **kwargs), schema)
+        if text is not None:
+            return text, keywords
+        remaining = self._retry_timeout(deadline)
+        if remaining is not None and remaining <= 0:
+            return "模型调用失败: 结构化输出不完整", None
+        print(f"⚠️ {name} 的结构化输出无法解析，改为自由文本重新生成")
+        prompt, kwargs = self._text_request(name, schema, sink, remaining, structured=False, **values)
+        return await self._agenerate_text(name, prompt, sink, **kwargs), None
+
+    @staticmethod
+    def _retry_timeout(deadline: Optional[float]) -> Optional[float]:
+        """重新生成可用的剩余时间，没有时限时返回None"""
+        return deadline - time.monotonic() if deadline is not None else None
+
+    def _text_key(self, prompt: RenderedPrompt, model: TextAgent, stream: bool = False) -> Tuple:
+        """文本请求的合并键：模型、提示词名称、版本和归一化的用户后缀"""
+        return (
+            "stream" if stream else "text", model.model_name,
+            prompt.name, prompt.version, normalize_key(prompt.prompt)
+        )
+
+    def _generate_text(self, task: str, prompt: RenderedPrompt, sink: List[GenerationMetrics], **kwargs) -> str:
+        """用任务对应的模型生成文本，相同提示词的进行中调用只执行一次（指标和提示词统计只记在实际执行的调用上）"""
+        model = self.router.model_for(task)
+
+        def generate() -> str:
+            with self.router.timed(task, model.model_name, sink):
+                text = model.invoke(prompt.prompt, **kwargs)
+            self._record_prompt(prompt, sink)
+            return text
+
+        with span("text.generate", task=task, model=model.model_name, prompt_chars=len(prompt.prompt)) as current:
+            try:
+                text = self.single_flight.do(self._text_key(prompt, model), generate, kwargs.get("timeout"))
+            except FuturesTimeoutError:
+                text = "模型调用失败: 等待相同请求的结果超时"
+            current.set(response_chars=len(text))
+        return text
+
+    async def _agenerate_text(self, task: str, prompt: RenderedPrompt, sink: List[GenerationMetrics], **kwargs) -> str:
+        """异步版本的 _generate_text"""
+        model = self.router.model_for(task)
+
+        async def generate() -> str:
+            with self.router.timed(task, model.model_name, sink):
+                text = await model.ainvoke(prompt.prompt, **kwargs)
+            self._record_prompt(prompt, sink)
+            return text
+
+        with span("text.generate", task=task, model=model.model_name, prompt_chars=len(prompt.prompt)) as current:
+            text = await self.single_flight.ado(self._text_key(prompt, model), generate)
+            current.set(response_chars=len(text))
+        return text
+
+    def _stream_text(self, task: str, prompt: RenderedPrompt, **kwargs) -> Iterator[str]:
+        """用任务对应的模型流式生成，相同提示词的进行中生成只执行一次，后加入的请求从头回放已生成的token"""
+        model = self.router.model_for(task)
+        num_predict = self.router.num_predict(task)
+        if num_predict:
+            kwargs.setdefault("max_tokens", num_predict)
+        tokens = self.single_flight.stream(
+            self._text_key(prompt, model, stream=True),
+            lambda: self._timed_stream(task, model, model.stream(prompt.prompt, **kwargs), kwargs.get("metrics_sink"))
+        )
+        return trace_iter("text.stream", tokens, task=task, model=model.model_name, prompt_chars=len(prompt.prompt))
+
+    def _timed_stream(
+        self,
+        task: str,
+        model: TextAgent,
+        tokens: Iterable[str],
+        sink: Optional[List[GenerationMetrics]] = None
+    ) -> Iterator[str]:
+        """把流式生成的耗时（到最后一个token或提前结束为止）计入任务统计"""
+        with self.router.timed(task, model.model_name, sink):
+            yield from tokens
+
+    def get_routing_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各任务使用的模型、调用次数、端到端耗时分位数和解码速度"""
+        return self.router.stats()
+
+    def _image_key(self, image: ImageInput) -> Optional[Tuple]:
+        """视觉请求的合并键：图片内容摘要；无法读取时不合并，由视觉模型报告错误"""
+        if not self.single_flight.settings.enabled:
+            return None
+        try:
+            return ("vision", image_digest(image))
+        except Exception:
+            return None
+
+    def _analyze_image(
+        self,
+        image: ImageInput,
+        sink: List[GenerationMetrics],
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """综合分析图片，相同图片的进行中分析只执行一次"""
+        kwargs = {"metrics_sink": sink}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        with span("vision.analyze") as current:
+            try:
+                result = self.single_flight.do(
+                    self._image_key(image),
+                    lambda: self.vision_model.analyze_fashion(image, "comprehensive_analysis", **kwargs),
+                    timeout
+                )
+            except FuturesTimeoutError:
+                result = {"raw_analysis": "模型调用失败: 等待相同图片的分析结果超时", "task": "comprehensive_analysis"}
+            current.set(cached=result.get("cached"))
+        return result
+
+    async def _aanalyze_image(self, image: ImageInput, sink: List[GenerationMetrics]) -> Dict[str, Any]:
+        """异步版本的 _analyze_image（时限由调用方的 wait_for 控制）"""
+        with span("vision.analyze") as current:
+            result = await self.single_flight.ado(
+                await asyncio.to_thread(self._image_key, image),
+                lambda: self.vision_model.aanalyze_fashion(image, "comprehensive_analysis", metrics_sink=sink)
+            )
+            current.set(cached=result.get("cached"))
+        return result
+
+    def _text_version(self) -> str:
+        """文本问答的版本标识：模型名称和提示词版本，变化时热门问题的预计算回答失效"""
+        name = "text_query_json" if self.structured_output.enabled else "text_query"
+        return f"{self.router.model_for('text_query').model_name}:{name}@v{prompt_registry.get(name).version}"
+
+    def get_quick_answer_stats(self) -> Dict[str, Any]:
+        """热门问题的命中次数、生成和刷新次数，以及各问题的更新时间"""
+        return self.quick_answers.stats()
+
+    def get_single_flight_stats(self) -> Dict[str, int]:
+        """请求合并的实际执行次数、共享结果次数和进行中的请求数"""
+        return self.single_flight.stats()
+
+    def _keyword_request(
+        self,
+        image_analysis: str,
+        sink: List[GenerationMetrics]
+    ) -> Tuple[RenderedPrompt, Dict[str, Any]]:
+        """简短的关键词提示词，只输出关键词数组"""
+        prompt = prompt_registry.render("keywords_json", image_analysis=image_analysis)
+        return prompt, {
+            "system": prompt.system,
+            "format": response_format(SearchKeywords, self.structured_output.mode),
+            "max_tokens": self.router.num_predict("keywords", self.early_search.num_predict),
+            "timeout": self.deadlines.advice,
+            "metrics_sink": sink
+        }
+
+    def _parse_keywords(self, text: str) -> List[str]:
+        if is_server_busy(text) or text.startswith("模型调用失败"):
+            return []
+        parsed = parse_structured(SearchKeywords, text)
+        return parsed.keywords if parsed is not None else []
+
+    def _early_search(
+        self,
+        image_analysis: str,
+        sink: List[GenerationMetrics],
+        deadline: float
+    ) -> Optional[Tuple[List[str], Dict[str, Any]]]:
+        """生成关键词并搜索商品，没有生成出关键词时返回None"""
+        prompt, kwargs = self._keyword_request(image_analysis, sink)
+        keywords = self._parse_keywords(self._generate_text("keywords", prompt, sink, **kwargs))
+        if not keywords:
+            return None
+        print(f"提前生成关键词: {', '.join(keywords)}")
+        return keywords, self._search_products(keywords, deadline)
+
+    async def _aearly_search(
+        self,
+        image_analysis: str,
+        sink: List[GenerationMetrics],
+        deadline: float
+    ) -> Optional[Tuple[List[str], Dict[str, Any]]]:
+        """异步版本的 _early_search"""
+        prompt, kwargs = self._keyword_request(image_analysis, sink)
+        keywords = self._parse_keywords(await self._agenerate_text("keywords", prompt, sink, **kwargs))
+        if not keywords:
+            return None
+        print(f"提前生成关键词: {', '.join(keywords)}")
+        return keywords, await self._asearch_products(keywords, deadline)
+
+    def _early_search_enabled(self) -> bool:
+        """提前搜索只在关键词任务使用与搭配建议不同的模型（models.text_small）时开启：
+        同一个模型上，关键词生成会与搭配建议争抢准入名额，反而拖慢搭配建议"""
+        if not (self.early_search.enabled and self.jd_tool):
+            return False
+        return self.router.model_for("keywords") is not self.router.model_for("advice")
+
+    def _start_early_search(
+        self,
+        image_analysis: str,
+        sink: List[GenerationMetrics],
+        budget: RequestBudget
+    ) -> Optional[Future]:
+        """在后台开始生成关键词和搜索商品，与搭配建议并行；未启用时返回None"""
+        if not self._early_search_enabled():
+            return None
+        return _early_executor.submit(bind_context(self._early_search), image_analysis, sink, budget.total_deadline)
+
+    def _astart_early_search(
+        self,
+        image_analysis: str,
+        sink: List[GenerationMetrics],
+        budget: RequestBudget
+    ) -> Optional[asyncio.Task]:
+        """异步版本的 _start_early_search"""
+        if not self._early_search_enabled():
+            return None
+        return asyncio.create_task(self._aearly_search(image_analysis, sink, budget.total_deadline))
+
+    def _finish_early_search(
+        self,
+        early: Optional[Future],
+        budget: RequestBudget
+    ) -> Optional[Tuple[List[str], Dict[str, Any]]]:
+        """等待提前开始的搜索，最多等到商品搜索阶段的时限
+
+        返回 (关键词, 商品结果)；未启用或没有生成出关键词时返回None，由调用方按搭配建议中的关键词搜索。
+        """
+        if early is None:
+            return None
+        try:
+            return early.result(budget.begin("jd"))
+        except FuturesTimeoutError:
+            print("提前开始的商品搜索超过时限")
+            return [], {"goods": [], "total": 0, "timed_out": True}
+        except Exception as e:
+            print(f"提前搜索商品时出错: {str(e)}")
+            return None
+
+    async def _afinish_early_search(
+        self,
+        early: Optional[asyncio.Task],
+        budget: RequestBudget
+    ) -> Optional[Tuple[List[str], Dict[str, Any]]]:
+        """异步版本的 _finish_early_search"""
+        if early is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.shield(early), budget.begin("jd"))
+        except asyncio.TimeoutError:
+            print("提前开始的商品搜索超过时限")
+            return [], {"goods": [], "total": 0, "timed_out": True}
+        except Exception as e:
+            print(f"提前搜索商品时出错: {str(e)}")
+            return None
+
+    def _record_prompt(self, prompt: RenderedPrompt, records: List[GenerationMetrics]):
+        """记录本次调用实际处理的提示词token数（命中缓存的调用没有指标，不计入）"""
+        if records:
+            prompt_registry.record(prompt, records[-1].prompt_eval_count)
+
+    def get_prompt_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各提示词的版本、系统前缀token估算和前缀缓存节省的token"""
+        return prompt_registry.stats()
+
+    def _recommend_for_analysis(self, analysis: str, keywords: Optional[List[str]] = None) -> Dict[str, Any]:
+        """获取商品推荐，未提供结构化输出的关键词时从文本回答中提取"""
+        keywords = ",".join(keywords) if keywords is not None else self._extract_keywords(analysis)
+        result = {}
+
+        # 如果有关键词且京东工具可用，则获取商品推荐
+        if keywords and self.jd_tool:
+            try:
+                # 使用提取的关键词搜索商品
+                jd_results = self.single_flight.do(
+                    ("jd_query", keywords),
+                    lambda: search_keyword(self.jd_tool.run, keywords, 5)  # 获取5条商品信息
+                )
+
+                # 将商品信息添加到结果中
+                result["recommendations"] = jd_results
+                print(f"成功获取关键词'{keywords}'的商品推荐")
+            except Exception as e:
+                print(f"获取商品推荐时出错: {str(e)}")
+                result["recommendation_error"] = str(e)
+
+        return result
+
+    async def _arecommend_for_analysis(self, analysis: str, keywords: Optional[List[str]] = None) -> Dict[str, Any]:
+        """异步版本的 _recommend_for_analysis"""
+        keywords = ",".join(keywords) if keywords is not None else self._extract_keywords(analysis)
+        result = {}
+
+        if keywords and self.jd_tool:
+            try:
+                jd_results = await self.single_flight.ado(
+                    ("jd_query", keywords),
+                    lambda: asearch_keyword(self.jd_tool.arun, keywords, 5)
+                )
+
+                result["recommendations"] = jd_results
+                print(f"成功获取关键词'{keywords}'的商品推荐")
+            except Exception as e:
+                print(f"获取商品推荐时出错: {str(e)}")
+                result["recommendation_error"] = str(e)
+
+        return result
+
+    def _extract_keywords(self, analysis: str) -> str:
+        """从文本回答中提取搜索关键词段落"""
+        keywords = ""
+        if "搜索关键词" in analysis and "keywords:" in analysis:
+            keyword_section = analysis.split("## 搜索关键词")[1].strip()
+            keywords = keyword_section.split("keywords:")[
+                1].strip() if ":" in keyword_section else keyword_section.strip()
+
+        return keywords
+
+    def _extract_search_terms(self, text_response: str) -> List[str]:
+        """从自由文本的搭配建议中提取商品搜索关键词（流式生成或结构化输出解析失败时使用）
+
+        逗号、顿号、分号都视为分隔符；没有关键词时返回空列表，
+        只用 _search_products 的通用关键词搜索一次，不再额外搜索泛泛的默认词。
+        """
+        return normalize_keywords(split_keywords(self._extract_keywords(text_response)))
+
+    def _search_products(self, search_terms: List[str], deadline: Optional[float] = None) -> Dict[str, Any]:
+        """并发搜索多个关键词，按关键词顺序汇总去重后的商品
+
+        Args:
+            search_terms: 搜索关键词
+            deadline: 截止时间（time.monotonic()），到达后返回已获得的商品并标记 timed_out
+        """
+        product_suggestions = {}
+        if self.jd_tool:
+            with span("jd.search") as current:
                 try:
-                    # 遍历多个关键词搜索商品，提高搜索成功率
-                    all_goods = []
-                    successful_keywords = []
-                    
-                    search_keywords = search_terms + ["衣服"] if search_terms else ["衣服"]
-                    
-                    for keyword in search_keywords:
-                        try:
-                            print(f"尝试搜索关键词: {keyword}")
-                            jd_results = self.jd_tool.run({
-                                "keyword": keyword.strip(),
-                                "page_size": 5  
-                            })
-                            
-                            # 检查是否有商品结果
-                            if jd_results and "goods" in jd_results and jd_results["goods"]:
-                                all_goods.extend(jd_results["goods"])
-                                successful_keywords.append(keyword)
-                                print(f"关键词'{keyword}'搜索成功，获得{len(jd_results['goods'])}个商品")
-                                
-                                # 如果已经有足够的商品，可以提前结束
-                                if len(all_goods) >= 10:  # 目标获取6个商品
-                                    break
-                            else:
-                                print(f"关键词'{keyword}'未找到商品")
-                                
-                        except Exception as keyword_error:
-                            print(f"关键词'{keyword}'搜索出错: {str(keyword_error)}")
-                            continue
-                    
-                    # 组装最终结果
-                    if all_goods:
-                        # 去重并限制数量
-                        unique_goods = []
-                        seen_names = set()
-                        for good in all_goods:
-                            name = good.get("name", "")
-                            if name not in seen_names:
-                                unique_goods.append(good)
-                                seen_names.add(name)
-                                if len(unique_goods) >= 6:  # 最多6个商品
-                                    break
-                        
-                        product_suggestions = {
-                            "goods": unique_goods,
-                            "total": len(unique_goods),
-                            "successful_keywords": successful_keywords,
-                            "search_info": f"成功搜索关键词: {', '.join(successful_keywords)}"
-                        }
-                        print(f"总共获取{len(unique_goods)}个去重商品，使用关键词: {', '.join(successful_keywords)}")
-                    else:
-                        product_suggestions = {
-                            "goods": [],
-                            "total": 0,
-                            "error": "所有关键词都未找到相关商品"
-                        }
-                        print("所有关键词搜索都失败")
-                        
+                    keywords = search_keywords_list(search_terms, self.product_search)
+                    current.set(keywords=len(keywords))
+                    outcome = self.single_flight.do(
+                        ("jd_search", tuple(keywords)),
+                        lambda: search_products(self.jd_tool.run, keywords, self.product_search, deadline),
+                        None if deadline is None else max(0.0, deadline - time.monotonic())
+                    )
+                    product_suggestions = self._assemble_products(outcome.goods, outcome.successful_keywords)
+                    if outcome.timed_out:
+                        product_suggestions["timed_out"] = True
+                except FuturesTimeoutError:
+                    print("等待相同关键词的商品搜索超过时限")
+                    product_suggestions = {"goods": [], "total": 0, "timed_out": True}
                 except Exception as e:
                     print(f"商品搜索过程出错: {str(e)}")
                     product_suggestions = {"error": str(e)}
+                current.set(goods=len(product_suggestions.get("goods", [])), timed_out=product_suggestions.get("timed_out"))
 
-            # 5. 组合结果
-            result = {
-                "image_analysis": image_analysis,
-                "recommendations": text_response.split("## 搭配建议")[1].split("## 搜索关键词")[
-                    0].strip() if "## 搭配建议" in text_response else text_response,
-                "search_terms": search_terms,
-                "product_suggestions": product_suggestions
+        return product_suggestions
+
+    async def _asearch_products(self, search_terms: List[str], deadline: Optional[float] = None) -> Dict[str, Any]:
+        """异步版本的 _search_products"""
+        product_suggestions = {}
+        if self.jd_tool:
+            with span("jd.search") as current:
+                try:
+                    keywords = search_keywords_list(search_terms, self.product_search)
+                    current.set(keywords=len(keywords))
+                    search = self.single_flight.ado(
+                        ("jd_search", tuple(keywords)),
+                        lambda: asearch_products(self.jd_tool.arun, keywords, self.product_search, deadline)
+                    )
+                    if deadline is not None:
+                        search = asyncio.wait_for(search, max(0.0, deadline - time.monotonic()))
+                    outcome = await search
+                    product_suggestions = self._assemble_products(outcome.goods, outcome.successful_keywords)
+                    if outcome.timed_out:
+                        product_suggestions["timed_out"] = True
+                except asyncio.TimeoutError:
+                    print("等待相同关键词的商品搜索超过时限")
+                    product_suggestions = {"goods": [], "total": 0, "timed_out": True}
+                except Exception as e:
+                    print(f"商品搜索过程出错: {str(e)}")
+                    product_suggestions = {"error": str(e)}
+                current.set(goods=len(product_suggestions.get("goods", [])), timed_out=product_suggestions.get("timed_out"))
+
+        return product_suggestions
+
+    def _assemble_products(self, all_goods: List[Dict[str, Any]], successful_keywords: List[str]) -> Dict[str, Any]:
+        """组装最终商品结果：去重并限制数量"""
+        if all_goods:
+            # 去重并限制数量
+            unique_goods = []
+            seen_names = set()
+            for good in all_goods:
+                name = good.get("name", "")
+                if name not in seen_names:
+                    unique_goods.append(good)
+                    seen_names.add(name)
+                    if len(unique_goods) >= 6:  # 最多6个商品
+                        break
+            
+            product_suggestions = {
+                "goods": unique_goods,
+                "total": len(unique_goods),
+                "successful_keywords": successful_keywords,
+                "search_info": f"成功搜索关键词: {', '.join(successful_keywords)}"
+            }
+            print(f"总共获取{len(unique_goods)}个去重商品，使用关键词: {', '.join(successful_keywords)}")
+        else:
+            product_suggestions = {
+                "goods": [],
+                "total": 0,
+                "error": "所有关键词都未找到相关商品"
             }
+            print("所有关键词搜索都失败")
+
+        return product_suggestions
+
+    def _build_image_result(
+        self,
+        image_analysis: str,
+        text_response: str,
+        budget: Optional[RequestBudget] = None,
+        search_terms: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """搜索商品并组合图片分析结果，未提供结构化输出的关键词时从搭配建议中提取"""
+        if search_terms is None:
+            search_terms = self._extract_search_terms(text_response)
+        deadline = None
+        if budget is not None:
+            budget.begin("jd")
+            deadline = budget.stage_deadline
+        product_suggestions = self._search_products(search_terms, deadline)
+
+        return self._compose_image_result(image_analysis, text_response, search_terms, product_suggestions)
+
+    async def _abuild_image_result(
+        self,
+        image_analysis: str,
+        text_response: str,
+        budget: Optional[RequestBudget] = None,
+        search_terms: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """异步版本的 _build_image_result"""
+        if search_terms is None:
+            search_terms = self._extract_search_terms(text_response)
+        deadline = None
+        if budget is not None:
+            budget.begin("jd")
+            deadline = budget.stage_deadline
+        product_suggestions = await self._asearch_products(search_terms, deadline)
+
+        return self._compose_image_result(image_analysis, text_response, search_terms, product_suggestions)
+
+    def _compose_image_result(
+        self,
+        image_analysis: str,
+        text_response: str,
+        search_terms: List[str],
+        product_suggestions: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """组合图片分析的最终结果"""
+
+        result = {
+            "image_analysis": image_analysis,
+            "recommendations": self._extract_advice(text_response),
+            "search_terms": search_terms,
+            "product_suggestions": product_suggestions
+        }
+
+        return result
+
+    def _extract_advice(self, text_response: str) -> str:
+        """截取搭配建议部分，去掉搜索关键词段落（对流式生成中的部分文本同样适用）"""
+        if "## 搭配建议" in text_response:
+            return text_response.split("## 搭配建议")[1].split("## 搜索关键词")[0].strip()
+        return text_response
+
 
-            return result
-        except Exception as e:
-            return {"error": f"分析过程中出错: {str(e)}"}
 # 测试代码
 if __name__ == "__main__":
     os.chdir("..")  # 切换到项目根目录，确保配置文件路径正确
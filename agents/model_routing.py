@@ -0,0 +1,115 @@
+"""
+按任务选择文本模型
+关键词提取、分类等短任务交给小模型（models/qwen/modelfile 构建的 Qwen2.5-1.5B），长篇建议使用大模型，
+两者在Ollama中是不同的模型实例，准入名额也分开，短任务不必排在长篇生成后面。
+每个任务可以单独限制生成长度，并按任务统计所用模型和端到端耗时（包括排队）
+"""
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+from pydantic import BaseModel, Field
+from models.generation_metrics import GenerationMetrics
+
+
+class TaskRoute(BaseModel):
+    """一个任务的模型和生成长度"""
+
+    model: str = Field("large", description="large: models.text；small: models.text_small（未配置时退回 large）")
+    num_predict: Optional[int] = Field(None, description="最大生成token数，为空时使用该任务原有的默认值")
+
+
+def _default_routes() -> Dict[str, TaskRoute]:
+    return {
+        "keywords": TaskRoute(model="small", num_predict=96),
+        "text_query": TaskRoute(model="large"),
+        "advice": TaskRoute(model="large"),
+        "chat": TaskRoute(model="large")
+    }
+
+
+class RoutingSettings(BaseModel):
+    """任务路由配置，对应 config.yaml 中的 routing"""
+
+    tasks: Dict[str, TaskRoute] = Field(default_factory=_default_routes, description="任务名到模型和生成长度的映射")
+    default: TaskRoute = Field(default_factory=TaskRoute, description="未配置的任务使用的路由")
+
+
+class TaskRouter:
+    """按任务名选择文本模型，并统计每个任务的调用（线程安全）"""
+
+    def __init__(self, settings: RoutingSettings, resolve: Callable[[str], Any]):
+        """
+        Args:
+            settings: 路由配置
+            resolve: 按档位（large / small）返回文本模型，小模型不可用时应返回大模型
+        """
+        self.settings = settings
+        self._resolve = resolve
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    def route(self, task: str) -> TaskRoute:
+        return self.settings.tasks.get(task, self.settings.default)
+
+    def model_for(self, task: str) -> Any:
+        """任务使用的文本模型"""
+        return self._resolve(self.route(task).model)
+
+    def num_predict(self, task: str, default: Optional[int] = None) -> Optional[int]:
+        """任务的最大生成token数，路由中未配置时返回 default"""
+        return self.route(task).num_predict or default
+
+    @contextmanager
+    def timed(self, task: str, model_name: str, sink: Optional[List[GenerationMetrics]] = None) -> Iterator[None]:
+        """记录一次调用的端到端耗时；sink 中有本次生成的指标时一并记录解码token数"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(task, model_name, time.monotonic() - start, sink[-1] if sink else None)
+
+    def record(self, task: str, model_name: str, seconds: float, metrics: Optional[GenerationMetrics] = None):
+        with self._lock:
+            stats = self._stats.setdefault(task, {
+                "calls": 0,
+                "models": {},
+                "total_seconds": 0.0,
+                "eval_count": 0,
+                "eval_seconds": 0.0
+            })
+            stats["calls"] += 1
+            stats["models"][model_name] = stats["models"].get(model_name, 0) + 1
+            stats["total_seconds"] += seconds
+            if metrics is not None:
+                stats["eval_count"] += metrics.eval_count
+                stats["eval_seconds"] += metrics.eval_seconds
+            self._latencies.setdefault(task, deque(maxlen=1000)).append(seconds)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """每个任务的路由配置、各模型调用次数、端到端耗时分位数（最近1000次）和解码速度"""
+        with self._lock:
+            snapshot = {task: {**stats, "models": dict(stats["models"])} for task, stats in self._stats.items()}
+            latencies = {task: sorted(values) for task, values in self._latencies.items()}
+
+        result = {}
+        for task in dict.fromkeys([*self.settings.tasks, *snapshot]):
+            route = self.route(task)
+            stats = snapshot.get(task, {"calls": 0, "models": {}, "total_seconds": 0.0, "eval_count": 0, "eval_seconds": 0.0})
+            samples = latencies.get(task, [])
+
+            def percentile(p: float) -> float:
+                return samples[min(len(samples) - 1, int(p * len(samples)))] if samples else 0.0
+
+            result[task] = {
+                "route": route.model,
+                "num_predict": route.num_predict,
+                **stats,
+                "avg_seconds": stats["total_seconds"] / stats["calls"] if stats["calls"] else 0.0,
+                "p50_seconds": percentile(0.50),
+                "p95_seconds": percentile(0.95),
+                "eval_tokens_per_second": stats["eval_count"] / stats["eval_seconds"] if stats["eval_seconds"] else 0.0
+            }
+        return result
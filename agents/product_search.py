@@ -0,0 +1,214 @@
+"""
+商品搜索并发模块
+多个关键词的京东搜索并发执行（有并发上限和单个关键词的超时），
+按关键词顺序汇总结果，前几个关键词已凑够目标数量时取消其余搜索，结果与逐个搜索时一致。
+每个关键词的搜索记录为一个链路追踪span（jd.keyword）
+"""
+import json
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Any, Callable, Awaitable, Deque, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from models.tracing import bind_context, span
+
+# 同步搜索在线程中执行，超时的请求不再等待
+_search_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="jd-search")
+
+
+class ProductSearchSettings(BaseModel):
+    """商品搜索配置，对应 config.yaml 中的 product_search"""
+
+    fan_out: int = Field(4, description="同时进行的关键词搜索数")
+    keyword_timeout: float = Field(8.0, description="单个关键词的搜索时限（秒），超时视为未找到")
+    target_goods: int = Field(10, description="按关键词顺序累计到该数量后停止搜索")
+    page_size: int = Field(5, description="每个关键词获取的商品数")
+    fallback_keyword: str = Field("衣服", description="追加在最后的通用关键词，为空时不追加")
+
+
+class SearchOutcome(BaseModel):
+    """按关键词顺序汇总的搜索结果"""
+
+    goods: List[Dict[str, Any]] = Field(default_factory=list)
+    successful_keywords: List[str] = Field(default_factory=list)
+    timed_out: bool = Field(False, description="是否因整个阶段的截止时间而提前结束")
+
+
+def search_keywords_list(keywords: List[str], settings: ProductSearchSettings) -> List[str]:
+    """去掉空关键词并追加通用关键词"""
+    result = [keyword.strip() for keyword in keywords if keyword and keyword.strip()]
+    if settings.fallback_keyword and settings.fallback_keyword not in result:
+        result.append(settings.fallback_keyword)
+    return result
+
+
+def _wait_seconds(started: float, settings: ProductSearchSettings, deadline: Optional[float]) -> Tuple[float, bool]:
+    """返回 (本关键词还可以等待的秒数, 限制来自阶段截止时间)"""
+    now = time.monotonic()
+    wait = started + settings.keyword_timeout - now
+    if deadline is not None and deadline - now <= wait:
+        return max(0.0, deadline - now), True
+    return max(0.0, wait), False
+
+
+def _result_attributes(result: Any) -> Dict[str, Any]:
+    """链路追踪中记录的商品数和响应大小"""
+    if not isinstance(result, dict):
+        return {"goods": 0}
+    return {
+        "goods": len(result.get("goods") or []),
+        "response_bytes": len(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8"))
+    }
+
+
+def _search_input(keyword: str, page_size: int, timeout: Optional[float]) -> Dict[str, Any]:
+    tool_input = {"keyword": keyword, "page_size": page_size}
+    if timeout is not None:
+        tool_input["timeout"] = timeout
+    return tool_input
+
+
+def search_keyword(
+    run: Callable[[Dict[str, Any]], Dict[str, Any]],
+    keyword: str,
+    page_size: int,
+    timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """搜索一个关键词，记录为 jd.keyword span
+
+    timeout 为请求的读取超时：线程池中已开始的请求无法取消，超过关键词时限后应尽快结束，不长期占用线程
+    """
+    with span("jd.keyword", keyword=keyword, page_size=page_size) as current:
+        result = run(_search_input(keyword, page_size, timeout))
+        current.set(**_result_attributes(result))
+    return result
+
+
+async def asearch_keyword(
+    arun: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+    keyword: str,
+    page_size: int,
+    timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """异步版本的 search_keyword"""
+    with span("jd.keyword", keyword=keyword, page_size=page_size) as current:
+        result = await arun(_search_input(keyword, page_size, timeout))
+        current.set(**_result_attributes(result))
+    return result
+
+
+def _collect(outcome: SearchOutcome, keyword: str, result: Any, settings: ProductSearchSettings) -> bool:
+    """记录一个关键词的结果，返回是否已凑够目标数量"""
+    if result and result.get("goods"):
+        outcome.goods.extend(result["goods"])
+        outcome.successful_keywords.append(keyword)
+        print(f"关键词'{keyword}'搜索成功，获得{len(result['goods'])}个商品")
+    else:
+        print(f"关键词'{keyword}'未找到商品")
+    return len(outcome.goods) >= settings.target_goods
+
+
+def search_products(
+    run: Callable[[Dict[str, Any]], Dict[str, Any]],
+    keywords: List[str],
+    settings: ProductSearchSettings,
+    deadline: Optional[float] = None
+) -> SearchOutcome:
+    """并发搜索多个关键词
+
+    最多 fan_out 个搜索同时进行；按关键词顺序依次取结果，
+    凑够 target_goods 后取消尚未开始的搜索（已发出的请求结果被丢弃）。
+
+    Args:
+        run: 同步搜索函数（如 jd_tool.run），参数为 {"keyword", "page_size"}
+        keywords: 按优先级排列的关键词
+        settings: 搜索配置
+        deadline: 整个阶段的截止时间（time.monotonic()）
+    """
+    outcome = SearchOutcome()
+    pending = deque(keywords)
+    window: Deque[Tuple[str, Any, float]] = deque()
+
+    def fill():
+        while pending and len(window) < settings.fan_out:
+            keyword = pending.popleft()
+            print(f"尝试搜索关键词: {keyword}")
+            future = _search_executor.submit(
+                bind_context(search_keyword), run, keyword, settings.page_size, settings.keyword_timeout
+            )
+            window.append((keyword, future, time.monotonic()))
+
+    fill()
+    try:
+        while window:
+            keyword, future, started = window.popleft()
+            wait, stage_limit = _wait_seconds(started, settings, deadline)
+            try:
+                result = future.result(wait)
+            except FuturesTimeoutError:
+                future.cancel()
+                if stage_limit:
+                    print(f"商品搜索超过时限，停止在关键词'{keyword}'")
+                    outcome.timed_out = True
+                    break
+                print(f"关键词'{keyword}'搜索超过 {settings.keyword_timeout:g} 秒，跳过")
+                fill()
+                continue
+            except Exception as e:
+                print(f"关键词'{keyword}'搜索出错: {str(e)}")
+                fill()
+                continue
+            if _collect(outcome, keyword, result, settings):
+                break
+            fill()
+    finally:
+        for _, future, _ in window:
+            future.cancel()
+    return outcome
+
+
+async def asearch_products(
+    arun: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+    keywords: List[str],
+    settings: ProductSearchSettings,
+    deadline: Optional[float] = None
+) -> SearchOutcome:
+    """异步版本的 search_products，凑够数量或超时后取消仍在进行的请求"""
+    outcome = SearchOutcome()
+    pending = deque(keywords)
+    window: Deque[Tuple[str, asyncio.Task, float]] = deque()
+
+    def fill():
+        while pending and len(window) < settings.fan_out:
+            keyword = pending.popleft()
+            print(f"尝试搜索关键词: {keyword}")
+            task = asyncio.ensure_future(asearch_keyword(arun, keyword, settings.page_size, settings.keyword_timeout))
+            window.append((keyword, task, time.monotonic()))
+
+    fill()
+    try:
+        while window:
+            keyword, task, started = window.popleft()
+            wait, stage_limit = _wait_seconds(started, settings, deadline)
+            try:
+                result = await asyncio.wait_for(task, wait)
+            except asyncio.TimeoutError:
+                if stage_limit:
+                    print(f"商品搜索超过时限，停止在关键词'{keyword}'")
+                    outcome.timed_out = True
+                    break
+                print(f"关键词'{keyword}'搜索超过 {settings.keyword_timeout:g} 秒，跳过")
+                fill()
+                continue
+            except Exception as e:
+                print(f"关键词'{keyword}'搜索出错: {str(e)}")
+                fill()
+                continue
+            if _collect(outcome, keyword, result, settings):
+                break
+            fill()
+    finally:
+        for _, task, _ in window:
+            task.cancel()
+    return outcome
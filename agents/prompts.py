@@ -0,0 +1,223 @@
+"""
+提示词注册表
+每个提示词拆分为固定的系统前缀和随请求变化的用户后缀：系统前缀通过 system 字段发送，
+所有请求完全相同，Ollama（llama.cpp）可以复用已缓存的前缀，只需处理后缀。
+提示词带有版本号和token估算，并按提示词统计实际处理的提示词token，便于发现提示词变长等回退
+"""
+import re
+import threading
+from typing import Dict, Optional, Any
+from pydantic import BaseModel, Field
+
+_CJK = re.compile(r"[　-〿一-鿿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文字符和全角标点每个约1个token，其余字符约4个一个token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class RenderedPrompt(BaseModel):
+    """填入变量后的提示词"""
+
+    name: str
+    version: int
+    system: str
+    prompt: str
+
+    @property
+    def estimated_tokens(self) -> int:
+        return estimate_tokens(self.system) + estimate_tokens(self.prompt)
+
+
+class PromptTemplate(BaseModel):
+    """提示词模板，修改 system 或 user_template 时需要提高 version"""
+
+    name: str = Field(..., description="提示词名称")
+    version: int = Field(1, description="版本号")
+    system: str = Field(..., description="固定的系统前缀，不能包含任何随请求变化的内容")
+    user_template: str = Field("{input}", description="用户后缀模板，使用 str.format 填入变量")
+
+    @property
+    def system_tokens(self) -> int:
+        return estimate_tokens(self.system)
+
+    def render(self, **values) -> RenderedPrompt:
+        return RenderedPrompt(
+            name=self.name,
+            version=self.version,
+            system=self.system,
+            prompt=self.user_template.format(**values)
+        )
+
+
+class PromptRegistry:
+    """按名称管理提示词模板，并统计每个提示词的提示词处理量（线程安全）"""
+
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._lock = threading.Lock()
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    def register(self, template: PromptTemplate) -> PromptTemplate:
+        self._templates[template.name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def render(self, name: str, **values) -> RenderedPrompt:
+        return self.get(name).render(**values)
+
+    def record(self, rendered: RenderedPrompt, prompt_eval_count: Optional[int]):
+        """记录一次调用实际处理的提示词token数
+
+        Ollama的 prompt_eval_count 不包含命中前缀缓存的token，
+        与估算的提示词总长度相减即为复用缓存节省的token（估算值）。
+        """
+        if prompt_eval_count is None:
+            return
+        key = f"{rendered.name}@v{rendered.version}"
+        with self._lock:
+            usage = self._usage.setdefault(key, {
+                "calls": 0,
+                "estimated_tokens": 0,
+                "evaluated_tokens": 0,
+                "saved_tokens": 0
+            })
+            usage["calls"] += 1
+            usage["estimated_tokens"] += rendered.estimated_tokens
+            usage["evaluated_tokens"] += prompt_eval_count
+            usage["saved_tokens"] += max(0, rendered.estimated_tokens - prompt_eval_count)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """每个提示词的版本、系统前缀token估算和累计处理量"""
+        with self._lock:
+            usage = {key: dict(values) for key, values in self._usage.items()}
+        result = {}
+        for name, template in self._templates.items():
+            key = f"{name}@v{template.version}"
+            result[name] = {
+                "version": template.version,
+                "system_tokens": template.system_tokens,
+                **usage.get(key, {})
+            }
+        return result
+
+
+prompt_registry = PromptRegistry()
+
+prompt_registry.register(PromptTemplate(
+    name="text_query",
+    version=2,
+    system="""你是一位专业的时尚搭配顾问，具有丰富的服装搭配经验和对时尚趋势的深度理解。请分析用户关于时尚搭配的问题，并提供专业、实用的建议。
+
+请按照以下格式详细回复：
+
+## 时尚分析
+### 风格定位
+[分析用户需求的风格定位，如商务、休闲、约会、运动等]
+
+### 搭配建议
+[详细的搭配建议，包括：
+- 颜色搭配原则和推荐色彩
+- 款式选择和版型建议
+- 材质和面料推荐
+- 配饰搭配技巧]
+
+### 场合适应性
+[分析适合的穿着场合和季节特点]
+
+### 流行趋势
+[结合当前时尚趋势给出建议]
+
+## 搜索关键词
+keywords: [为商品搜索提供3-5个精准的关键词，用逗号分隔。关键词应该具体、实用，便于搜索到相关商品，如"春季外套,休闲西装,轻薄针织衫"]
+
+请确保建议专业、实用，关键词精准有效。""",
+    user_template="用户问题：{query}"
+))
+
+prompt_registry.register(PromptTemplate(
+    name="advice",
+    version=2,
+    system="""你是一位专业的时尚搭配顾问和服装分析师。请根据用户提供的图片服装分析，提供专业的搭配建议和商品搜索关键词。
+
+请按照以下格式提供专业建议：
+
+## 搭配建议
+### 现有单品分析
+[分析图片中已有服装的优点和特色]
+
+### 搭配补充建议
+[建议如何搭配其他单品来完善整体造型：
+- 上下装搭配建议
+- 颜色协调方案
+- 配饰推荐（鞋子、包包、饰品等）
+- 外套或内搭建议]
+
+### 风格提升
+[如何通过搭配提升整体风格和时尚度]
+
+### 场合适配
+[分析适合的穿着场合和如何调整搭配适应不同场合]
+
+## 搜索关键词
+keywords: [基于图片分析和搭配建议，提供5-8个精准的商品搜索关键词，用逗号分隔。包括具体的服装类型、颜色、风格等，如"白色衬衫,高腰牛仔裤,休闲外套,棕色皮鞋,简约手表"]
+
+请确保搭配建议实用可行，搜索关键词精准有效。""",
+    user_template="## 图片分析结果\n{image_analysis}"
+))
+
+prompt_registry.register(PromptTemplate(
+    name="chat",
+    version=1,
+    system="""你是一位专业的时尚搭配顾问，具有丰富的服装搭配经验和对时尚趋势的深度理解。
+请结合之前的对话，针对用户的问题给出专业、实用、简洁的搭配建议，包括颜色、款式、材质和配饰。
+
+如果回答中推荐了具体的服装或配饰，请在回答最后另起一段，按以下格式给出商品搜索关键词：
+
+## 搜索关键词
+keywords: [3-5个精准的关键词，用逗号分隔，如"春季外套,休闲西装,轻薄针织衫"]
+""",
+    user_template="{message}"
+))
+
+prompt_registry.register(PromptTemplate(
+    name="text_query_json",
+    version=1,
+    system="""你是一位专业的时尚搭配顾问，具有丰富的服装搭配经验和对时尚趋势的深度理解。请分析用户关于时尚搭配的问题，并提供专业、实用的建议。
+
+请只输出一个JSON对象，包含以下字段：
+- style: 风格定位，分析用户需求的风格，如商务、休闲、约会、运动等
+- advice: 详细的搭配建议，包括颜色搭配、款式版型、材质面料和配饰技巧
+- occasions: 适合的穿着场合和季节特点
+- trends: 结合当前时尚趋势的建议
+- keywords: 3-5个精准的商品搜索关键词组成的数组，每个元素是一个具体的单品，如["春季外套", "休闲西装", "轻薄针织衫"]""",
+    user_template="用户问题：{query}"
+))
+
+prompt_registry.register(PromptTemplate(
+    name="advice_json",
+    version=1,
+    system="""你是一位专业的时尚搭配顾问和服装分析师。请根据用户提供的图片服装分析，提供专业的搭配建议和商品搜索关键词。
+
+请只输出一个JSON对象，包含以下字段：
+- items: 现有单品分析，图片中已有服装的优点和特色
+- advice: 搭配补充建议，包括上下装搭配、颜色协调、配饰（鞋子、包包、饰品等）、外套或内搭
+- style: 如何通过搭配提升整体风格和时尚度
+- occasions: 适合的穿着场合以及如何调整搭配适应不同场合
+- keywords: 5-8个精准的商品搜索关键词组成的数组，包括具体的服装类型、颜色、风格，如["白色衬衫", "高腰牛仔裤", "棕色皮鞋"]""",
+    user_template="## 图片分析结果\n{image_analysis}"
+))
+
+prompt_registry.register(PromptTemplate(
+    name="keywords_json",
+    version=1,
+    system="""你是一位时尚搭配顾问。请根据用户提供的图片服装分析，给出适合与之搭配、值得购买的单品。
+
+请只输出一个JSON对象：
+- keywords: 5-8个精准的商品搜索关键词组成的数组，包括具体的服装类型、颜色、风格，如["白色衬衫", "高腰牛仔裤", "棕色皮鞋"]""",
+    user_template="## 图片分析结果\n{image_analysis}"
+))
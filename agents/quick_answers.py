@@ -0,0 +1,194 @@
+"""
+热门问题预计算模块
+启动时和定时在后台为界面上的热门问题生成回答和商品推荐，点击时直接返回，不再调用模型和京东接口。
+商品（价格、优惠券）按较短的周期刷新；文本模型或提示词版本变化时重新生成回答
+"""
+import copy
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from pydantic import BaseModel, Field
+from models.tracing import span
+from agents.single_flight import normalize_key
+
+DEFAULT_QUESTIONS = [
+    "春季流行什么颜色和款式？",
+    "职场正装如何搭配？",
+    "约会穿什么比较合适？",
+    "休闲装怎么穿出时尚感？",
+    "如何根据体型选择服装？",
+    "秋冬外套推荐"
+]
+
+
+class QuickAnswerSettings(BaseModel):
+    """热门问题预计算配置，对应 config.yaml 中的 quick_answers"""
+
+    enabled: bool = Field(True, description="是否在后台预计算热门问题")
+    questions: List[str] = Field(default_factory=lambda: list(DEFAULT_QUESTIONS), description="界面上展示并预计算的热门问题")
+    product_refresh_seconds: float = Field(1800.0, description="重新搜索商品的间隔（京东价格和优惠券变化较快）")
+    answer_refresh_seconds: float = Field(86400.0, description="重新生成回答的间隔，模型或提示词版本变化时立即重新生成")
+    check_interval: float = Field(60.0, description="后台检查间隔（秒）")
+
+
+class QuickAnswer:
+    """一个热门问题的预计算结果"""
+
+    def __init__(self, question: str, result: Dict[str, Any], version: str):
+        self.question = question
+        self.result = result
+        self.version = version
+        now = time.time()
+        self.answered_at = now
+        self.products_at = now
+
+
+def _product_error(result: Dict[str, Any]) -> Optional[str]:
+    """商品搜索的出错信息：搜索抛出异常（recommendation_error），或京东工具返回 {"error": ...}"""
+    return result.get("recommendation_error") or (result.get("recommendations") or {}).get("error")
+
+
+class QuickAnswerStore:
+    """热门问题的预计算结果和后台刷新线程
+
+    - 回答: 不存在、版本（文本模型和提示词版本）变化或超过 answer_refresh_seconds 时重新生成
+    - 商品: 超过 product_refresh_seconds 时只按回答中的关键词重新搜索
+    生成或搜索失败时保留旧的结果，下一轮再试。
+    """
+
+    def __init__(
+        self,
+        settings: QuickAnswerSettings,
+        answer: Callable[[str], Dict[str, Any]],
+        search: Callable[[str], Dict[str, Any]],
+        version: Callable[[], str]
+    ):
+        """
+        Args:
+            settings: 预计算配置
+            answer: 生成回答和商品推荐，返回与 process_text_query 一致的结果
+            search: 根据回答文本重新搜索商品，返回需要更新到结果中的字段
+            version: 当前文本模型和提示词的版本标识
+        """
+        self.settings = settings
+        self._answer = answer
+        self._search = search
+        self._version = version
+        self._entries: Dict[str, QuickAnswer] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"hits": 0, "answers": 0, "product_refreshes": 0, "failures": 0}
+
+    @property
+    def questions(self) -> List[str]:
+        return self.settings.questions
+
+    def start(self):
+        """启动后台线程，启动后立即计算一轮"""
+        if not self.settings.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="quick-answers", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.settings.check_interval)
+
+    def _run(self):
+        self.refresh_once()
+        while not self._stop.wait(self.settings.check_interval):
+            self.refresh_once()
+
+    def refresh_once(self):
+        """检查一次所有热门问题，按需重新生成回答或刷新商品"""
+        for question in self.settings.questions:
+            if self._stop.is_set():
+                return
+            key = normalize_key(question)
+            with self._lock:
+                entry = self._entries.get(key)
+            now = time.time()
+            try:
+                version = self._version()
+                if (
+                    entry is None
+                    or entry.version != version
+                    or now - entry.answered_at >= self.settings.answer_refresh_seconds
+                ):
+                    with span("quick_answers.answer", question=question):
+                        self._refresh_answer(key, question, version)
+                elif now - entry.products_at >= self.settings.product_refresh_seconds:
+                    with span("quick_answers.products", question=question):
+                        self._refresh_products(entry)
+            except Exception as e:
+                self._stats["failures"] += 1
+                print(f"⚠️ 预计算热门问题'{question}'失败: {str(e)}")
+
+    def _refresh_answer(self, key: str, question: str, version: str):
+        started = time.monotonic()
+        result = self._answer(question)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        if result.get("analysis", "").startswith("模型调用失败"):
+            raise RuntimeError(result["analysis"])
+        result.pop("metrics", None)
+        result.pop("trace_id", None)
+        product_error = _product_error(result)
+        if product_error:
+            # 回答可用但商品搜索失败：不保存出错的商品结果，下一轮检查时重新搜索
+            result.pop("recommendation_error", None)
+            result.pop("recommendations", None)
+            print(f"⚠️ 热门问题'{question}'的商品搜索失败，稍后重试: {product_error}")
+        entry = QuickAnswer(question, result, version)
+        if product_error:
+            entry.products_at = 0.0
+        with self._lock:
+            self._entries[key] = entry
+        self._stats["answers"] += 1
+        print(f"✨ 已预计算热门问题'{question}' ({time.monotonic() - started:.1f}s)")
+
+    def _refresh_products(self, entry: QuickAnswer):
+        products = self._search(entry.result.get("analysis", ""))
+        # 搜索出错时保留上一次的商品快照
+        error = _product_error(products)
+        if error:
+            raise RuntimeError(error)
+        with self._lock:
+            entry.result = {**entry.result, **products}
+            entry.products_at = time.time()
+        self._stats["product_refreshes"] += 1
+
+    def get(self, question: str) -> Optional[Dict[str, Any]]:
+        """返回问题的预计算结果（副本，带 precomputed 标记）；没有或版本已过时时返回None"""
+        if not self.settings.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(normalize_key(question))
+        if entry is None:
+            return None
+        try:
+            if entry.version != self._version():
+                return None
+        except Exception:
+            return None
+        self._stats["hits"] += 1
+        result = copy.deepcopy(entry.result)
+        result["precomputed"] = True
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """命中次数、生成和刷新次数，以及每个问题回答和商品的更新时间"""
+        with self._lock:
+            entries = {
+                entry.question: {
+                    "version": entry.version,
+                    "answered_at": entry.answered_at,
+                    "products_at": entry.products_at
+                }
+                for entry in self._entries.values()
+            }
+        return {**self._stats, "entries": entries}
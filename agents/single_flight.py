@@ -0,0 +1,202 @@
+"""
+相同请求合并模块（single-flight）
+热门问题被很多用户同时点击时，相同的进行中请求（按归一化的问题或图片摘要识别）只调用一次模型，
+所有等待方共享同一个结果；流式输出由后台线程统一生成，每个等待方从头回放已生成的部分。
+只合并进行中的请求，已完成的结果由模型层的结果缓存负责
+"""
+import asyncio
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from models.tracing import annotate, bind_context
+
+
+class SingleFlightSettings(BaseModel):
+    """请求合并配置，对应 config.yaml 中的 single_flight"""
+
+    enabled: bool = Field(True, description="相同的进行中请求（文本、视觉、京东搜索）只执行一次并共享结果")
+
+
+def normalize_key(text: str) -> str:
+    """归一化请求文本：全角转半角、合并空白、忽略大小写，使只差空格或标点宽度的问题共享结果"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").split()).casefold()
+
+
+class _SharedStream:
+    """一次共享的流式生成：已产出的元素、结束标记和订阅者数量"""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """按键合并进行中的调用（线程安全）
+
+    - do: 同步调用，后到的调用方等待先到者的结果（或异常）
+    - ado: 异步调用，同一事件循环内共享同一个任务
+    - stream: 流式调用，生成在后台线程中进行，所有订阅者都能收到完整输出；
+      订阅者全部离开时停止生成
+    共享的结果被所有等待方共用，调用方不应修改。
+    """
+
+    def __init__(self, settings: Optional[SingleFlightSettings] = None):
+        self.settings = settings or SingleFlightSettings()
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple, Future] = {}
+        self._tasks: Dict[Tuple, asyncio.Task] = {}
+        self._streams: Dict[Tuple, _SharedStream] = {}
+        self._stats = {"executed": 0, "shared": 0}
+
+    def _count(self, shared: bool):
+        self._stats["shared" if shared else "executed"] += 1
+
+    def do(self, key: Optional[Tuple], fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """执行 fn 或等待相同键的进行中调用
+
+        Args:
+            key: 请求键，为None或未启用时直接执行
+            fn: 实际的调用
+            timeout: 等待其他调用方结果的最长秒数（自己执行时由 fn 自行控制时限）
+
+        Raises:
+            concurrent.futures.TimeoutError: 等待共享结果超时
+        """
+        if key is None or not self.settings.enabled:
+            return fn()
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            self._count(not leader)
+        if not leader:
+            annotate(shared=True)
+            return future.result(timeout)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def ado(self, key: Optional[Tuple], factory: Callable[[], Awaitable[Any]]) -> Any:
+        """异步版本的 do；某个等待方被取消（如超时）不会取消共享的任务"""
+        if key is None or not self.settings.enabled:
+            return await factory()
+        key = (id(asyncio.get_running_loop()),) + key
+        with self._lock:
+            task = self._tasks.get(key)
+            shared = task is not None
+            self._count(shared)
+            if task is None:
+                task = asyncio.ensure_future(factory())
+                self._tasks[key] = task
+                task.add_done_callback(lambda _: self._forget_task(key, task))
+        if shared:
+            annotate(shared=True)
+        return await asyncio.shield(task)
+
+    def _forget_task(self, key: Tuple, task: asyncio.Task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+        # 所有等待方都已超时离开时，避免"异常未被获取"的警告
+        if not task.cancelled():
+            task.exception()
+
+    def stream(self, key: Optional[Tuple], factory: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        """订阅相同键的进行中流式生成，没有时在后台线程中开始一个
+
+        后加入的订阅者先收到已生成的全部元素，再继续接收新的元素。
+        """
+        if key is None or not self.settings.enabled:
+            yield from factory()
+            return
+        with self._lock:
+            flight = self._streams.get(key)
+            leader = flight is None
+            if leader:
+                flight = _SharedStream()
+                self._streams[key] = flight
+            with flight.cond:
+                flight.subscribers += 1
+            self._count(not leader)
+        if leader:
+            # 生成线程沿用发起方的链路追踪上下文，模型调用记录在发起方的span下
+            threading.Thread(
+                target=bind_context(self._produce), args=(key, flight, factory),
+                name="single-flight-stream", daemon=True
+            ).start()
+        else:
+            annotate(shared=True)
+
+        index = 0
+        try:
+            while True:
+                with flight.cond:
+                    while index >= len(flight.items) and not flight.done:
+                        flight.cond.wait()
+                    items = flight.items[index:]
+                    index += len(items)
+                    done, error = flight.done, flight.error
+                if not items and done:
+                    if error is not None:
+                        raise error
+                    return
+                yield from items
+        finally:
+            self._unsubscribe(key, flight)
+
+    def _produce(self, key: Tuple, flight: _SharedStream, factory: Callable[[], Iterable[Any]]):
+        """在后台线程中驱动生成，订阅者全部离开时关闭生成器（结束对Ollama的流式请求）"""
+        source = None
+        try:
+            source = iter(factory())
+            for item in source:
+                with flight.cond:
+                    if flight.subscribers == 0:
+                        break
+                    flight.items.append(item)
+                    flight.cond.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            close = getattr(source, "close", None)
+            if close:
+                close()
+            with self._lock:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def _unsubscribe(self, key: Tuple, flight: _SharedStream):
+        with self._lock:
+            with flight.cond:
+                flight.subscribers -= 1
+                abandoned = flight.subscribers == 0 and not flight.done
+            # 没有订阅者的生成即将停止，新的请求应重新开始而不是收到不完整的输出
+            if abandoned and self._streams.get(key) is flight:
+                del self._streams[key]
+
+    def stats(self) -> Dict[str, int]:
+        """实际执行次数、共享结果的次数和当前进行中的请求数"""
+        with self._lock:
+            return {
+                **self._stats,
+                "in_flight": len(self._calls) + len(self._tasks) + len(self._streams)
+            }
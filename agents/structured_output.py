@@ -0,0 +1,173 @@
+"""
+结构化输出模块
+让文本模型按JSON返回搭配建议的各个部分和关键词数组（Ollama的 format 参数），
+用pydantic校验后直接取关键词，不再从自由文本中按标题和分隔符切分
+"""
+import re
+import json
+from typing import List, Optional, Tuple, Type, TypeVar, Union, Dict, Any
+from pydantic import BaseModel, Field, ValidationError
+
+# 关键词之间可能出现的分隔符
+_KEYWORD_SEPARATORS = re.compile(r"[、,，;；\n]+")
+# 关键词两端可能带有的括号、引号
+_KEYWORD_STRIP = " \t\"'“”‘’[]【】「」"
+
+MAX_KEYWORDS = 8
+
+T = TypeVar("T", bound=BaseModel)
+SectionText = Union[str, List[str]]
+
+
+def split_keywords(text: str) -> List[str]:
+    """按常见分隔符把关键词字符串拆分为列表"""
+    return [part for part in _KEYWORD_SEPARATORS.split(text or "") if part.strip()]
+
+
+def normalize_keywords(keywords: List[str], limit: int = MAX_KEYWORDS) -> List[str]:
+    """拆开误合并在一起的关键词，去掉括号引号，去重并限制数量"""
+    result = []
+    for keyword in keywords:
+        for part in split_keywords(str(keyword)):
+            part = part.strip(_KEYWORD_STRIP)
+            if part and part not in result:
+                result.append(part)
+    return result[:limit]
+
+
+def _section(text: SectionText) -> str:
+    """模型有时把段落返回为字符串数组，统一转为列表文本"""
+    if isinstance(text, list):
+        return "\n".join(f"- {item}" for item in text)
+    return text.strip()
+
+
+def _render(title: str, sections: List[Tuple[str, SectionText]], keywords: List[str]) -> str:
+    """渲染为与自由文本回答相同的Markdown结构，跳过空段落"""
+    parts = [title]
+    for heading, text in sections:
+        text = _section(text)
+        if text:
+            parts.append(f"### {heading}\n{text}\n")
+    parts.append(f"## 搜索关键词\nkeywords: {','.join(keywords)}")
+    return "\n".join(parts)
+
+
+class QueryAdvice(BaseModel):
+    """文本问答的结构化回答"""
+
+    style: SectionText = Field("", description="风格定位")
+    advice: SectionText = Field("", description="搭配建议：颜色、款式、材质和配饰")
+    occasions: SectionText = Field("", description="适合的穿着场合和季节")
+    trends: SectionText = Field("", description="结合流行趋势的建议")
+    keywords: List[str] = Field(default_factory=list, description="3-5个商品搜索关键词")
+
+    def to_markdown(self) -> str:
+        """渲染为与自由文本回答相同的Markdown结构，供界面展示"""
+        return _render("## 时尚分析", [
+            ("风格定位", self.style),
+            ("搭配建议", self.advice),
+            ("场合适应性", self.occasions),
+            ("流行趋势", self.trends)
+        ], self.keywords)
+
+
+class OutfitAdvice(BaseModel):
+    """图片搭配建议的结构化回答"""
+
+    items: SectionText = Field("", description="现有单品分析")
+    advice: SectionText = Field("", description="搭配补充建议：上下装、颜色、配饰、外套或内搭")
+    style: SectionText = Field("", description="风格提升")
+    occasions: SectionText = Field("", description="场合适配")
+    keywords: List[str] = Field(default_factory=list, description="5-8个商品搜索关键词")
+
+    def to_markdown(self) -> str:
+        """渲染为与自由文本回答相同的Markdown结构，供界面展示"""
+        return _render("## 搭配建议", [
+            ("现有单品分析", self.items),
+            ("搭配补充建议", self.advice),
+            ("风格提升", self.style),
+            ("场合适配", self.occasions)
+        ], self.keywords)
+
+
+class SearchKeywords(BaseModel):
+    """提前生成的商品搜索关键词"""
+
+    keywords: List[str] = Field(default_factory=list, description="5-8个商品搜索关键词")
+
+
+class StructuredOutputSettings(BaseModel):
+    """结构化输出配置，对应 config.yaml 中的 structured_output"""
+
+    enabled: bool = Field(True, description="非流式的问答和搭配建议是否使用JSON输出")
+    mode: str = Field("schema", description="schema: 传入JSON Schema约束输出；json: 只要求输出合法JSON")
+    num_predict: int = Field(1024, description="结构化输出的最大生成token数")
+
+
+def response_format(schema: Type[BaseModel], mode: str = "schema") -> Union[str, Dict[str, Any]]:
+    """Ollama请求的 format 参数"""
+    if mode != "schema":
+        return "json"
+    return schema.model_json_schema()
+
+
+def _strip_fence(text: str) -> str:
+    """兼容模型在JSON外包了代码块"""
+    raw = (text or "").strip()
+    if raw.startswith("```"):
+        raw = raw.strip("`").split("\n", 1)[-1]
+    return raw
+
+
+def parse_structured(schema: Type[T], text: str) -> Optional[T]:
+    """解析并校验模型返回的JSON，失败时返回None（调用方退回自由文本处理）"""
+    raw = _strip_fence(text)
+    try:
+        data = json.loads(raw)
+        parsed = schema.model_validate(data)
+    except (ValueError, ValidationError) as e:
+        print(f"结构化输出解析失败: {str(e)[:200]}")
+        return None
+    parsed.keywords = normalize_keywords(parsed.keywords)
+    return parsed
+
+
+def parse_partial(schema: Type[T], text: str) -> Optional[T]:
+    """宽松解析不完整的JSON（如生成达到 num_predict 被截断）
+
+    逐个字段取出已完整生成的值，最后一个被截断的字符串字段保留已生成的部分；
+    除关键词外没有任何内容时返回None。
+    """
+    raw = _strip_fence(text)
+    fields = schema.model_fields
+    decoder = json.JSONDecoder()
+    data: Dict[str, Any] = {}
+    for name in fields:
+        match = re.search(r'"%s"\s*:\s*' % re.escape(name), raw)
+        if match is None:
+            continue
+        start = match.end()
+        try:
+            data[name], _ = decoder.raw_decode(raw, start)
+        except ValueError:
+            if raw.startswith('"', start):
+                try:
+                    data[name] = json.loads(raw[start:].rstrip("\\") + '"')
+                except ValueError:
+                    pass
+    if not any(value for name, value in data.items() if name != "keywords"):
+        return None
+    try:
+        parsed = schema.model_validate(data)
+    except ValidationError:
+        return None
+    parsed.keywords = normalize_keywords(parsed.keywords)
+    return parsed
+
+
+class EarlySearchSettings(BaseModel):
+    """提前搜索配置，对应 config.yaml 中的 early_search"""
+
+    enabled: bool = Field(True, description="视觉分析完成后先用简短提示词生成关键词，与搭配建议并行搜索商品；仅在关键词任务使用 models.text_small 时生效")
+    num_predict: int = Field(96, description="生成关键词的最大token数")
@@ -2,10 +2,13 @@ from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any
 import requests
+import httpx
+import asyncio
 import json
 import hashlib
 import time
 import os
+import weakref
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -44,6 +47,10 @@ class GoodsQueryInput(BaseModel):
         default=False,
         description="是否只显示有优惠券的商品"
     )
+    timeout: Optional[float] = Field(
+        default=None,
+        description="本次请求的读取超时（秒），不超过工具的 request_timeout"
+    )
 
 class JdUnionGoodsQueryTool(BaseTool):
     name: Optional[str] = "jd_clothing_search"
@@ -53,6 +60,7 @@ class JdUnionGoodsQueryTool(BaseTool):
     url: str = "https://api.jd.com/routerjson"
     app_key: Optional[str] = None
     app_secret: Optional[str] = None
+    request_timeout: float = 30.0
     
     
     def __init__(self):
@@ -93,8 +101,37 @@ class JdUnionGoodsQueryTool(BaseTool):
         # MD5加密并转为大写
         return hashlib.md5(sign_str.encode('utf-8')).hexdigest().upper()
 
-    def _run(self, keyword: str, **kwargs: Any) -> Dict[str, Any]:
+    def _read_timeout(self, timeout: Optional[float]) -> float:
+        """本次请求的读取超时：调用方给出的时限（如单个关键词的搜索时限）与 request_timeout 取较小值"""
+        return min(self.request_timeout, timeout) if timeout else self.request_timeout
+
+    def _run(self, keyword: str, timeout: Optional[float] = None, **kwargs: Any) -> Dict[str, Any]:
         """执行商品查询"""
+        public_params = self._build_params(keyword, **kwargs)
+        
+        # 发送请求
+        try:
+            response = requests.get(self.url, params=public_params, timeout=(5, self._read_timeout(timeout)))
+            response.raise_for_status()
+            return self._parse_response(response.json())
+        except Exception as e:
+            return {"error": f"请求失败: {str(e)}"}
+    
+    async def _arun(self, keyword: str, timeout: Optional[float] = None, **kwargs: Any) -> Dict[str, Any]:
+        """异步执行商品查询，复用当前事件循环的连接池"""
+        public_params = self._build_params(keyword, **kwargs)
+        
+        try:
+            response = await _get_async_http_client().get(
+                self.url, params=public_params, timeout=httpx.Timeout(self._read_timeout(timeout), connect=5.0)
+            )
+            response.raise_for_status()
+            return self._parse_response(response.json())
+        except Exception as e:
+            return {"error": f"请求失败: {str(e)}"}
+    
+    def _build_params(self, keyword: str, **kwargs: Any) -> Dict[str, str]:
+        """构建带签名的请求参数"""
         # 设置默认值
         page_index = kwargs.get("page_index", 1)
         page_size = kwargs.get("page_size", 2)
@@ -134,55 +171,65 @@ class JdUnionGoodsQueryTool(BaseTool):
         sign = self._generate_sign(public_params)
         public_params["sign"] = sign
         
-        # 发送请求
-        try:
-            response = requests.get(self.url, params=public_params)
-            response.raise_for_status()
-            result = response.json()
-            
-            
-            if "error_response" in result:
-                error_msg = result["error_response"].get("zh_desc", "未知错误")
-                return {"error": f"京东API错误: {error_msg}"}
-            
-            # 提取商品列表
-            response_key = "jd_union_open_goods_query_responce"  
-            if response_key not in result:
-                response_key = "jd_union_open_goods_query_response" 
-                
-            goods_data = result.get(response_key, {})
-            query_result = goods_data.get("queryResult", "")
-            
-          
-            try:
-                query_result_json = json.loads(query_result)
-                goods_list = query_result_json.get("data", [])
-            except:
-                return {"error": "解析商品数据失败"}
-            
-          
-            simplified_goods = []
-            for item in goods_list:
-               
-                good_item = {
-                    "name": item.get("skuName", ""),
-                    "price": item.get("priceInfo", {}).get("price", 0),
-                    "coupon_price": item.get("priceInfo", {}).get("lowestCouponPrice", 0),
-                    "good_comments_share": item.get("goodCommentsShare", 0),
-                    "image": item.get("imageInfo", {}).get("imageList", [{}])[0].get("url", ""),
-                    "shop_name": item.get("shopInfo", {}).get("shopName", ""),
-                    "description": item.get("document", ""), 
-                    "stock_state": item.get("stockState", ""),  
-                 
-                    "material_url": item.get("materialUrl", ""),  
-                    "item_url": f"https://item.jd.com/{item.get('skuId', '')}.html" if item.get('skuId') else "",
-                    "sales": item.get("inOrderCount30Days", 0)
-                }
-                simplified_goods.append(good_item)
+        return public_params
+    
+    def _parse_response(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """解析京东API响应，提取简化后的商品列表"""
+        if "error_response" in result:
+            error_msg = result["error_response"].get("zh_desc", "未知错误")
+            return {"error": f"京东API错误: {error_msg}"}
+        
+        # 提取商品列表
+        response_key = "jd_union_open_goods_query_responce"  
+        if response_key not in result:
+            response_key = "jd_union_open_goods_query_response" 
             
-            return {"goods": simplified_goods}
-        except Exception as e:
-            return {"error": f"请求失败: {str(e)}"}
+        goods_data = result.get(response_key, {})
+        query_result = goods_data.get("queryResult", "")
+        
+      
+        try:
+            query_result_json = json.loads(query_result)
+            goods_list = query_result_json.get("data", [])
+        except:
+            return {"error": "解析商品数据失败"}
+        
+      
+        simplified_goods = []
+        for item in goods_list:
+           
+            good_item = {
+                "name": item.get("skuName", ""),
+                "price": item.get("priceInfo", {}).get("price", 0),
+                "coupon_price": item.get("priceInfo", {}).get("lowestCouponPrice", 0),
+                "good_comments_share": item.get("goodCommentsShare", 0),
+                "image": item.get("imageInfo", {}).get("imageList", [{}])[0].get("url", ""),
+                "shop_name": item.get("shopInfo", {}).get("shopName", ""),
+                "description": item.get("document", ""), 
+                "stock_state": item.get("stockState", ""),  
+             
+                "material_url": item.get("materialUrl", ""),  
+                "item_url": f"https://item.jd.com/{item.get('skuId', '')}.html" if item.get('skuId') else "",
+                "sales": item.get("inOrderCount30Days", 0)
+            }
+            simplified_goods.append(good_item)
+        
+        return {"goods": simplified_goods}
+
+
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_async_http_client() -> httpx.AsyncClient:
+    """获取当前事件循环共享的异步HTTP客户端"""
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0))
+        _async_http_clients[loop] = client
+    return client
 
 # 使用示例
 if __name__ == "__main__":
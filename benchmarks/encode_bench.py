@@ -0,0 +1,94 @@
+"""
+图像编码基准测试
+对比原始编码（原分辨率、默认质量JPEG）与预处理编码的payload大小和耗时
+
+用法:
+    python benchmarks/encode_bench.py [图片路径 ...] [--repeat N]
+不传图片时使用 web/example_images 下的示例图片和一张合成的1200万像素照片
+"""
+import os
+import sys
+import io
+import time
+import base64
+import argparse
+import tempfile
+from typing import Callable, List
+
+from PIL import Image
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from models.image_preprocess import ImagePreprocessSettings, encode_image
+
+
+def legacy_encode(path: str) -> bytes:
+    """预处理之前 ImageModel._encode_image_to_base64 的编码方式"""
+    img = Image.open(path)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def make_phone_photo(path: str, size=(4032, 3024)):
+    """生成一张带渐变、纹理和轻微噪声的合成大图，近似手机照片的压缩难度"""
+    gradient = Image.linear_gradient("L").resize(size)
+    texture = Image.effect_mandelbrot(size, (-2.0, -1.2, 1.0, 1.2), 60)
+    noise = Image.effect_noise(size, 8)
+    red = Image.blend(gradient, noise, 0.2)
+    blue = Image.blend(gradient.transpose(Image.Transpose.ROTATE_180), noise, 0.2)
+    img = Image.merge("RGB", (red, texture, blue))
+    img.save(path, format="JPEG", quality=92)
+
+
+def measure(encoder: Callable[[str], bytes], path: str, repeat: int):
+    """返回 (base64字节数, 平均耗时毫秒)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        data = encoder(path)
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    return len(base64.b64encode(data)), elapsed
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="图像编码基准测试")
+    parser.add_argument("images", nargs="*", help="待测试的图片路径")
+    parser.add_argument("--repeat", type=int, default=5, help="每张图片重复次数")
+    args = parser.parse_args(argv)
+
+    images = list(args.images)
+    tmp_dir = None
+    if not images:
+        example_dir = os.path.join(project_root, "web", "example_images")
+        images = [
+            os.path.join(example_dir, name)
+            for name in sorted(os.listdir(example_dir))
+            if name.lower().endswith((".jpg", ".jpeg", ".png"))
+        ]
+        tmp_dir = tempfile.TemporaryDirectory()
+        synthetic = os.path.join(tmp_dir.name, "phone_12mp.jpg")
+        make_phone_photo(synthetic)
+        images.append(synthetic)
+
+    settings = ImagePreprocessSettings()
+    print(f"{'图片':<28}{'尺寸':>12}{'原始payload':>14}{'原始耗时':>10}{'预处理payload':>16}{'预处理耗时':>12}")
+    for path in images:
+        with Image.open(path) as img:
+            size = f"{img.width}x{img.height}"
+        before_bytes, before_ms = measure(legacy_encode, path, args.repeat)
+        after_bytes, after_ms = measure(lambda p: encode_image(p, settings), path, args.repeat)
+        print(
+            f"{os.path.basename(path):<28}{size:>12}"
+            f"{before_bytes / 1024:>12.1f}KB{before_ms:>8.1f}ms"
+            f"{after_bytes / 1024:>14.1f}KB{after_ms:>10.1f}ms"
+        )
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+本地Ollama替身服务
+实现 /api/tags、/api/ps、/api/generate 和 /api/chat（流式和非流式），
+按配置模拟首token延迟、提示词处理速度、解码速度、模型加载和失败率，
+返回的内容符合 FashionAgent 解析的格式（搭配建议的 Markdown 段落、keywords 行、结构化JSON），
+用于在没有真实模型的环境中测量编排开销、并发和缓存的效果
+
+用法:
+    python benchmarks/fake_ollama.py [--port 11434] [--latency 0.2] [--token-rate 30] [--failure-rate 0.05]
+在其他脚本中使用:
+    server = start_server(FakeOllamaSettings(port=0))
+    url = f"http://127.0.0.1:{server.server_port}"
+    ...
+    server.shutdown()
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Any
+
+from pydantic import BaseModel, Field
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+VISION_ANALYSIS = """## 整体风格
+简约休闲风格，整体干净利落。
+
+## 服装单品
+- 上装：白色棉质衬衫，宽松版型
+- 下装：浅蓝色直筒牛仔裤
+- 鞋子：白色帆布鞋
+
+## 颜色搭配
+白色与浅蓝色搭配清爽，适合春夏季节。"""
+
+ADVICE_TEXT = """## 搭配建议
+### 现有单品分析
+白色衬衫与浅蓝牛仔裤是经典组合，简洁百搭。
+
+### 搭配补充建议
+- 外搭一件米色风衣提升层次感
+- 换上棕色乐福鞋更显精致
+- 搭配简约皮带和手表
+
+### 风格提升
+通过配饰和外套增加质感，从休闲过渡到通勤风格。
+
+### 场合适配
+适合日常通勤、周末出游和朋友聚会。
+
+## 搜索关键词
+keywords: 米色风衣,棕色乐福鞋,简约皮带,白色衬衫,直筒牛仔裤"""
+
+QUERY_TEXT = """## 时尚分析
+### 风格定位
+简约通勤风格。
+
+### 搭配建议
+- 颜色以米白、浅蓝、燕麦色为主
+- 选择宽松直筒的版型
+- 材质推荐棉麻和轻薄针织
+
+### 场合适应性
+适合春秋季的办公室和日常出行。
+
+### 流行趋势
+今年流行低饱和度的大地色系。
+
+## 搜索关键词
+keywords: 春季外套,休闲西装,轻薄针织衫"""
+
+CHAT_TEXT = """可以选择米色风衣搭配白色衬衫和直筒牛仔裤，鞋子推荐棕色乐福鞋，整体简洁又有质感。
+
+## 搜索关键词
+keywords: 米色风衣,棕色乐福鞋,直筒牛仔裤"""
+
+STRUCTURED_QUERY = {
+    "style": "简约通勤风格",
+    "advice": ["颜色以米白、浅蓝为主", "选择宽松直筒的版型", "材质推荐棉麻和轻薄针织"],
+    "occasions": "适合春秋季的办公室和日常出行",
+    "trends": "今年流行低饱和度的大地色系",
+    "keywords": ["春季外套", "休闲西装", "轻薄针织衫"]
+}
+
+STRUCTURED_OUTFIT = {
+    "items": "白色衬衫与浅蓝牛仔裤是经典组合，简洁百搭",
+    "advice": ["外搭一件米色风衣", "换上棕色乐福鞋", "搭配简约皮带和手表"],
+    "style": "通过配饰和外套增加质感",
+    "occasions": "适合日常通勤、周末出游和朋友聚会",
+    "keywords": ["米色风衣", "棕色乐福鞋", "简约皮带", "直筒牛仔裤"]
+}
+
+STRUCTURED_KEYWORDS = {"keywords": ["米色风衣", "棕色乐福鞋", "简约皮带", "直筒牛仔裤"]}
+
+
+class FakeOllamaSettings(BaseModel):
+    """替身服务配置"""
+
+    host: str = Field("127.0.0.1", description="监听地址")
+    port: int = Field(11434, description="监听端口，0 表示随机端口")
+    models: List[str] = Field(
+        default_factory=lambda: ["qwen2.5:latest", "minicpm-v:8b-2.6-q4_K_M"],
+        description="/api/tags 返回的模型"
+    )
+    latency: float = Field(0.2, description="每个请求的固定延迟（秒），模拟调度和网络")
+    jitter: float = Field(0.0, description="延迟的随机波动比例，如 0.2 表示 ±20%")
+    prompt_rate: float = Field(500.0, description="提示词处理速度（token/秒）")
+    token_rate: float = Field(30.0, description="解码速度（token/秒），0 表示不模拟解码耗时")
+    load_time: float = Field(0.0, description="模型未驻留时的加载耗时（秒）")
+    keep_alive: float = Field(300.0, description="默认驻留时间（秒）")
+    image_tokens: int = Field(700, description="每张图片折算的提示词token数")
+    failure_rate: float = Field(0.0, description="返回HTTP 500的概率")
+    seed: Optional[int] = Field(None, description="随机数种子，固定后失败和波动可复现")
+
+
+def _tokens(text: str) -> List[str]:
+    """把文本切成"token"：中文按字，其他字符每4个一组"""
+    tokens, buffer = [], ""
+    for char in text:
+        if ord(char) > 0x2E80:
+            if buffer:
+                tokens.append(buffer)
+                buffer = ""
+            tokens.append(char)
+        else:
+            buffer += char
+            if len(buffer) >= 4 or char == "\n":
+                tokens.append(buffer)
+                buffer = ""
+    if buffer:
+        tokens.append(buffer)
+    return tokens
+
+
+def _common_prefix(a: str, b: str) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+class FakeOllama:
+    """替身服务的状态：驻留的模型、前缀缓存和随机数"""
+
+    def __init__(self, settings: FakeOllamaSettings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._random = random.Random(settings.seed)
+        self._expires: Dict[str, float] = {}
+        self._last_prompt: Dict[str, str] = {}
+        self.requests = 0
+        self.failures = 0
+
+    def _uniform(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def should_fail(self) -> bool:
+        failed = self.settings.failure_rate > 0 and self._uniform() < self.settings.failure_rate
+        with self._lock:
+            self.requests += 1
+            self.failures += int(failed)
+        return failed
+
+    def delay(self) -> float:
+        jitter = (self._uniform() * 2 - 1) * self.settings.jitter
+        return max(0.0, self.settings.latency * (1 + jitter))
+
+    def load(self, model: str, keep_alive: Any) -> float:
+        """返回本次需要的加载耗时，并刷新驻留时间"""
+        now = time.time()
+        seconds = self._keep_alive_seconds(keep_alive)
+        with self._lock:
+            loaded = self._expires.get(model, 0) > now
+            if seconds == 0:
+                self._expires.pop(model, None)
+            else:
+                self._expires[model] = now + seconds if seconds > 0 else float("inf")
+        return 0.0 if loaded else self.settings.load_time
+
+    def _keep_alive_seconds(self, keep_alive: Any) -> float:
+        if keep_alive is None:
+            return self.settings.keep_alive
+        if isinstance(keep_alive, (int, float)):
+            return float(keep_alive)
+        text = str(keep_alive).strip()
+        units = {"s": 1, "m": 60, "h": 3600}
+        if text and text[-1] in units:
+            return float(text[:-1]) * units[text[-1]]
+        return float(text)
+
+    def prompt_eval(self, model: str, prompt: str, images: int) -> int:
+        """返回需要处理的提示词token数：与该模型上一次提示词相同的前缀视为已缓存"""
+        with self._lock:
+            cached = _common_prefix(self._last_prompt.get(model, ""), prompt)
+            self._last_prompt[model] = prompt
+        return len(_tokens(prompt[cached:])) + images * self.settings.image_tokens
+
+    def running(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            items = [(model, expires) for model, expires in self._expires.items() if expires > now]
+        return [
+            {
+                "name": model,
+                "model": model,
+                "expires_at": (
+                    "2318-01-01T00:00:00Z" if expires == float("inf")
+                    else datetime.fromtimestamp(expires, timezone.utc).isoformat()
+                )
+            }
+            for model, expires in items
+        ]
+
+
+def canned_response(body: Dict[str, Any], chat: bool) -> str:
+    """按请求内容选择符合 FashionAgent 解析格式的回复"""
+    fmt = body.get("format")
+    if fmt:
+        properties = fmt.get("properties", {}) if isinstance(fmt, dict) else {}
+        text = json.dumps(body, ensure_ascii=False)
+        if "items" in properties or (not properties and "图片分析结果" in text and "items" in text):
+            data = STRUCTURED_OUTFIT
+        elif set(properties) == {"keywords"} or (not properties and "style" not in text):
+            data = STRUCTURED_KEYWORDS
+        else:
+            data = STRUCTURED_QUERY
+        return json.dumps(data, ensure_ascii=False)
+    if chat:
+        return CHAT_TEXT
+    if body.get("images"):
+        return VISION_ANALYSIS
+    if "图片分析结果" in body.get("prompt", "") or "搭配补充建议" in body.get("system", ""):
+        return ADVICE_TEXT
+    return QUERY_TEXT
+
+
+def make_handler(state: FakeOllama):
+    settings = state.settings
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, obj: Dict[str, Any], status: int = 200):
+            data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write_chunk(self, obj: Optional[Dict[str, Any]]):
+            if obj is None:
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            line = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._send_json({"models": [{"name": name, "model": name} for name in settings.models]})
+            elif self.path == "/api/ps":
+                self._send_json({"models": state.running()})
+            elif self.path == "/api/version":
+                self._send_json({"version": "0.0.0-fake"})
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json({"error": "invalid json"}, 400)
+                return
+            if self.path not in ("/api/generate", "/api/chat"):
+                self._send_json({"error": "not found"}, 404)
+                return
+
+            model = body.get("model", "")
+            if model not in settings.models:
+                self._send_json({"error": f"model '{model}' not found"}, 404)
+                return
+            if state.should_fail():
+                time.sleep(state.delay())
+                self._send_json({"error": "simulated failure"}, 500)
+                return
+            self.generate(body, chat=self.path == "/api/chat")
+
+        def generate(self, body: Dict[str, Any], chat: bool):
+            start = time.perf_counter()
+            model = body["model"]
+            if chat:
+                messages = body.get("messages", [])
+                prompt = "\n".join(message.get("content", "") for message in messages)
+                images = sum(len(message.get("images") or []) for message in messages)
+            else:
+                prompt = body.get("system", "") + "\n" + body.get("prompt", "")
+                images = len(body.get("images") or [])
+
+            load_seconds = state.load(model, body.get("keep_alive"))
+            # 只预加载（warmup）时没有提示词，直接返回
+            if not chat and not body.get("prompt") and not images:
+                time.sleep(load_seconds)
+                self._send_json({
+                    "model": model, "response": "", "done": True, "done_reason": "load",
+                    "load_duration": int(load_seconds * 1e9), "total_duration": int(load_seconds * 1e9)
+                })
+                return
+
+            prompt_tokens = state.prompt_eval(model, prompt, images)
+            prompt_seconds = prompt_tokens / settings.prompt_rate if settings.prompt_rate else 0.0
+            time.sleep(state.delay() + load_seconds + prompt_seconds)
+
+            tokens = _tokens(canned_response(body, chat))
+            num_predict = (body.get("options") or {}).get("num_predict")
+            if num_predict:
+                tokens = tokens[:num_predict]
+            per_token = 1.0 / settings.token_rate if settings.token_rate else 0.0
+
+            def final(eval_seconds: float) -> Dict[str, Any]:
+                return {
+                    "model": model,
+                    "done": True,
+                    "done_reason": "stop",
+                    "total_duration": int((time.perf_counter() - start) * 1e9),
+                    "load_duration": int(load_seconds * 1e9),
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(prompt_seconds * 1e9),
+                    "eval_count": len(tokens),
+                    "eval_duration": int(eval_seconds * 1e9)
+                }
+
+            def piece(text: str) -> Dict[str, Any]:
+                if chat:
+                    return {"model": model, "message": {"role": "assistant", "content": text}, "done": False}
+                return {"model": model, "response": text, "done": False}
+
+            if not body.get("stream", True):
+                eval_seconds = per_token * len(tokens)
+                time.sleep(eval_seconds)
+                result = final(eval_seconds)
+                result.update(piece("".join(tokens)))
+                result["done"] = True
+                if not chat:
+                    result["context"] = list(range(prompt_tokens + len(tokens)))
+                self._send_json(result)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            eval_start = time.perf_counter()
+            try:
+                for token in tokens:
+                    time.sleep(per_token)
+                    self._write_chunk(piece(token))
+                last = final(time.perf_counter() - eval_start)
+                last.update(piece(""))
+                last["done"] = True
+                self._write_chunk(last)
+                self._write_chunk(None)
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端取消（对冲请求的落后者、超时）
+                pass
+
+    return Handler
+
+
+def start_server(settings: Optional[FakeOllamaSettings] = None, background: bool = True) -> ThreadingHTTPServer:
+    """启动替身服务，background 为True时在后台线程中运行并立即返回"""
+    settings = settings or FakeOllamaSettings()
+    ThreadingHTTPServer.request_queue_size = 256
+    server = ThreadingHTTPServer((settings.host, settings.port), make_handler(FakeOllama(settings)))
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="本地Ollama替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--models", nargs="*", help="/api/tags 返回的模型")
+    parser.add_argument("--latency", type=float, default=0.2, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟的随机波动比例")
+    parser.add_argument("--prompt-rate", type=float, default=500.0, help="提示词处理速度（token/秒）")
+    parser.add_argument("--token-rate", type=float, default=30.0, help="解码速度（token/秒），0 表示不模拟")
+    parser.add_argument("--load-time", type=float, default=0.0, help="模型加载耗时（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="返回HTTP 500的概率")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子")
+    args = parser.parse_args(argv)
+
+    values = {
+        "host": args.host,
+        "port": args.port,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "prompt_rate": args.prompt_rate,
+        "token_rate": args.token_rate,
+        "load_time": args.load_time,
+        "failure_rate": args.failure_rate,
+        "seed": args.seed
+    }
+    if args.models:
+        values["models"] = args.models
+    settings = FakeOllamaSettings(**values)
+
+    server = start_server(settings, background=False)
+    print(f"🧪 Ollama替身服务已启动: http://{settings.host}:{server.server_port}")
+    print(
+        f"   延迟 {settings.latency}s，解码 {settings.token_rate} token/s，"
+        f"提示词 {settings.prompt_rate} token/s，失败率 {settings.failure_rate:.0%}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+准入控制模块，限制同时发往同一个Ollama服务的生成请求数
+超过并发上限的请求进入有界等待队列，队列已满或等待超时时直接返回"服务繁忙"，
+避免突发请求让CPU后端过载、所有请求一起变慢
+"""
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional, Any, Deque
+from pydantic import BaseModel, Field
+
+# 生成方法以该前缀返回服务繁忙信息，调用方据此区分繁忙与模型错误
+SERVER_BUSY_PREFIX = "服务繁忙"
+
+
+def is_server_busy(text: str) -> bool:
+    """判断模型返回的文本是否为服务繁忙信息"""
+    return isinstance(text, str) and text.startswith(SERVER_BUSY_PREFIX)
+
+
+class AdmissionSettings(BaseModel):
+    """准入控制配置，对应 config.yaml 中的 models.admission"""
+
+    enabled: bool = Field(True, description="是否启用准入控制")
+    max_concurrent: int = Field(2, description="单个Ollama地址同时执行的生成请求数")
+    max_queue: int = Field(8, description="等待队列长度上限，超过时立即拒绝")
+    queue_timeout: float = Field(30.0, description="排队等待的最长时间（秒）")
+
+
+class ServerBusyError(Exception):
+    """请求未获准执行：队列已满或排队超时"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class _Waiter:
+    """等待队列中的一个请求，同步调用用Event唤醒，异步调用用Future唤醒"""
+
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdmissionLimiter:
+    """单个Ollama地址的并发限制器
+
+    同步和异步调用共享同一组名额，等待者按先来先服务的顺序获得名额。
+    释放名额时直接移交给队首等待者，避免新请求插队。
+    """
+
+    def __init__(self, name: str, settings: Optional[AdmissionSettings] = None):
+        self.name = name
+        self.settings = settings or AdmissionSettings()
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters: Deque[_Waiter] = deque()
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_queue_depth = 0
+        self._wait_times: Deque[float] = deque(maxlen=1000)
+
+    def try_acquire(self) -> bool:
+        """有空闲名额且无人排队时占用并返回True，否则立即返回False（不排队，不计入拒绝）"""
+        with self._lock:
+            if self._active < self.settings.max_concurrent and not self._waiters:
+                self._active += 1
+                self.admitted += 1
+                self._wait_times.append(0.0)
+                return True
+            return False
+
+    def _try_enter(self, waiter_factory) -> Optional[_Waiter]:
+        """有空闲名额时直接占用并返回None，否则入队并返回等待者"""
+        with self._lock:
+            if self._active < self.settings.max_concurrent and not self._waiters:
+                self._active += 1
+                self.admitted += 1
+                self._wait_times.append(0.0)
+                return None
+            if len(self._waiters) >= self.settings.max_queue:
+                self.rejected += 1
+                raise ServerBusyError(
+                    "queue_full",
+                    f"{SERVER_BUSY_PREFIX}: 当前排队请求已达上限({self.settings.max_queue})，请稍后再试"
+                )
+            waiter = waiter_factory()
+            self._waiters.append(waiter)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+            return waiter
+
+    def _finish_wait(self, waiter: _Waiter, start: float) -> bool:
+        """等待结束后确认是否已获得名额，未获得时移出队列"""
+        with self._lock:
+            if waiter.granted:
+                self.admitted += 1
+                self._wait_times.append(time.perf_counter() - start)
+                return True
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            self.timed_out += 1
+            return False
+
+    def _wait_limit(self, timeout: Optional[float]) -> float:
+        """排队时长上限：取配置的队列超时和调用方剩余时间中较小的一个"""
+        if timeout is None:
+            return self.settings.queue_timeout
+        return min(self.settings.queue_timeout, timeout)
+
+    def _timeout_error(self, waited: float) -> ServerBusyError:
+        return ServerBusyError(
+            "timeout",
+            f"{SERVER_BUSY_PREFIX}: 排队超过 {round(waited, 1):g} 秒，请稍后再试"
+        )
+
+    def acquire(self, timeout: Optional[float] = None):
+        """同步获取名额，失败时抛出 ServerBusyError
+
+        Args:
+            timeout: 调用方剩余的时间预算（秒），与 queue_timeout 取较小值
+        """
+        start = time.perf_counter()
+        waiter = self._try_enter(_Waiter)
+        if waiter is None:
+            return
+        limit = self._wait_limit(timeout)
+        waiter.event.wait(limit)
+        if not self._finish_wait(waiter, start):
+            raise self._timeout_error(limit)
+
+    async def aacquire(self, timeout: Optional[float] = None):
+        """异步获取名额，等待期间不占用线程"""
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        waiter = self._try_enter(lambda: _Waiter(loop))
+        if waiter is None:
+            return
+        limit = self._wait_limit(timeout)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), limit)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # 调用方被取消时，如果名额已经移交过来需要归还
+            if self._finish_wait(waiter, start):
+                self.release()
+            raise
+        if not self._finish_wait(waiter, start):
+            raise self._timeout_error(limit)
+
+    def release(self):
+        """归还名额，有等待者时直接移交给队首"""
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.wake()
+                return
+            self._active = max(0, self._active - 1)
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """同步上下文管理器，覆盖整个请求（包括流式读取）"""
+        self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, timeout: Optional[float] = None):
+        """异步上下文管理器"""
+        await self.aacquire(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回并发、队列深度和排队耗时（最近1000个请求）"""
+        with self._lock:
+            waits = sorted(self._wait_times)
+            active = self._active
+            queue_depth = len(self._waiters)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+        return {
+            "active": active,
+            "queue_depth": queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_p50": percentile(0.50),
+            "wait_p95": percentile(0.95),
+            "wait_max": waits[-1] if waits else 0.0
+        }
+
+
+_limiters: Dict[str, AdmissionLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(
+    base_url: str,
+    settings: Optional[Dict[str, Any]] = None,
+    lane: Optional[str] = None
+) -> Optional[AdmissionLimiter]:
+    """获取某个Ollama地址共享的限制器，未启用准入控制时返回None
+
+    同一地址的文本和视觉模型共享名额，以首次创建时的配置为准。
+    指定 lane 的模型（如处理短任务的小模型）使用该地址上单独的一组名额，不与其他模型一起排队。
+
+    Args:
+        base_url: Ollama API地址
+        settings: models.admission 配置字典
+        lane: 独立名额的名称
+    """
+    parsed = AdmissionSettings(**(settings or {}))
+    if not parsed.enabled:
+        return None
+    key = base_url.rstrip("/") + (f"#{lane}" if lane else "")
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = AdmissionLimiter(key, parsed)
+            _limiters[key] = limiter
+        return limiter
+
+
+def admission_stats() -> Dict[str, Dict[str, Any]]:
+    """所有Ollama地址的准入统计"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
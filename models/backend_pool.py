@@ -0,0 +1,524 @@
+"""
+Ollama多后端负载均衡模块
+同一个模型可以配置多个Ollama地址，按在途请求数或延迟选择后端，
+后台定期探测健康状态，连续失败的后端会被熔断，冷却后放行一个试探请求，成功后恢复。
+非流式请求可以在超过历史延迟分位数后向另一个后端发送对冲请求，取先完成的结果
+"""
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Iterator, Tuple, Callable, Awaitable, Deque, TypeVar
+import httpx
+import requests
+from pydantic import BaseModel, Field
+from models.admission import ServerBusyError
+from models.ollama_client import (
+    AsyncOllamaClient,
+    OllamaClient,
+    get_async_ollama_client,
+    get_ollama_client,
+)
+
+# 计入后端失败的异常类型：连接失败、超时等网络错误
+_TRANSPORT_ERRORS = (requests.RequestException, httpx.TransportError, OSError)
+# 读取超时：由调用方截止时间缩短的读取超时不计入后端失败
+_TIMEOUT_ERRORS = (requests.Timeout, httpx.TimeoutException)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """所有后端都处于熔断状态，请求直接失败而不再等待超时"""
+
+
+def remaining_time(deadline: Optional[float]) -> Optional[float]:
+    """距离截止时间（time.monotonic()）的剩余秒数，无截止时间时返回None，已超时抛出 TimeoutError"""
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("已超过调用时限")
+    return left
+
+
+class BackendPoolSettings(BaseModel):
+    """负载均衡配置，对应 config.yaml 中的 models.balancer"""
+
+    strategy: str = Field("least_outstanding", description="选择策略: least_outstanding 或 latency")
+    health_interval: float = Field(15.0, description="健康探测间隔（秒），0表示不探测")
+    probe_timeout: float = Field(3.0, description="健康探测超时（秒）")
+    failure_threshold: int = Field(3, description="连续失败多少次后摘除")
+    ejection_seconds: float = Field(30.0, description="熔断后多少秒放行一个试探请求")
+    latency_alpha: float = Field(0.3, description="延迟指数移动平均的平滑系数")
+    hedge_enabled: bool = Field(False, description="是否对非流式请求发送对冲请求")
+    hedge_percentile: float = Field(0.95, description="等待超过该延迟分位数后发送对冲请求")
+    hedge_min_delay: float = Field(1.0, description="对冲等待的最短时间（秒）")
+    hedge_min_samples: int = Field(20, description="延迟样本少于该数量时不对冲")
+
+
+class Backend:
+    """单个Ollama后端的运行状态"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.trial_in_flight = False
+        self.latency: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until and not self.trial_in_flight
+
+    def state(self, now: float, threshold: int) -> str:
+        """熔断器状态: closed（正常）、open（熔断）、half_open（试探中或可试探）"""
+        if self.consecutive_failures < threshold:
+            return "closed"
+        return "open" if now < self.ejected_until else "half_open"
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "healthy": self.available(now),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "latency_ewma": self.latency,
+            "last_error": self.last_error
+        }
+
+
+class BackendLease:
+    """一次请求占用的后端，请求返回5xx时调用 fail() 计入失败"""
+
+    def __init__(self, backend: Backend, http_settings: Dict[str, Any]):
+        self.backend = backend
+        self.url = backend.url
+        self.ok = True
+        self.cancelled = False
+        # 熔断冷却后放行的试探请求，结束时解除试探占用
+        self.trial = False
+        self._http_settings = http_settings
+
+    @property
+    def client(self) -> OllamaClient:
+        return get_ollama_client(self.url, self._http_settings)
+
+    @property
+    def async_client(self) -> AsyncOllamaClient:
+        return get_async_ollama_client(self.url, self._http_settings)
+
+    def fail(self, reason: str = ""):
+        self.ok = False
+        if reason:
+            self.backend.last_error = reason
+
+
+class BackendPool:
+    """多个Ollama地址组成的后端池
+
+    - least_outstanding: 选择在途请求最少的后端，相同时选择延迟较低的
+    - latency: 选择 平均延迟 × (在途请求+1) 最小的后端，适合配置不一致的机器
+    全部后端都处于熔断状态时抛出 CircuitOpenError，调用方立即失败。
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        settings: Optional[BackendPoolSettings] = None,
+        http_settings: Optional[Dict[str, Any]] = None
+    ):
+        if not urls:
+            raise ValueError("至少需要一个Ollama地址")
+        self.settings = settings or BackendPoolSettings()
+        self.http_settings = http_settings or {}
+        self.backends = [Backend(url.rstrip("/")) for url in dict.fromkeys(urls)]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # 按模型记录非流式请求的延迟样本，用于计算对冲等待时间
+        self._samples: Dict[str, Deque[float]] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def urls(self) -> List[str]:
+        return [backend.url for backend in self.backends]
+
+    def _score(self, backend: Backend) -> Tuple[float, float]:
+        latency = backend.latency if backend.latency is not None else 0.0
+        if self.settings.strategy == "latency":
+            return latency * (backend.outstanding + 1), backend.outstanding
+        return backend.outstanding, latency
+
+    def choose(self, exclude: Tuple[str, ...] = (), prefer: Optional[str] = None) -> Tuple[Backend, bool]:
+        """选择一个后端并占用一个在途名额，返回后端以及本次请求是否为熔断后的试探请求
+
+        Args:
+            exclude: 不参与选择的地址（对冲请求排除首个请求所在的后端）
+            prefer: 优先使用的地址（对话会话复用上一轮的后端），不可用时按策略选择
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if b.available(now) and b.url not in exclude]
+            if not candidates:
+                retry_in = max(0.0, min(b.ejected_until for b in self.backends) - now)
+                raise CircuitOpenError(f"Ollama后端均处于熔断状态，约 {retry_in:.0f} 秒后重试")
+            preferred = [b for b in candidates if b.url == (prefer or "").rstrip("/")]
+            backend = preferred[0] if preferred else min(candidates, key=self._score)
+            # 熔断冷却结束后只放行一个试探请求，其余请求继续快速失败
+            trial = backend.state(now, self.settings.failure_threshold) == "half_open"
+            if trial:
+                backend.trial_in_flight = True
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend, trial
+
+    def can_hedge(self, exclude: Tuple[str, ...]) -> bool:
+        """除 exclude 外是否还有可用后端"""
+        now = time.monotonic()
+        with self._lock:
+            return any(b.available(now) and b.url not in exclude for b in self.backends)
+
+    def _finish(self, backend: Backend, lease: BackendLease, seconds: float):
+        with self._lock:
+            backend.outstanding -= 1
+            if lease.trial:
+                backend.trial_in_flight = False
+            if lease.cancelled:
+                # 被取消的请求（对冲失败方、提前关闭的流）以及超过调用时限、排队被拒绝的请求
+                # 不反映后端的健康状况，不计入延迟和失败
+                return
+            if lease.ok:
+                backend.consecutive_failures = 0
+                alpha = self.settings.latency_alpha
+                backend.latency = (
+                    seconds if backend.latency is None
+                    else alpha * seconds + (1 - alpha) * backend.latency
+                )
+                return
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.settings.failure_threshold:
+                self._eject(backend)
+
+    def _eject(self, backend: Backend):
+        if time.monotonic() >= backend.ejected_until:
+            backend.ejections += 1
+            print(f"⚠️ Ollama后端 {backend.url} 连续失败 {backend.consecutive_failures} 次，熔断 {self.settings.ejection_seconds:g} 秒")
+        backend.ejected_until = time.monotonic() + self.settings.ejection_seconds
+
+    @contextmanager
+    def lease(
+        self,
+        exclude: Tuple[str, ...] = (),
+        prefer: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> Iterator[BackendLease]:
+        """占用一个后端执行请求，结束时记录耗时和成败
+
+        同步和异步代码都可以使用（进入和退出都不阻塞）。
+        超过调用方截止时间（deadline，time.monotonic()）和准入排队被拒绝时既不计为失败也不计为成功。
+        """
+        backend, trial = self.choose(exclude, prefer)
+        lease = BackendLease(backend, self.http_settings)
+        lease.trial = trial
+        start = time.perf_counter()
+        try:
+            yield lease
+        except (ServerBusyError, TimeoutError):
+            # TimeoutError 是 OSError 的子类，须在 _TRANSPORT_ERRORS 之前处理
+            lease.cancelled = True
+            raise
+        except _TIMEOUT_ERRORS as e:
+            if deadline is not None and time.monotonic() >= deadline:
+                lease.cancelled = True
+            else:
+                lease.fail(str(e))
+            raise
+        except _TRANSPORT_ERRORS as e:
+            lease.fail(str(e))
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            lease.cancelled = True
+            raise
+        finally:
+            self._finish(backend, lease, time.perf_counter() - start)
+
+    def record_latency(self, key: str, seconds: float):
+        """记录一次成功的非流式请求耗时"""
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=200)).append(seconds)
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        """对冲等待时间，未启用、样本不足或只有一个后端时返回None"""
+        if not self.settings.hedge_enabled or len(self.backends) < 2:
+            return None
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.settings.hedge_min_samples:
+            return None
+        index = min(len(samples) - 1, int(self.settings.hedge_percentile * len(samples)))
+        return max(self.settings.hedge_min_delay, samples[index])
+
+    def probe_once(self):
+        """探测一次所有后端的 /api/tags，成功则重新加入，失败则摘除"""
+        for backend in self.backends:
+            client = get_ollama_client(backend.url, self.http_settings)
+            timeout = (self.settings.probe_timeout, self.settings.probe_timeout)
+            try:
+                response = client.get("/api/tags", timeout=timeout)
+                response.raise_for_status()
+            except Exception as e:
+                with self._lock:
+                    backend.last_error = str(e)
+                    backend.consecutive_failures = max(
+                        backend.consecutive_failures, self.settings.failure_threshold
+                    )
+                    self._eject(backend)
+                continue
+
+            with self._lock:
+                if backend.consecutive_failures >= self.settings.failure_threshold:
+                    print(f"✅ Ollama后端 {backend.url} 已恢复，重新加入")
+                backend.ejected_until = 0.0
+                backend.consecutive_failures = 0
+
+    def start_health_checks(self):
+        """启动后台健康探测线程"""
+        if self.settings.health_interval <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+        self._thread.start()
+
+    def stop_health_checks(self):
+        """停止后台健康探测线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.settings.probe_timeout * len(self.backends) + 1)
+
+    def _run(self):
+        while not self._stop.wait(self.settings.health_interval):
+            self.probe_once()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """每个后端的健康状态、熔断状态、在途请求、请求数、失败数和平均延迟"""
+        now = time.monotonic()
+        with self._lock:
+            stats = {}
+            for backend in self.backends:
+                stats[backend.url] = backend.stats(now)
+                stats[backend.url]["circuit"] = backend.state(now, self.settings.failure_threshold)
+            return stats
+
+
+class HedgeAttempt:
+    """一次请求尝试的进度：选中的后端地址和获得准入名额的时间
+
+    对冲等待时间和延迟样本都从获得准入名额开始计算，在准入队列中的等待不会触发对冲。
+    """
+
+    def __init__(self, on_admit: Optional[Callable[[], None]] = None):
+        self.url: Optional[str] = None
+        self.admitted_at: Optional[float] = None
+        self._on_admit = on_admit
+
+    def choose(self, url: str):
+        """选中后端后立即记录（排队之前），对冲请求据此排除该后端"""
+        self.url = url
+
+    def admit(self):
+        """获得准入名额，开始计时"""
+        self.admitted_at = time.perf_counter()
+        if self._on_admit is not None:
+            self._on_admit()
+
+    def exclude(self) -> Tuple[str, ...]:
+        return (self.url,) if self.url else ()
+
+    def elapsed(self) -> Optional[float]:
+        """获得名额以来的秒数，尚未获得时为None"""
+        return time.perf_counter() - self.admitted_at if self.admitted_at is not None else None
+
+
+# 同步对冲请求在线程中执行，失败方在后台继续运行直到Ollama返回
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="ollama-hedge")
+
+
+def _record(pool: BackendPool, key: str, state: HedgeAttempt):
+    elapsed = state.elapsed()
+    if elapsed is not None:
+        pool.record_latency(key, elapsed)
+
+
+def call_with_hedge(
+    pool: BackendPool,
+    key: str,
+    attempt: Callable[[Tuple[str, ...], HedgeAttempt], T],
+    accept: Callable[[T], bool]
+) -> T:
+    """执行请求，获得准入名额后超过对冲等待时间仍未完成时向另一个后端再发一次，返回先成功的结果
+
+    Args:
+        pool: 后端池
+        key: 延迟样本的分组（模型名称）
+        attempt: attempt(exclude, state) 发送一次请求，选中后端和获得准入名额时分别调用
+                 state.choose(url) 和 state.admit()
+        accept: 判断结果是否成功
+    """
+    delay = pool.hedge_delay(key)
+    if delay is None:
+        state = HedgeAttempt()
+        result = attempt((), state)
+        if accept(result):
+            _record(pool, key, state)
+        return result
+
+    admitted = threading.Event()
+    state = HedgeAttempt(admitted.set)
+    primary = _hedge_executor.submit(attempt, (), state)
+    primary.add_done_callback(lambda _: admitted.set())
+    # 在准入队列中等待的时间不计入对冲等待
+    admitted.wait()
+    elapsed = state.elapsed()
+    done, _ = wait([primary], timeout=max(0.0, delay - (elapsed or 0.0)))
+    if done or not pool.can_hedge(state.exclude()):
+        result = primary.result()
+        if accept(result):
+            _record(pool, key, state)
+        return result
+
+    pool.hedges += 1
+    hedge_state = HedgeAttempt()
+    hedge = _hedge_executor.submit(attempt, state.exclude(), hedge_state)
+    states = {primary: state, hedge: hedge_state}
+    pending = {primary, hedge}
+    fallback, error = None, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if accept(result):
+                if future is hedge:
+                    pool.hedge_wins += 1
+                _record(pool, key, states[future])
+                return result
+            fallback = result
+    if fallback is not None:
+        return fallback
+    raise error
+
+
+async def acall_with_hedge(
+    pool: BackendPool,
+    key: str,
+    attempt: Callable[[Tuple[str, ...], HedgeAttempt], Awaitable[T]],
+    accept: Callable[[T], bool]
+) -> T:
+    """call_with_hedge 的异步版本，先完成的请求返回后取消另一个（断开连接，Ollama随即停止生成）"""
+    delay = pool.hedge_delay(key)
+    if delay is None:
+        state = HedgeAttempt()
+        result = await attempt((), state)
+        if accept(result):
+            _record(pool, key, state)
+        return result
+
+    admitted = asyncio.Event()
+    state = HedgeAttempt(admitted.set)
+    primary = asyncio.ensure_future(attempt((), state))
+    admission = asyncio.ensure_future(admitted.wait())
+    try:
+        await asyncio.wait({primary, admission}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        admission.cancel()
+    elapsed = state.elapsed()
+    done, _ = await asyncio.wait({primary}, timeout=max(0.0, delay - (elapsed or 0.0)))
+    if done or not pool.can_hedge(state.exclude()):
+        result = await primary
+        if accept(result):
+            _record(pool, key, state)
+        return result
+
+    pool.hedges += 1
+    hedge_state = HedgeAttempt()
+    hedge = asyncio.ensure_future(attempt(state.exclude(), hedge_state))
+    states = {primary: state, hedge: hedge_state}
+    pending = {primary, hedge}
+    fallback, error = None, None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    result = task.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if accept(result):
+                    if task is hedge:
+                        pool.hedge_wins += 1
+                    _record(pool, key, states[task])
+                    return result
+                fallback = result
+    finally:
+        for task in pending:
+            task.cancel()
+    if fallback is not None:
+        return fallback
+    raise error
+
+
+_pools: Dict[Tuple[str, ...], BackendPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_backend_pool(
+    urls: List[str],
+    settings: Optional[Dict[str, Any]] = None,
+    http_settings: Optional[Dict[str, Any]] = None
+) -> BackendPool:
+    """获取一组Ollama地址共享的后端池
+
+    地址列表相同的文本和视觉模型共享在途计数，多个后端时自动启动健康探测。
+
+    Args:
+        urls: Ollama API地址列表
+        settings: models.balancer 配置字典
+        http_settings: models.http 配置字典
+    """
+    key = tuple(url.rstrip("/") for url in urls)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = BackendPool(list(key), BackendPoolSettings(**(settings or {})), http_settings)
+            if len(pool.backends) > 1:
+                pool.start_health_checks()
+            _pools[key] = pool
+        return pool
+
+
+def backend_stats() -> Dict[str, Dict[str, Any]]:
+    """所有后端池的统计，同一地址出现在多个池中时取请求数较多的一份"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    merged: Dict[str, Dict[str, Any]] = {}
+    for pool in pools:
+        for url, stats in pool.stats().items():
+            if url not in merged or stats["requests"] > merged[url]["requests"]:
+                merged[url] = stats
+    return merged
@@ -0,0 +1,37 @@
+"""
+配置加载模块
+整个进程共享同一份解析后的 config.yaml，文件修改后自动重新加载
+"""
+import os
+import threading
+import yaml
+from typing import Dict, Any, Tuple
+
+_config_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_config_lock = threading.Lock()
+
+
+def load_config(config_path: str = "config.yaml") -> Dict[str, Any]:
+    """读取配置文件，按文件修改时间缓存解析结果
+
+    Args:
+        config_path: 配置文件路径
+
+    Returns:
+        Dict: 配置字典（共享对象，调用方不应修改）
+    """
+    path = os.path.abspath(config_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"配置文件 {config_path} 不存在")
+
+    mtime = os.path.getmtime(path)
+    with _config_lock:
+        cached = _config_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
+        _config_cache[path] = (mtime, config)
+        return config
+
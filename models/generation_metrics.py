@@ -0,0 +1,162 @@
+"""
+生成性能指标模块
+解析Ollama /api/generate 返回的耗时字段，按模型汇总解码速度、提示词处理耗时和模型重新加载次数，
+用于判断时间花在了提示词处理、逐token解码还是模型加载上
+"""
+import threading
+from typing import Dict, List, Optional, Any
+from pydantic import BaseModel, Field
+from models.tracing import annotate
+
+# load_duration 超过该秒数视为一次模型加载（模型已驻留时通常只有几毫秒）
+RELOAD_THRESHOLD_SECONDS = 0.5
+
+
+class GenerationMetrics(BaseModel):
+    """单次生成的耗时记录，Ollama的纳秒字段换算为秒"""
+
+    model: str = Field(..., description="模型名称")
+    backend: Optional[str] = Field(None, description="处理请求的Ollama地址")
+    total_seconds: float = Field(0.0, description="Ollama端总耗时")
+    load_seconds: float = Field(0.0, description="模型加载耗时")
+    prompt_eval_count: int = Field(0, description="提示词token数")
+    prompt_eval_seconds: float = Field(0.0, description="提示词处理耗时")
+    eval_count: int = Field(0, description="生成token数")
+    eval_seconds: float = Field(0.0, description="解码耗时")
+
+    @property
+    def prompt_tokens_per_second(self) -> float:
+        return self.prompt_eval_count / self.prompt_eval_seconds if self.prompt_eval_seconds else 0.0
+
+    @property
+    def eval_tokens_per_second(self) -> float:
+        return self.eval_count / self.eval_seconds if self.eval_seconds else 0.0
+
+    @property
+    def model_loaded(self) -> bool:
+        """本次请求是否触发了模型加载"""
+        return self.load_seconds >= RELOAD_THRESHOLD_SECONDS
+
+    @classmethod
+    def from_response(cls, model: str, data: Dict[str, Any], backend: Optional[str] = None) -> "GenerationMetrics":
+        """从 /api/generate 的响应（或流式响应的最后一行）解析"""
+        return cls(
+            model=model,
+            backend=backend,
+            total_seconds=data.get("total_duration", 0) / 1e9,
+            load_seconds=data.get("load_duration", 0) / 1e9,
+            prompt_eval_count=data.get("prompt_eval_count", 0),
+            prompt_eval_seconds=data.get("prompt_eval_duration", 0) / 1e9,
+            eval_count=data.get("eval_count", 0),
+            eval_seconds=data.get("eval_duration", 0) / 1e9
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """包含派生速率的字典，便于附加到结果中"""
+        result = self.model_dump()
+        result.update({
+            "prompt_tokens_per_second": round(self.prompt_tokens_per_second, 2),
+            "eval_tokens_per_second": round(self.eval_tokens_per_second, 2),
+            "model_loaded": self.model_loaded
+        })
+        return result
+
+
+class MetricsAggregator:
+    """按模型累计生成指标（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(self, metrics: GenerationMetrics):
+        """累计一次生成"""
+        with self._lock:
+            totals = self._totals.setdefault(metrics.model, {
+                "calls": 0,
+                "total_seconds": 0.0,
+                "load_events": 0,
+                "load_seconds": 0.0,
+                "prompt_eval_count": 0,
+                "prompt_eval_seconds": 0.0,
+                "eval_count": 0,
+                "eval_seconds": 0.0
+            })
+            totals["calls"] += 1
+            totals["total_seconds"] += metrics.total_seconds
+            totals["prompt_eval_count"] += metrics.prompt_eval_count
+            totals["prompt_eval_seconds"] += metrics.prompt_eval_seconds
+            totals["eval_count"] += metrics.eval_count
+            totals["eval_seconds"] += metrics.eval_seconds
+            if metrics.model_loaded:
+                totals["load_events"] += 1
+                totals["load_seconds"] += metrics.load_seconds
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """每个模型的调用数、解码速度、提示词处理耗时、加载次数及各部分耗时占比"""
+        with self._lock:
+            snapshot = {model: dict(totals) for model, totals in self._totals.items()}
+
+        result = {}
+        for model, totals in snapshot.items():
+            total = totals["total_seconds"] or 1.0
+            calls = totals["calls"] or 1
+            result[model] = {
+                **totals,
+                "eval_tokens_per_second": (
+                    totals["eval_count"] / totals["eval_seconds"] if totals["eval_seconds"] else 0.0
+                ),
+                "prompt_tokens_per_second": (
+                    totals["prompt_eval_count"] / totals["prompt_eval_seconds"]
+                    if totals["prompt_eval_seconds"] else 0.0
+                ),
+                "avg_prompt_eval_seconds": totals["prompt_eval_seconds"] / calls,
+                "avg_eval_seconds": totals["eval_seconds"] / calls,
+                "share_prompt_eval": totals["prompt_eval_seconds"] / total,
+                "share_eval": totals["eval_seconds"] / total,
+                "share_load": totals["load_seconds"] / total
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+
+
+# 进程内共享的汇总
+_aggregator = MetricsAggregator()
+
+
+def record_generation(
+    model: str,
+    data: Dict[str, Any],
+    backend: Optional[str] = None,
+    sink: Optional[List[GenerationMetrics]] = None
+) -> GenerationMetrics:
+    """解析一次生成的耗时字段，计入进程汇总，并追加到调用方提供的 sink 列表
+
+    Args:
+        model: 模型名称
+        data: /api/generate 响应
+        backend: Ollama地址
+        sink: 调用方收集本次请求指标的列表（可选）
+    """
+    metrics = GenerationMetrics.from_response(model, data, backend)
+    _aggregator.record(metrics)
+    # 记录到当前的链路追踪span，区分排队、模型加载、提示词处理和解码耗时
+    annotate(
+        backend=backend,
+        load_seconds=metrics.load_seconds,
+        prompt_eval_count=metrics.prompt_eval_count,
+        prompt_eval_seconds=metrics.prompt_eval_seconds,
+        eval_count=metrics.eval_count,
+        eval_seconds=metrics.eval_seconds
+    )
+    if sink is not None:
+        sink.append(metrics)
+    return metrics
+
+
+def metrics_summary() -> Dict[str, Dict[str, Any]]:
+    """各模型的累计指标"""
+    return _aggregator.summary()
@@ -3,20 +3,112 @@
 使用Ollama运行MiniCPM-V 2.6模型
 """
 import os
-import yaml
+import asyncio
 import base64
 import json
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import Dict, List, Optional, Any, Union, Tuple, Iterable, Iterator, AsyncIterator
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+import httpx
 import requests
-from typing import Dict, List, Optional, Any, Union
-from PIL import Image
 from pydantic import BaseModel, Field
+from models.config import load_config
+from models.ollama_client import (
+    AsyncOllamaClient,
+    OllamaClient,
+    get_async_ollama_client,
+    get_ollama_client,
+)
+from models.image_cache import ImageAnalysisCache, dhash
+from models.image_preprocess import ImagePreprocessSettings, ImageInput, encode_image, open_image
+from models.generation_metrics import record_generation
+from models.tracing import span
+from models.admission import SERVER_BUSY_PREFIX, ServerBusyError, get_limiter
+from models.residency import warmup_backend
+from models.backend_pool import (
+    BackendLease,
+    BackendPool,
+    HedgeAttempt,
+    acall_with_hedge,
+    call_with_hedge,
+    get_backend_pool,
+    remaining_time,
+)
+
+# analyze_image 以这些前缀返回错误信息，而不是抛出异常
+ERROR_PREFIXES = ("模型调用失败", "图像编码失败", SERVER_BUSY_PREFIX)
+
+
+def is_error_result(text: str) -> bool:
+    """判断分析结果是否为错误信息"""
+    return text.startswith(ERROR_PREFIXES)
+
+
+def _input_attributes(image: ImageInput) -> Dict[str, Any]:
+    """链路追踪中记录的输入图像信息"""
+    if isinstance(image, bytes):
+        return {"input": "bytes", "input_bytes": len(image)}
+    if isinstance(image, str):
+        return {"input": "path", "input_bytes": os.path.getsize(image) if os.path.isfile(image) else None}
+    return {"input": "pil", "width": image.width, "height": image.height, "mode": image.mode}
+
+
+def _hash_image(image: ImageInput, hash_size: int) -> Tuple[ImageInput, int]:
+    """计算感知哈希，返回 (编码时使用的图像, 哈希)
+
+    JPEG文件和字节按草稿模式以最小比例解码（dHash只需要 (hash_size+1) x hash_size 个像素），
+    原输入留给编码时按目标尺寸解码；其他格式需要完整解码，返回已解码的图像供编码复用。
+    """
+    img = open_image(image)
+    if img.format == "JPEG" and isinstance(image, (str, bytes, bytearray)):
+        try:
+            img.draft("L", (hash_size + 1, hash_size))
+        except Exception:
+            pass
+        return image, dhash(img, hash_size)
+    return img, dhash(img, hash_size)
+
+
+def _encode_for_batch(
+    image: ImageInput,
+    settings: ImagePreprocessSettings,
+    hash_size: Optional[int]
+) -> Tuple[str, Optional[int]]:
+    """批量分析的编码任务（在进程池中执行，必须是模块级函数）
+
+    Returns:
+        Tuple: (base64编码的JPEG, 感知哈希；未启用缓存时为None)
+    """
+    image_hash = None
+    if hash_size:
+        image, image_hash = _hash_image(image, hash_size)
+    jpeg_bytes = encode_image(image, settings)
+    return base64.b64encode(jpeg_bytes).decode('utf-8'), image_hash
+
 
 class ImageModel(BaseModel):
     """封装Ollama中的MiniCPM-V视觉模型，提供图像理解功能"""
     
     model_name: str = Field(..., description="模型名称")
     base_url: str = Field("http://localhost:11434", description="Ollama API地址")
+    base_urls: List[str] = Field(default_factory=list, description="多个Ollama地址（负载均衡），为空时只使用 base_url")
     api_key: Optional[str] = Field(None, description="API密钥（如果需要）")
+    http_settings: Dict[str, Any] = Field(default_factory=dict, description="连接池、超时和重试配置")
+    admission_settings: Dict[str, Any] = Field(default_factory=dict, description="并发上限和排队配置")
+    balancer_settings: Dict[str, Any] = Field(default_factory=dict, description="多后端选择策略和健康探测配置")
+    check_service: bool = Field(True, description="初始化时是否同步检查Ollama服务")
+    keep_alive: Optional[Union[str, int]] = Field(None, description="请求后模型在内存中的保留时间，如 30m，-1 表示常驻")
+    analysis_cache: Optional[ImageAnalysisCache] = Field(None, description="感知哈希分析缓存（可选）")
+    preprocess: ImagePreprocessSettings = Field(default_factory=ImagePreprocessSettings, description="图像预处理配置")
+    batch_concurrency: int = Field(2, description="批量分析时同时发往Ollama的请求数")
+    encode_workers: Optional[int] = Field(None, description="批量分析的编码进程数，None为CPU核数，0表示在线程中编码")
     
     class Config:
         """Pydantic配置"""
@@ -25,69 +117,183 @@ class ImageModel(BaseModel):
     def __init__(self, **kwargs):
         """初始化模型"""
         super().__init__(**kwargs)
-        # 检查Ollama服务是否可用
-        self._check_ollama_service()
+        # 检查Ollama服务是否可用（由 ModelRegistry 创建时改为后台探测）
+        if self.check_service:
+            self._check_ollama_service()
+    
+    @property
+    def backend_urls(self) -> List[str]:
+        """所有Ollama地址"""
+        return self.base_urls or [self.base_url]
+    
+    @property
+    def client(self) -> OllamaClient:
+        """第一个Ollama地址的连接池客户端"""
+        return get_ollama_client(self.backend_urls[0], self.http_settings)
+    
+    @property
+    def clients(self) -> List[OllamaClient]:
+        """所有Ollama地址的连接池客户端"""
+        return [get_ollama_client(url, self.http_settings) for url in self.backend_urls]
+    
+    @property
+    def async_client(self) -> AsyncOllamaClient:
+        """当前事件循环共享的异步Ollama客户端（第一个地址）"""
+        return get_async_ollama_client(self.backend_urls[0], self.http_settings)
+    
+    @property
+    def pool(self) -> BackendPool:
+        """地址列表相同的模型共享的后端池"""
+        return get_backend_pool(self.backend_urls, self.balancer_settings, self.http_settings)
+    
+    @contextmanager
+    def _backend(
+        self,
+        exclude: Tuple[str, ...] = (),
+        deadline: Optional[float] = None,
+        state: Optional[HedgeAttempt] = None
+    ) -> Iterator[BackendLease]:
+        """选择后端并在该后端上排队获取准入名额，排队时间不超过截止时间
+
+        state 记录选中的后端（排队之前）和获得名额的时间，供对冲请求排除该后端并从获得名额开始计时。
+        """
+        with self.pool.lease(exclude, deadline=deadline) as lease:
+            if state is not None:
+                state.choose(lease.url)
+            limiter = get_limiter(lease.url, self.admission_settings)
+            with limiter.slot(remaining_time(deadline)) if limiter is not None else nullcontext():
+                if state is not None:
+                    state.admit()
+                yield lease
+    
+    @asynccontextmanager
+    async def _abackend(
+        self,
+        exclude: Tuple[str, ...] = (),
+        deadline: Optional[float] = None,
+        state: Optional[HedgeAttempt] = None
+    ) -> AsyncIterator[BackendLease]:
+        """异步版本的 _backend"""
+        with self.pool.lease(exclude, deadline=deadline) as lease:
+            if state is not None:
+                state.choose(lease.url)
+            limiter = get_limiter(lease.url, self.admission_settings)
+            async with limiter.aslot(remaining_time(deadline)) if limiter is not None else nullcontext():
+                if state is not None:
+                    state.admit()
+                yield lease
+    
+    @staticmethod
+    def _backend_url(response: Any) -> str:
+        """从响应的请求地址中取出Ollama地址（对冲时可能不是首选后端）"""
+        return str(response.url).split("/api/", 1)[0]
+    
+    @staticmethod
+    def _deadline(timeout: Optional[float]) -> Optional[float]:
+        """把调用时限（秒）换算为截止时间"""
+        return time.monotonic() + timeout if timeout is not None else None
+    
+    @staticmethod
+    def _request_timeout(lease: BackendLease, deadline: Optional[float]) -> Dict[str, Any]:
+        """有截止时间时把读取超时缩短为剩余时间"""
+        if deadline is None:
+            return {}
+        return {"timeout": (lease.client.settings.connect_timeout, remaining_time(deadline))}
+    
+    @staticmethod
+    def _arequest_timeout(lease: BackendLease, deadline: Optional[float]) -> Dict[str, Any]:
+        """异步版本的 _request_timeout"""
+        if deadline is None:
+            return {}
+        return {"timeout": httpx.Timeout(remaining_time(deadline), connect=lease.async_client.settings.connect_timeout)}
+    
+    def _post_generate(self, request_data: Dict[str, Any], timeout: Optional[float] = None) -> requests.Response:
+        """发送非流式 /api/generate 请求，按配置向另一个后端发送对冲请求"""
+        deadline = self._deadline(timeout)
+        
+        def attempt(exclude: Tuple[str, ...], state: HedgeAttempt) -> requests.Response:
+            with self._backend(exclude, deadline, state=state) as lease:
+                response = lease.client.post(
+                    "/api/generate", request_data, api_key=self.api_key,
+                    **self._request_timeout(lease, deadline)
+                )
+                if response.status_code >= 500:
+                    lease.fail(f"HTTP {response.status_code}")
+                return response
+        
+        return call_with_hedge(self.pool, self.model_name, attempt, lambda r: r.status_code == 200)
+    
+    async def _apost_generate(self, request_data: Dict[str, Any], timeout: Optional[float] = None) -> httpx.Response:
+        """异步版本的 _post_generate，对冲成功后取消另一个请求"""
+        deadline = self._deadline(timeout)
+        
+        async def attempt(exclude: Tuple[str, ...], state: HedgeAttempt) -> httpx.Response:
+            async with self._abackend(exclude, deadline, state=state) as lease:
+                response = await lease.async_client.post(
+                    "/api/generate", request_data, api_key=self.api_key,
+                    **self._arequest_timeout(lease, deadline)
+                )
+                if response.status_code >= 500:
+                    lease.fail(f"HTTP {response.status_code}")
+                return response
+        
+        return await acall_with_hedge(self.pool, self.model_name, attempt, lambda r: r.status_code == 200)
     
     def _check_ollama_service(self):
         """检查Ollama服务是否可用"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags")
-            if response.status_code == 200:
-                available_models = response.json().get("models", [])
-                model_names = [model.get("name") for model in available_models]
-                
-                # 检查模型是否已下载
-                if self.model_name in model_names:
-                    print(f"✅ 模型 {self.model_name} 已在Ollama中可用")
-                else:
-                    print(f"⚠️ 模型 {self.model_name} 在Ollama中不可用，将尝试在首次使用时拉取")
-            else:
-                print(f"⚠️ Ollama服务响应异常: {response.status_code}")
-        except Exception as e:
-            print(f"⚠️ 无法连接到Ollama服务 ({self.base_url}): {e}")
-            print("请确保Ollama服务已启动，命令: 'ollama serve'")
+        for client in self.clients:
+            client.check_model(self.model_name, api_key=self.api_key)
     
-    def _encode_image_to_base64(self, image_path_or_pil: Union[str, Image.Image]) -> str:
+    def warmup(self) -> Dict[str, Any]:
+        """预加载模型（每个后端各一次），返回冷启动耗时"""
+        results = [warmup_backend(self, client) for client in self.clients]
+        if len(results) == 1:
+            return results[0]
+        
+        failed = [r for r in results if not r["ok"]]
+        combined = {
+            "model": self.model_name,
+            "ok": not failed,
+            "seconds": max(r["seconds"] for r in results),
+            "backends": results
+        }
+        if failed:
+            combined["error"] = "; ".join(r["error"] for r in failed)
+        else:
+            combined["load_seconds"] = max(r["load_seconds"] for r in results)
+        return combined
+    
+    def _encode_image_to_base64(self, image_path_or_pil: ImageInput) -> str:
         """将图像编码为base64字符串
 
         Args:
-            image_path_or_pil: 图像路径或PIL图像对象
+            image_path_or_pil: 图像路径、原始字节或PIL图像对象
 
         Returns:
             str: base64编码的图像
         """
-        # 如果是路径，加载图像
-        if isinstance(image_path_or_pil, str):
-            if not os.path.exists(image_path_or_pil):
-                raise FileNotFoundError(f"图像文件 {image_path_or_pil} 不存在")
-            img = Image.open(image_path_or_pil)
-        else:
-            img = image_path_or_pil
-        
-        # 确保图像是RGB模式
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        
-        # 保存为临时内存中的JPEG
-        import io
-        buffer = io.BytesIO()
-        img.save(buffer, format="JPEG")
-        
-        # 编码为base64
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+        with span("image.encode", **_input_attributes(image_path_or_pil)) as current:
+            # 预处理：按像素预算缩放、校正方向，并按目标大小选择JPEG质量
+            jpeg_bytes = encode_image(image_path_or_pil, self.preprocess)
+            
+            # 编码为base64
+            image_base64 = base64.b64encode(jpeg_bytes).decode('utf-8')
+            current.set(jpeg_bytes=len(jpeg_bytes), base64_bytes=len(image_base64))
+        return image_base64
     
     def analyze_image(
         self, 
-        image: Union[str, Image.Image],
+        image: ImageInput,
         prompt: str = "描述这张图片中的服装，包括款式、颜色和风格",
         **kwargs
     ) -> str:
         """分析图像内容
 
         Args:
-            image: 图像路径或PIL图像对象
+            image: 图像路径、原始字节或PIL图像对象
             prompt: 引导模型关注的提示词
-            **kwargs: 生成参数
+            **kwargs: 生成参数，timeout 为本次调用的时限（秒，包括排队），
+                metrics_sink 为收集本次生成耗时指标的列表
 
         Returns:
             str: 图像分析结果
@@ -98,7 +304,101 @@ class ImageModel(BaseModel):
         except Exception as e:
             return f"图像编码失败: {str(e)}"
         
-        # 构建请求数据
+        return self._generate(image_base64, prompt, **kwargs)
+    
+    def _generate(self, image_base64: str, prompt: str, **kwargs) -> str:
+        """发送已编码的图像到Ollama并返回分析文本"""
+        with span(
+            "vision.generate", model=self.model_name, prompt_chars=len(prompt), image_base64_bytes=len(image_base64)
+        ) as current:
+            text = self._request_generate(image_base64, prompt, **kwargs)
+            current.set(response_chars=len(text), failed=is_error_result(text) or None)
+        return text
+    
+    def _request_generate(self, image_base64: str, prompt: str, **kwargs) -> str:
+        request_data = self._build_request_data(image_base64, prompt, **kwargs)
+        
+        # 发送请求（排队等待准入名额）
+        try:
+            response = self._post_generate(request_data, kwargs.get("timeout"))
+            
+            if response.status_code == 200:
+                result = response.json()
+                record_generation(
+                    self.model_name, result, self._backend_url(response), kwargs.get("metrics_sink")
+                )
+                return result.get("response", "")
+            else:
+                error_msg = f"Ollama API错误: {response.status_code} - {response.text}"
+                print(error_msg)
+                return f"模型调用失败: {error_msg}"
+        except ServerBusyError as e:
+            print(f"⚠️ {e}")
+            return str(e)
+        except Exception as e:
+            error_msg = f"调用Ollama API时发生错误: {str(e)}"
+            print(error_msg)
+            return f"模型调用失败: {error_msg}"
+    
+    async def aanalyze_image(
+        self,
+        image: ImageInput,
+        prompt: str = "描述这张图片中的服装，包括款式、颜色和风格",
+        **kwargs
+    ) -> str:
+        """异步分析图像内容，图像编码在线程池中执行，不阻塞事件循环
+
+        Args:
+            image: 图像路径、原始字节或PIL图像对象
+            prompt: 引导模型关注的提示词
+            **kwargs: 生成参数，timeout 为本次调用的时限（秒，包括排队），
+                metrics_sink 为收集本次生成耗时指标的列表
+
+        Returns:
+            str: 图像分析结果
+        """
+        try:
+            image_base64 = await asyncio.to_thread(self._encode_image_to_base64, image)
+        except Exception as e:
+            return f"图像编码失败: {str(e)}"
+        
+        return await self._agenerate(image_base64, prompt, **kwargs)
+    
+    async def _agenerate(self, image_base64: str, prompt: str, **kwargs) -> str:
+        """异步版本的 _generate"""
+        with span(
+            "vision.generate", model=self.model_name, prompt_chars=len(prompt), image_base64_bytes=len(image_base64)
+        ) as current:
+            text = await self._arequest_generate(image_base64, prompt, **kwargs)
+            current.set(response_chars=len(text), failed=is_error_result(text) or None)
+        return text
+    
+    async def _arequest_generate(self, image_base64: str, prompt: str, **kwargs) -> str:
+        request_data = self._build_request_data(image_base64, prompt, **kwargs)
+        
+        try:
+            response = await self._apost_generate(request_data, kwargs.get("timeout"))
+            
+            if response.status_code == 200:
+                result = response.json()
+                record_generation(
+                    self.model_name, result, self._backend_url(response), kwargs.get("metrics_sink")
+                )
+                return result.get("response", "")
+            else:
+                error_msg = f"Ollama API错误: {response.status_code} - {response.text}"
+                print(error_msg)
+                return f"模型调用失败: {error_msg}"
+        except ServerBusyError as e:
+            print(f"⚠️ {e}")
+            return str(e)
+        except Exception as e:
+            error_msg = f"调用Ollama API时发生错误: {str(e)}"
+            print(error_msg)
+            return f"模型调用失败: {error_msg}"
+    
+    def _build_request_data(self, image_base64: str, prompt: str, **kwargs) -> Dict[str, Any]:
+        """构建 /api/generate 请求数据"""
         request_data = {
             "model": self.model_name,
             "prompt": prompt,
@@ -106,6 +406,8 @@ class ImageModel(BaseModel):
             "stream": False,
             "options": {}
         }
+        if self.keep_alive is not None:
+            request_data["keep_alive"] = self.keep_alive
         
         # 添加生成参数
         if "temperature" in kwargs:
@@ -115,45 +417,204 @@ class ImageModel(BaseModel):
         if "max_tokens" in kwargs:
             request_data["options"]["num_predict"] = kwargs["max_tokens"]
         
-        # 发送请求
-        try:
-            headers = {}
-            if self.api_key:
-                headers["Authorization"] = f"Bearer {self.api_key}"
-                
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                headers=headers,
-                json=request_data
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("response", "")
-            else:
-                error_msg = f"Ollama API错误: {response.status_code} - {response.text}"
-                print(error_msg)
-                return f"模型调用失败: {error_msg}"
-        except Exception as e:
-            error_msg = f"调用Ollama API时发生错误: {str(e)}"
-            print(error_msg)
-            return f"模型调用失败: {error_msg}"
+        return request_data
     
     def analyze_fashion(
         self, 
-        image: Union[str, Image.Image],
-        task: str = "fashion_analysis"
+        image: ImageInput,
+        task: str = "fashion_analysis",
+        **kwargs
     ) -> Dict[str, Any]:
         """分析时尚服装图像
 
         Args:
-            image: 图像路径或PIL图像对象
+            image: 图像路径、原始字节或PIL图像对象
             task: 分析任务类型 (fashion_analysis, matching_advice, style_detection, 
                   item_detection, comprehensive_analysis)
+            **kwargs: 传给 analyze_image 的生成参数
 
         Returns:
             Dict: 分析结果，包含多个方面的信息
         """
+        prompt = self._get_task_prompt(task)
+        
+        # 查找相同或近似图片的缓存结果
+        image, image_hash, cached = self._lookup_cache(image, prompt)
+        if cached is not None:
+            return {
+                "raw_analysis": cached,
+                "task": task,
+                "cached": True
+            }
+        
+        # 获取文本分析结果
+        analysis = self.analyze_image(image, prompt, **kwargs)
+        self._store_cache(image_hash, prompt, analysis)
+        result = {
+            "raw_analysis": analysis,
+            "task": task
+        }
+        
+        return result
+    
+    async def aanalyze_fashion(
+        self,
+        image: ImageInput,
+        task: str = "fashion_analysis",
+        **kwargs
+    ) -> Dict[str, Any]:
+        """异步分析时尚服装图像，返回结构与 analyze_fashion 一致"""
+        prompt = self._get_task_prompt(task)
+        
+        image, image_hash, cached = await asyncio.to_thread(self._lookup_cache, image, prompt)
+        if cached is not None:
+            return {
+                "raw_analysis": cached,
+                "task": task,
+                "cached": True
+            }
+        
+        analysis = await self.aanalyze_image(image, prompt, **kwargs)
+        self._store_cache(image_hash, prompt, analysis)
+        return {
+            "raw_analysis": analysis,
+            "task": task
+        }
+    
+    def analyze_many(
+        self,
+        images: Iterable[ImageInput],
+        task: str = "comprehensive_analysis",
+        max_concurrency: Optional[int] = None,
+        encode_workers: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """批量分析图像，按完成顺序产出结果
+
+        图像预处理在进程池中并行执行，Ollama请求数不超过 max_concurrency。
+        输入按需读取，同时在处理中的图像不超过 2 * max_concurrency 张，
+        因此可以直接传入上万张图片的生成器。
+
+        Args:
+            images: 图像路径、原始字节或PIL图像对象的可迭代对象
+            task: 分析任务类型，同 analyze_fashion
+            max_concurrency: 同时进行的模型请求数，默认使用 batch_concurrency
+            encode_workers: 编码进程数，默认使用 encode_workers 配置
+
+        Yields:
+            Dict: index（输入序号）、source、task，以及 raw_analysis（可能带 cached）或 error
+        """
+        prompt = self._get_task_prompt(task)
+        max_concurrency = max(1, max_concurrency or self.batch_concurrency)
+        workers = self.encode_workers if encode_workers is None else encode_workers
+        hash_size = self.analysis_cache.hash_size if self.analysis_cache is not None else None
+        window = 2 * max_concurrency
+        
+        encode_pool = (
+            ProcessPoolExecutor(max_workers=workers or None)
+            if workers != 0 else ThreadPoolExecutor(max_workers=max_concurrency)
+        )
+        generate_pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="vision-batch")
+        source_iter = enumerate(images)
+        pending: Dict[Future, Tuple[str, int, str, Optional[int]]] = {}
+        
+        def describe(image) -> str:
+            if isinstance(image, str):
+                return image
+            if isinstance(image, (bytes, bytearray)):
+                return f"<bytes:{len(image)}>"
+            return getattr(image, "filename", "") or "<PIL.Image>"
+        
+        def fill():
+            # 维持固定窗口，避免一次性读取全部输入
+            while len(pending) < window:
+                try:
+                    index, image = next(source_iter)
+                except StopIteration:
+                    return
+                future = encode_pool.submit(_encode_for_batch, image, self.preprocess, hash_size)
+                pending[future] = ("encode", index, describe(image), None)
+        
+        try:
+            fill()
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, index, source, image_hash = pending.pop(future)
+                    item = {"index": index, "source": source, "task": task}
+                    
+                    if stage == "encode":
+                        try:
+                            image_base64, image_hash = future.result()
+                        except Exception as e:
+                            item["error"] = f"图像编码失败: {str(e)}"
+                            yield item
+                            continue
+                        
+                        cached = (
+                            self.analysis_cache.get(image_hash, prompt)
+                            if image_hash is not None else None
+                        )
+                        if cached is not None:
+                            item.update({"raw_analysis": cached, "cached": True})
+                            yield item
+                            continue
+                        
+                        generate_future = generate_pool.submit(self._generate, image_base64, prompt)
+                        pending[generate_future] = ("generate", index, source, image_hash)
+                        continue
+                    
+                    try:
+                        analysis = future.result()
+                    except Exception as e:
+                        analysis = f"模型调用失败: {str(e)}"
+                    if is_error_result(analysis):
+                        item["error"] = analysis
+                    else:
+                        self._store_cache(image_hash, prompt, analysis)
+                        item["raw_analysis"] = analysis
+                    yield item
+                fill()
+        finally:
+            for future in pending:
+                future.cancel()
+            encode_pool.shutdown(wait=False, cancel_futures=True)
+            generate_pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _lookup_cache(
+        self,
+        image: ImageInput,
+        prompt: str
+    ) -> Tuple[ImageInput, Optional[int], Optional[str]]:
+        """计算感知哈希并查找缓存
+
+        Returns:
+            Tuple: (编码时使用的图像, 感知哈希, 缓存结果)。未启用缓存或图像无法读取时，
+                   原样返回输入图像，哈希和结果为None，由后续编码步骤报告错误
+        """
+        if self.analysis_cache is None:
+            return image, None, None
+        try:
+            # JPEG只做最小比例的草稿解码，编码时仍可直通原始字节或按目标尺寸解码；
+            # 其他格式返回已解码的图像，避免编码时再次解码
+            image, image_hash = _hash_image(image, self.analysis_cache.hash_size)
+        except Exception:
+            return image, None, None
+        return image, image_hash, self.analysis_cache.get(image_hash, prompt)
+    
+    def _store_cache(self, image_hash: Optional[int], prompt: str, analysis: str):
+        """缓存成功的分析结果，错误信息不缓存"""
+        if self.analysis_cache is None or image_hash is None:
+            return
+        if is_error_result(analysis):
+            return
+        self.analysis_cache.set(image_hash, prompt, analysis)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计，未启用缓存时返回空字典"""
+        return self.analysis_cache.stats() if self.analysis_cache is not None else {}
+    
+    def _get_task_prompt(self, task: str) -> str:
+        """获取分析任务对应的提示词"""
         prompts = {
             "fashion_analysis": "详细分析这张图片中的服装，包括款式、颜色、材质、品牌风格等。",
             "comprehensive_analysis": """
@@ -165,25 +626,12 @@ class ImageModel(BaseModel):
             """
         }
         
-        prompt = prompts.get(task, prompts["fashion_analysis"])
-        
-        # 获取文本分析结果
-        analysis = self.analyze_image(image, prompt)
-        result = {
-            "raw_analysis": analysis,
-            "task": task
-        }
-        
-        return result
+        return prompts.get(task, prompts["fashion_analysis"])
     
     @classmethod
-    def from_config(cls, config_path: str = "config.yaml"):
+    def from_config(cls, config_path: str = "config.yaml", check_service: bool = True):
         """从配置文件加载模型配置"""
-        if not os.path.exists(config_path):
-            raise FileNotFoundError(f"配置文件 {config_path} 不存在")
-            
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+        config = load_config(config_path)
             
         model_config = config.get("models", {}).get("vision", {})
         if not model_config:
@@ -192,7 +640,17 @@ class ImageModel(BaseModel):
         return cls(
             model_name=model_config.get("model_name", "minicpm-v:8b-2.6-q4_K_M"),
             base_url=model_config.get("base_url", "http://localhost:11434"),
-            api_key=model_config.get("api_key")
+            base_urls=model_config.get("base_urls") or [],
+            balancer_settings=config.get("models", {}).get("balancer", {}),
+            api_key=model_config.get("api_key"),
+            check_service=check_service,
+            keep_alive=model_config.get("keep_alive"),
+            http_settings=config.get("models", {}).get("http", {}),
+            admission_settings=config.get("models", {}).get("admission", {}),
+            analysis_cache=ImageAnalysisCache.from_config(model_config.get("cache")),
+            preprocess=ImagePreprocessSettings(**model_config.get("preprocess", {})),
+            batch_concurrency=model_config.get("batch", {}).get("max_concurrency", 2),
+            encode_workers=model_config.get("batch", {}).get("encode_workers")
         )
 
 # 测试代码
@@ -0,0 +1,216 @@
+"""
+视觉分析结果缓存模块
+用感知哈希(dHash)识别相同或近似的图片，BK树按汉明距离检索近似重复项
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple
+from PIL import Image
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """计算图片的差值哈希
+
+    缩放为 (hash_size+1) x hash_size 的灰度图，比较相邻像素亮度得到 hash_size² 位哈希。
+    重新压缩、轻微缩放和截图对哈希影响很小。
+
+    Args:
+        image: PIL图像对象
+        hash_size: 哈希边长，默认8，即64位哈希
+
+    Returns:
+        int: 哈希值
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """两个哈希之间的汉明距离"""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """按汉明距离组织的BK树，支持在给定距离内查找近似哈希"""
+
+    def __init__(self):
+        # 节点结构: [hash, {distance: child_node}]
+        self._root: Optional[list] = None
+        self.size = 0
+
+    def add(self, value: int):
+        """插入一个哈希，已存在时忽略"""
+        if self._root is None:
+            self._root = [value, {}]
+            self.size = 1
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}]
+                self.size += 1
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """查找距离不超过 max_distance 的所有哈希
+
+        Returns:
+            List[Tuple[int, int]]: (距离, 哈希) 列表，按距离升序
+        """
+        if self._root is None:
+            return []
+        results = []
+        candidates = [self._root]
+        while candidates:
+            node = candidates.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                results.append((distance, node[0]))
+            # 三角不等式剪枝：只有 |d - k| <= max_distance 的子树可能包含结果
+            for child_distance, child in node[1].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    candidates.append(child)
+        results.sort()
+        return results
+
+
+class ImageAnalysisCache:
+    """以 (任务提示词, 感知哈希) 为键的视觉分析缓存
+
+    每个提示词对应一棵BK树，汉明距离不超过 max_distance 的图片视为命中。
+    条目按LRU淘汰；BK树不支持删除，被淘汰的哈希留在树中，
+    检索时跳过，墓碑过多时重建该树。
+    """
+
+    def __init__(
+        self,
+        max_distance: int = 4,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 86400,
+        hash_size: int = 8
+    ):
+        """
+        Args:
+            max_distance: 视为同一张图片的最大汉明距离
+            max_entries: 最多缓存的分析结果数
+            ttl: 条目有效期（秒），None 表示永不过期
+            hash_size: dHash边长
+        """
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hash_size = hash_size
+
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[str, float]]" = OrderedDict()
+        self._trees: Dict[str, BKTree] = {}
+        # 每个提示词的存活条目数；树中其余的哈希是墓碑
+        self._live: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "evictions": 0}
+
+    def image_hash(self, image: Image.Image) -> int:
+        """计算图片的感知哈希"""
+        return dhash(image, self.hash_size)
+
+    @staticmethod
+    def _prompt_key(prompt: str) -> str:
+        return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, image_hash: int, prompt: str) -> Optional[str]:
+        """查找相同或近似图片在同一提示词下的分析结果"""
+        prompt_key = self._prompt_key(prompt)
+        now = time.time()
+        with self._lock:
+            tree = self._trees.get(prompt_key)
+            if tree is not None:
+                for distance, candidate in tree.search(image_hash, self.max_distance):
+                    key = (prompt_key, candidate)
+                    entry = self._entries.get(key)
+                    if entry is None:
+                        continue
+                    value, created_at = entry
+                    if self._expired(created_at, now):
+                        self._remove(key)
+                        continue
+                    self._entries.move_to_end(key)
+                    self._stats["exact_hits" if distance == 0 else "near_hits"] += 1
+                    return value
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, image_hash: int, prompt: str, value: str):
+        """写入分析结果"""
+        prompt_key = self._prompt_key(prompt)
+        with self._lock:
+            key = (prompt_key, image_hash)
+            if key not in self._entries:
+                self._live[prompt_key] = self._live.get(prompt_key, 0) + 1
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            self._trees.setdefault(prompt_key, BKTree()).add(image_hash)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def _remove(self, key: Tuple[str, int]):
+        """删除条目，哈希作为墓碑留在树中，墓碑数量超过存活条目时重建该树"""
+        del self._entries[key]
+        prompt_key = key[0]
+        live = self._live[prompt_key] - 1
+        if live == 0:
+            del self._live[prompt_key]
+            del self._trees[prompt_key]
+            return
+        self._live[prompt_key] = live
+        if self._trees[prompt_key].size - live > live:
+            rebuilt = BKTree()
+            for (p, h) in self._entries:
+                if p == prompt_key:
+                    rebuilt.add(h)
+            self._trees[prompt_key] = rebuilt
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._trees.clear()
+            self._live.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中计数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        hits = stats["exact_hits"] + stats["near_hits"]
+        total = hits + stats["misses"]
+        stats["hit_rate"] = hits / total if total else 0.0
+        return stats
+
+    @classmethod
+    def from_config(cls, cache_config: Optional[Dict[str, Any]]) -> Optional["ImageAnalysisCache"]:
+        """根据 models.vision.cache 配置创建缓存，未启用时返回None"""
+        if not cache_config or not cache_config.get("enabled", False):
+            return None
+        return cls(
+            max_distance=cache_config.get("max_distance", 4),
+            max_entries=cache_config.get("max_entries", 1024),
+            ttl=cache_config.get("ttl", 86400),
+            hash_size=cache_config.get("hash_size", 8)
+        )
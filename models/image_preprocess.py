@@ -0,0 +1,185 @@
+"""
+图像预处理模块，负责把上传图片压缩为适合视觉模型的JPEG
+MiniCPM-V 内部会再次缩放图片，发送原始分辨率只会增大payload和解码开销
+"""
+import io
+import os
+import math
+import hashlib
+from typing import Optional, Tuple, Union
+from PIL import Image, ImageOps
+from pydantic import BaseModel, Field
+
+# EXIF中的方向标签
+_EXIF_ORIENTATION = 0x0112
+
+# 图像输入：文件路径、原始字节（如上传的文件内容）或PIL图像对象
+ImageInput = Union[str, bytes, Image.Image]
+
+
+class ImagePreprocessSettings(BaseModel):
+    """预处理配置，对应 config.yaml 中的 models.vision.preprocess"""
+
+    enabled: bool = Field(True, description="是否启用预处理，关闭时按原分辨率编码")
+    max_side: int = Field(1344, description="最长边像素上限")
+    max_pixels: int = Field(1_800_000, description="总像素上限")
+    target_bytes: int = Field(300_000, description="JPEG目标字节数")
+    min_quality: int = Field(60, description="JPEG最低质量")
+    max_quality: int = Field(90, description="JPEG最高质量")
+    passthrough: bool = Field(True, description="已是合适尺寸的JPEG时直接发送原始字节")
+    resample: str = Field("bicubic", description="缩放滤镜: nearest, bilinear, bicubic, lanczos")
+
+
+def _fit_size(size: Tuple[int, int], settings: ImagePreprocessSettings) -> Tuple[int, int]:
+    """计算满足最长边和总像素预算的目标尺寸"""
+    width, height = size
+    scale = min(
+        1.0,
+        settings.max_side / max(width, height),
+        math.sqrt(settings.max_pixels / (width * height))
+    )
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _has_rotation(img: Image.Image) -> bool:
+    """EXIF方向是否需要旋转"""
+    try:
+        return img.getexif().get(_EXIF_ORIENTATION, 1) != 1
+    except Exception:
+        return False
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    """转换为RGB，透明区域铺白底"""
+    if img.mode == "RGB":
+        return img
+    if img.mode == "P":
+        img = img.convert("RGBA")
+    if img.mode in ("RGBA", "LA"):
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    return img.convert("RGB")
+
+
+def open_image(image: ImageInput) -> Image.Image:
+    """打开图像（只解析文件头，像素在首次使用时才解码）
+
+    Raises:
+        FileNotFoundError: 图像路径不存在
+    """
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, (bytes, bytearray)):
+        return Image.open(io.BytesIO(image))
+    if not os.path.exists(image):
+        raise FileNotFoundError(f"图像文件 {image} 不存在")
+    return Image.open(image)
+
+
+def image_digest(image: ImageInput) -> str:
+    """图像内容的摘要，用于识别完全相同的图片（文件和字节按原始内容，PIL图像按像素）"""
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(image, (bytes, bytearray)):
+        digest.update(image)
+    elif isinstance(image, str):
+        with open(image, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    else:
+        digest.update(f"{image.mode}:{image.size}".encode())
+        digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def _original_bytes(image: ImageInput, img: Image.Image, limit: int) -> Optional[bytes]:
+    """取原始文件字节：字节输入直接使用，路径或带文件名的图像读取原文件；超过 limit 时返回None"""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image) if len(image) <= limit else None
+    source_path = image if isinstance(image, str) else getattr(img, "filename", None)
+    if not source_path or not os.path.exists(source_path) or os.path.getsize(source_path) > limit:
+        return None
+    with open(source_path, "rb") as f:
+        return f.read()
+
+
+def _encode_jpeg(img: Image.Image, settings: ImagePreprocessSettings) -> bytes:
+    """在质量范围内选择不超过目标字节数的最高质量"""
+    def encode(quality: int) -> bytes:
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=quality)
+        return buffer.getvalue()
+
+    data = encode(settings.max_quality)
+    if len(data) <= settings.target_bytes:
+        return data
+
+    # 二分查找满足目标大小的最高质量，找不到时使用最低质量
+    low, high = settings.min_quality, settings.max_quality - 1
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        candidate = encode(quality)
+        if len(candidate) <= settings.target_bytes:
+            best = candidate
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best if best is not None else encode(settings.min_quality)
+
+
+def encode_image(
+    image: ImageInput,
+    settings: Optional[ImagePreprocessSettings] = None
+) -> bytes:
+    """把图像预处理并编码为JPEG字节
+
+    处理顺序：原始JPEG直通 -> JPEG草稿模式解码 -> EXIF方向校正 -> 转RGB
+    -> 按像素预算缩放 -> 按目标字节数选择质量。
+
+    Args:
+        image: 图像路径、原始字节或PIL图像对象
+        settings: 预处理配置
+
+    Returns:
+        bytes: JPEG数据
+    """
+    settings = settings or ImagePreprocessSettings()
+
+    img = open_image(image)
+
+    if not settings.enabled:
+        buffer = io.BytesIO()
+        _to_rgb(img).save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+    target_size = _fit_size(img.size, settings)
+
+    # 已是合适尺寸的JPEG且无需旋转时，直接发送原始字节，省去一次解码和编码
+    if (
+        settings.passthrough
+        and img.format == "JPEG"
+        and target_size == img.size
+        and img.mode == "RGB"
+        and not _has_rotation(img)
+    ):
+        original = _original_bytes(image, img, settings.target_bytes)
+        if original is not None:
+            return original
+
+    # 草稿模式让libjpeg直接按1/2、1/4、1/8比例解码，大图解码耗时大幅降低
+    if img.format == "JPEG" and target_size != img.size:
+        try:
+            img.draft("RGB", target_size)
+        except Exception:
+            pass
+
+    img = ImageOps.exif_transpose(img)
+    img = _to_rgb(img)
+
+    target_size = _fit_size(img.size, settings)
+    if target_size != img.size:
+        resample = getattr(Image.Resampling, settings.resample.upper(), Image.Resampling.BICUBIC)
+        img = img.resize(target_size, resample, reducing_gap=2.0)
+
+    return _encode_jpeg(img, settings)
@@ -0,0 +1,290 @@
+"""
+Ollama HTTP客户端模块，负责维护到Ollama服务的连接池
+TextAgent、ImageModel 共享同一个带keep-alive的会话，避免每次推理都重新建立TCP连接
+异步调用使用按事件循环缓存的 httpx.AsyncClient
+"""
+import asyncio
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Any, Tuple
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from pydantic import BaseModel, Field
+
+
+class OllamaClientSettings(BaseModel):
+    """连接池、超时和重试配置，对应 config.yaml 中的 models.http"""
+
+    pool_connections: int = Field(4, description="缓存的连接池数量（按主机划分）")
+    pool_maxsize: int = Field(16, description="单个主机的最大keep-alive连接数")
+    connect_timeout: float = Field(5.0, description="建立连接的超时时间（秒）")
+    read_timeout: float = Field(300.0, description="等待响应数据的超时时间（秒）")
+    max_retries: int = Field(2, description="连接失败或网关错误时的最大重试次数")
+    backoff_factor: float = Field(0.5, description="重试之间的指数退避因子")
+
+
+class OllamaClient:
+    """基于 requests.Session 的Ollama客户端，同一个base_url复用同一组连接"""
+
+    def __init__(self, base_url: str, settings: Optional[OllamaClientSettings] = None):
+        self.base_url = base_url.rstrip("/")
+        self.settings = settings or OllamaClientSettings()
+        self.session = self._build_session()
+
+    def _build_session(self) -> requests.Session:
+        """创建带连接池和重试策略的会话"""
+        retry = Retry(
+            total=self.settings.max_retries,
+            connect=self.settings.max_retries,
+            # 生成请求不是幂等的，读超时后不再重发，避免重复占用模型
+            read=0,
+            status=self.settings.max_retries,
+            backoff_factor=self.settings.backoff_factor,
+            status_forcelist=(502, 503, 504),
+            # 网关错误时请求可能已经到达Ollama，只重发GET；POST只在连接失败（请求未发出）时重试
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.settings.pool_connections,
+            pool_maxsize=self.settings.pool_maxsize,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        """(连接超时, 读取超时)"""
+        return (self.settings.connect_timeout, self.settings.read_timeout)
+
+    @staticmethod
+    def _headers(api_key: Optional[str] = None) -> Dict[str, str]:
+        headers = {}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        return headers
+
+    def get(self, path: str, api_key: Optional[str] = None, **kwargs) -> requests.Response:
+        """发送GET请求"""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(
+            f"{self.base_url}{path}",
+            headers=self._headers(api_key),
+            **kwargs
+        )
+
+    def post(
+        self,
+        path: str,
+        payload: Dict[str, Any],
+        api_key: Optional[str] = None,
+        **kwargs
+    ) -> requests.Response:
+        """发送POST请求，payload 以JSON形式提交"""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(
+            f"{self.base_url}{path}",
+            headers=self._headers(api_key),
+            json=payload,
+            **kwargs
+        )
+
+    def list_models(self, api_key: Optional[str] = None, **kwargs) -> List[str]:
+        """返回Ollama中已下载的模型名称列表"""
+        response = self.get("/api/tags", api_key=api_key, **kwargs)
+        response.raise_for_status()
+        return [model.get("name") for model in response.json().get("models", [])]
+
+    def running_models(self, api_key: Optional[str] = None) -> List[Dict[str, Any]]:
+        """返回当前已加载到内存的模型（/api/ps），包含 expires_at 等字段"""
+        response = self.get("/api/ps", api_key=api_key)
+        response.raise_for_status()
+        return response.json().get("models", [])
+
+    def warmup(
+        self,
+        model_name: str,
+        keep_alive: Optional[Any] = None,
+        api_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """发送空提示词让Ollama加载模型
+
+        Returns:
+            Dict: model、ok、seconds（总耗时）、load_seconds（Ollama报告的加载耗时），失败时为 error 和 status（HTTP状态码）
+        """
+        payload = {"model": model_name, "prompt": "", "stream": False}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        start = time.perf_counter()
+        try:
+            response = self.post("/api/generate", payload, api_key=api_key)
+            seconds = time.perf_counter() - start
+            if response.status_code != 200:
+                return {
+                    "model": model_name,
+                    "ok": False,
+                    "seconds": seconds,
+                    "status": response.status_code,
+                    "error": f"{response.status_code} - {response.text}"
+                }
+            load_duration = response.json().get("load_duration", 0)
+            return {
+                "model": model_name,
+                "ok": True,
+                "seconds": seconds,
+                "load_seconds": load_duration / 1e9
+            }
+        except Exception as e:
+            return {
+                "model": model_name,
+                "ok": False,
+                "seconds": time.perf_counter() - start,
+                "error": str(e)
+            }
+
+    def check_model(self, model_name: str, api_key: Optional[str] = None):
+        """检查Ollama服务是否可用以及模型是否已下载"""
+        try:
+            model_names = self.list_models(api_key=api_key)
+            if model_name in model_names:
+                print(f"✅ 模型 {model_name} 已在Ollama中可用")
+            else:
+                print(f"⚠️ 模型 {model_name} 在Ollama中不可用，将尝试在首次使用时拉取")
+        except requests.HTTPError as e:
+            print(f"⚠️ Ollama服务响应异常: {e.response.status_code}")
+        except Exception as e:
+            print(f"⚠️ 无法连接到Ollama服务 ({self.base_url}): {e}")
+            print("请确保Ollama服务已启动，命令: 'ollama serve'")
+
+    def close(self):
+        """关闭会话并释放连接"""
+        self.session.close()
+
+
+class AsyncOllamaClient:
+    """基于 httpx.AsyncClient 的异步Ollama客户端，连接池绑定到所属的事件循环"""
+
+    def __init__(self, base_url: str, settings: Optional[OllamaClientSettings] = None):
+        self.base_url = base_url.rstrip("/")
+        self.settings = settings or OllamaClientSettings()
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(
+                self.settings.read_timeout,
+                connect=self.settings.connect_timeout,
+            ),
+            # httpx 只对连接失败重试，与同步客户端 read=0 的策略一致；
+            # 传入 transport 时客户端级别的 limits 不生效，连接池上限必须设置在 transport 上
+            transport=httpx.AsyncHTTPTransport(
+                retries=self.settings.max_retries,
+                limits=httpx.Limits(
+                    max_connections=self.settings.pool_maxsize,
+                    max_keepalive_connections=self.settings.pool_maxsize,
+                ),
+            ),
+        )
+
+    async def get(self, path: str, api_key: Optional[str] = None, **kwargs) -> httpx.Response:
+        """发送GET请求"""
+        return await self.client.get(path, headers=OllamaClient._headers(api_key), **kwargs)
+
+    async def post(
+        self,
+        path: str,
+        payload: Dict[str, Any],
+        api_key: Optional[str] = None,
+        **kwargs
+    ) -> httpx.Response:
+        """发送POST请求，payload 以JSON形式提交"""
+        return await self.client.post(
+            path,
+            headers=OllamaClient._headers(api_key),
+            json=payload,
+            **kwargs
+        )
+
+    def stream(self, path: str, payload: Dict[str, Any], api_key: Optional[str] = None, **kwargs):
+        """以流式方式发送POST请求，返回 async with 可用的响应上下文"""
+        return self.client.stream(
+            "POST",
+            path,
+            headers=OllamaClient._headers(api_key),
+            json=payload,
+            **kwargs
+        )
+
+    async def list_models(self, api_key: Optional[str] = None) -> List[str]:
+        """返回Ollama中已下载的模型名称列表"""
+        response = await self.get("/api/tags", api_key=api_key)
+        response.raise_for_status()
+        return [model.get("name") for model in response.json().get("models", [])]
+
+    async def aclose(self):
+        """关闭客户端并释放连接"""
+        await self.client.aclose()
+
+
+_clients: Dict[Tuple[str, str], OllamaClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_ollama_client(base_url: str, settings: Optional[Dict[str, Any]] = None) -> OllamaClient:
+    """获取共享的Ollama客户端
+
+    相同 base_url 和配置的调用方共享同一个连接池。
+
+    Args:
+        base_url: Ollama API地址
+        settings: models.http 配置字典
+
+    Returns:
+        OllamaClient: 共享客户端实例
+    """
+    client_settings = OllamaClientSettings(**(settings or {}))
+    key = (base_url.rstrip("/"), client_settings.model_dump_json())
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OllamaClient(base_url, client_settings)
+            _clients[key] = client
+        return client
+
+
+def close_all_clients():
+    """关闭所有共享客户端"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], AsyncOllamaClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_ollama_client(
+    base_url: str,
+    settings: Optional[Dict[str, Any]] = None
+) -> AsyncOllamaClient:
+    """获取当前事件循环共享的异步Ollama客户端
+
+    httpx 的连接池不能跨事件循环使用，因此按事件循环分别缓存。
+    必须在协程中调用。
+    """
+    client_settings = OllamaClientSettings(**(settings or {}))
+    key = (base_url.rstrip("/"), client_settings.model_dump_json())
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        loop_clients = _async_clients.setdefault(loop, {})
+        client = loop_clients.get(key)
+        if client is None:
+            client = AsyncOllamaClient(base_url, client_settings)
+            loop_clients[key] = client
+        return client
@@ -0,0 +1,159 @@
+"""
+模型注册表模块
+统一管理文本和视觉模型：按需懒加载模型封装，后台带超时地探测Ollama服务，
+避免启动时的同步HTTP探测阻塞界面
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Any
+from models.config import load_config
+from models.ollama_client import get_ollama_client
+from models.text_agent import TextAgent
+from models.image import ImageModel
+
+
+class ModelRegistry:
+    """文本/视觉模型注册表
+
+    - text_model / vision_model 在首次访问时创建，创建过程不发起网络请求
+    - start_probe() 在后台线程探测每个Ollama地址一次，结果通过 status() 查询
+    """
+
+    def __init__(self, config_path: str = "config.yaml"):
+        self.config_path = config_path
+        self.config = load_config(config_path)
+        registry_config = self.config.get("models", {}).get("registry", {})
+        self.probe_timeout = registry_config.get("probe_timeout", 3)
+
+        self._models: Dict[str, Any] = {}
+        self._errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        # 探测状态: pending / ok / degraded / unreachable
+        self._probe_status = "pending"
+        self._available_models: Dict[str, List[str]] = {}
+        self._probe_errors: Dict[str, str] = {}
+        # 探测后确认在所有可达后端上都不存在的模型，按任务路由时不再使用
+        self._missing: set = set()
+        self._probe_done = threading.Event()
+        self._probe_thread: Optional[threading.Thread] = None
+
+    def _get_or_create(self, kind: str, factory) -> Optional[Any]:
+        """懒加载模型封装，失败时记录错误并返回None"""
+        with self._lock:
+            if kind in self._models:
+                return self._models[kind]
+            if kind in self._errors:
+                return None
+            try:
+                model = factory(self.config_path, check_service=False)
+                self._models[kind] = model
+                return model
+            except Exception as e:
+                print(f"{'视觉' if kind == 'vision' else '文本'}模型加载失败: {e}")
+                self._errors[kind] = str(e)
+                return None
+
+    @property
+    def text_model(self) -> Optional[TextAgent]:
+        """文本模型，配置错误时为None"""
+        return self._get_or_create("text", TextAgent.from_config)
+
+    @property
+    def small_text_model(self) -> Optional[TextAgent]:
+        """处理关键词提取等短任务的小模型（models.text_small），未配置、加载失败或探测到Ollama中没有该模型时为None"""
+        if not self.config.get("models", {}).get("text_small"):
+            return None
+        if "text_small" in self._missing:
+            return None
+        return self._get_or_create(
+            "text_small",
+            lambda config_path, check_service: TextAgent.from_config(config_path, check_service, section="text_small")
+        )
+
+    def text_model_for(self, tier: str) -> Optional[TextAgent]:
+        """按档位取文本模型：small 为小模型，不可用时退回主文本模型"""
+        if tier == "small":
+            return self.small_text_model or self.text_model
+        return self.text_model
+
+    @property
+    def vision_model(self) -> Optional[ImageModel]:
+        """视觉模型，配置错误时为None"""
+        return self._get_or_create("vision", ImageModel.from_config)
+
+    def start_probe(self):
+        """在后台线程探测Ollama服务，不阻塞调用方"""
+        if self._probe_thread is not None:
+            return
+        self._probe_thread = threading.Thread(target=self._probe, name="ollama-probe", daemon=True)
+        self._probe_thread.start()
+
+    def wait_for_probe(self, timeout: Optional[float] = None) -> bool:
+        """等待探测完成，返回是否已完成"""
+        return self._probe_done.wait(timeout)
+
+    def _probe(self):
+        """逐个地址探测 /api/tags，同一地址只探测一次"""
+        try:
+            models = [m for m in (self.text_model, self.small_text_model, self.vision_model) if m is not None]
+            for base_url in dict.fromkeys(url for m in models for url in m.backend_urls):
+                client = get_ollama_client(base_url, self.config.get("models", {}).get("http", {}))
+                try:
+                    self._available_models[base_url] = client.list_models(
+                        timeout=(self.probe_timeout, self.probe_timeout)
+                    )
+                except Exception as e:
+                    self._probe_errors[base_url] = str(e)
+                    print(f"⚠️ 无法连接到Ollama服务 ({base_url}): {e}")
+                    print("请确保Ollama服务已启动，命令: 'ollama serve'")
+
+            for model in models:
+                found = probed = False
+                for base_url in model.backend_urls:
+                    available = self._available_models.get(base_url)
+                    if available is None:
+                        continue
+                    probed = True
+                    if model.model_name in available:
+                        found = True
+                        print(f"✅ 模型 {model.model_name} 已在Ollama中可用 ({base_url})")
+                    elif model is not self._models.get("text_small"):
+                        print(f"⚠️ 模型 {model.model_name} 在Ollama中不可用 ({base_url})，将尝试在首次使用时拉取")
+                if probed and not found and model is self._models.get("text_small"):
+                    # 小模型是可选的：没有安装时短任务改用主文本模型，不去拉取
+                    self._missing.add("text_small")
+                    print(f"⚠️ 小模型 {model.model_name} 在Ollama中不可用，短任务改用主文本模型")
+
+            if not self._probe_errors:
+                self._probe_status = "ok"
+            else:
+                # 多后端时部分地址不可用只算降级，请求会被路由到其他后端
+                self._probe_status = "degraded" if self._available_models else "unreachable"
+        finally:
+            self._probe_done.set()
+
+    def status(self) -> Dict[str, Any]:
+        """返回探测状态、可用模型列表和加载错误"""
+        return {
+            "probe": self._probe_status,
+            "available_models": dict(self._available_models),
+            "probe_errors": dict(self._probe_errors),
+            "load_errors": dict(self._errors)
+        }
+
+
+_registries: Dict[str, ModelRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(config_path: str = "config.yaml") -> ModelRegistry:
+    """获取进程共享的模型注册表，首次获取时启动后台探测"""
+    key = os.path.abspath(config_path)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = ModelRegistry(config_path)
+            registry.start_probe()
+            _registries[key] = registry
+        return registry
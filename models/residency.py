@@ -0,0 +1,151 @@
+"""
+模型驻留管理模块
+启动时预加载模型，并在后台定期检查 /api/ps，在模型即将被Ollama卸载前重新预热。
+预热请求与生成请求一样占用准入名额，不会让后端超过并发上限
+"""
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Any
+from models.admission import ServerBusyError, get_limiter
+
+
+def _parse_expires_at(value: str) -> Optional[datetime]:
+    """解析Ollama返回的 expires_at（纳秒精度的ISO时间）"""
+    if not value:
+        return None
+    # Python 只支持到微秒，截断多余的小数位
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def warmup_backend(model: Any, client: Any, wait: bool = True) -> Dict[str, Any]:
+    """在后端的准入名额内预加载模型
+
+    Args:
+        model: 具有 model_name、keep_alive、api_key、admission_settings 的模型封装
+        client: 该后端的Ollama客户端
+        wait: 没有空闲名额时是否排队；为False时跳过本次预热（返回 skipped=True），
+              用于后台驻留检查：后端繁忙时模型通常正在使用，不必与用户请求争抢名额
+
+    Returns:
+        Dict: 与 OllamaClient.warmup 相同
+    """
+    limiter = get_limiter(client.base_url, model.admission_settings, getattr(model, "admission_lane", None))
+    if limiter is None:
+        return client.warmup(model.model_name, model.keep_alive, api_key=model.api_key)
+    if not wait:
+        if not limiter.try_acquire():
+            return {"model": model.model_name, "ok": False, "skipped": True, "seconds": 0.0, "error": "后端繁忙"}
+        try:
+            return client.warmup(model.model_name, model.keep_alive, api_key=model.api_key)
+        finally:
+            limiter.release()
+    try:
+        with limiter.slot():
+            return client.warmup(model.model_name, model.keep_alive, api_key=model.api_key)
+    except ServerBusyError as e:
+        return {"model": model.model_name, "ok": False, "seconds": 0.0, "error": str(e)}
+
+
+def warmup_models(models: List[Any]) -> List[Dict[str, Any]]:
+    """依次预加载模型并打印冷启动耗时
+
+    Args:
+        models: 具有 warmup() 方法的模型封装（TextAgent、ImageModel）
+
+    Returns:
+        List[Dict]: 每个模型的预热结果
+    """
+    report = []
+    for model in models:
+        result = model.warmup()
+        report.append(result)
+        if result["ok"]:
+            print(
+                f"🔥 模型 {result['model']} 预热完成: 总耗时 {result['seconds']:.2f}s，"
+                f"加载耗时 {result['load_seconds']:.2f}s"
+            )
+        else:
+            print(f"⚠️ 模型 {result['model']} 预热失败: {result['error']}")
+    return report
+
+
+class ModelKeeper:
+    """后台驻留线程
+
+    每隔 check_interval 秒查询一次 /api/ps，模型未加载或距离过期不足
+    refresh_margin 秒时重新预热，避免空闲后的首个请求承担加载耗时。
+    """
+
+    def __init__(self, models: List[Any], check_interval: float = 60, refresh_margin: float = 120):
+        """
+        Args:
+            models: 具有 clients、model_name、keep_alive 的模型封装
+            check_interval: 检查间隔（秒）
+            refresh_margin: 距离过期多少秒内重新预热
+        """
+        self.models = models
+        self.check_interval = check_interval
+        self.refresh_margin = refresh_margin
+        self.rewarm_count = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动后台线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-model-keeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.check_interval)
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            self.check_once()
+
+    def check_once(self):
+        """检查一次所有模型在每个后端上的驻留状态"""
+        now = datetime.now(timezone.utc)
+        for model in list(self.models):
+            for client in model.clients:
+                try:
+                    loaded = {
+                        item.get("name"): _parse_expires_at(item.get("expires_at", ""))
+                        for item in client.running_models(api_key=model.api_key)
+                    }
+                except Exception as e:
+                    print(f"⚠️ 查询模型驻留状态失败 ({model.model_name} @ {client.base_url}): {e}")
+                    continue
+
+                expires_at = loaded.get(model.model_name)
+                if model.model_name in loaded and (
+                    expires_at is None or (expires_at - now).total_seconds() > self.refresh_margin
+                ):
+                    continue
+
+                result = warmup_backend(model, client, wait=False)
+                if result.get("skipped"):
+                    continue
+                if result["ok"]:
+                    self.rewarm_count += 1
+                    print(
+                        f"🔥 模型 {model.model_name} 即将被卸载，已重新预热 "
+                        f"({client.base_url}, {result['seconds']:.2f}s)"
+                    )
+                elif result.get("status") == 404:
+                    # 模型未安装（如未拉取的可选小模型），不再每轮重试
+                    self.models.remove(model)
+                    print(f"⚠️ 模型 {model.model_name} 在Ollama中不存在 ({client.base_url})，停止驻留")
+                    break
+                else:
+                    print(f"⚠️ 模型 {model.model_name} 重新预热失败 ({client.base_url}): {result['error']}")
@@ -0,0 +1,231 @@
+"""
+文本生成结果缓存模块
+按模型名、提示词和生成参数做内容寻址，内存LRU + SQLite持久化两级缓存
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Tuple
+
+# 持久层读取命中时的访问时间先记在内存中，累计到该数量或写入时再批量更新
+_ACCESS_FLUSH_SIZE = 64
+# 持久层超过容量时多淘汰的比例，之后的若干次写入不必再统计条目数
+_EVICT_SLACK = 0.05
+
+
+class ResponseCache:
+    """两级生成结果缓存
+
+    - 内存层: OrderedDict 实现的LRU，命中时毫秒级返回
+    - 持久层: SQLite，进程重启后仍然可用，按最近访问时间淘汰
+    两层共用同一个TTL，过期条目在读取时删除。
+    持久层的条目数在内存中计数，访问时间批量写回，读取命中时不提交事务。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: Optional[float] = 3600,
+        sqlite_path: Optional[str] = None,
+        sqlite_max_entries: int = 5000
+    ):
+        """
+        Args:
+            max_entries: 内存层最多保存的条目数
+            ttl: 条目有效期（秒），None 表示永不过期
+            sqlite_path: SQLite文件路径，None 表示只使用内存层
+            sqlite_max_entries: 持久层最多保存的条目数
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sqlite_path = sqlite_path
+        self.sqlite_max_entries = sqlite_max_entries
+
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "sqlite_hits": 0, "misses": 0, "evictions": 0}
+
+        self._conn = None
+        self._sqlite_count = 0
+        self._pending_access: Dict[str, float] = {}
+        if sqlite_path:
+            self._conn = self._open_sqlite(sqlite_path)
+            self._sqlite_count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def _open_sqlite(path: str) -> sqlite3.Connection:
+        """打开（必要时创建）SQLite缓存库"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        conn.commit()
+        return conn
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, options: Optional[Dict[str, Any]] = None, **extra) -> str:
+        """根据模型名、提示词和生成参数计算缓存键"""
+        payload = {
+            "model": model_name,
+            "prompt": prompt,
+            "options": options or {},
+        }
+        payload.update(extra)
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created_at = row
+                    if not self._expired(created_at, now):
+                        self._pending_access[key] = now
+                        if len(self._pending_access) >= _ACCESS_FLUSH_SIZE:
+                            self._flush_access()
+                            self._conn.commit()
+                        self._put_memory(key, value, created_at)
+                        self._stats["sqlite_hits"] += 1
+                        return value
+                    self._pending_access.pop(key, None)
+                    self._sqlite_count -= self._conn.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount
+                    self._conn.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str):
+        """写入缓存（同时写入两层）"""
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, value, now)
+            if self._conn is not None:
+                self._pending_access.pop(key, None)
+                self._flush_access()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                # 覆盖已有条目时计数偏大，淘汰前会重新统计
+                self._sqlite_count += 1
+                if self._sqlite_count > self.sqlite_max_entries:
+                    self._evict_sqlite()
+                self._conn.commit()
+
+    def _put_memory(self, key: str, value: str, created_at: float):
+        """写入内存层，超过容量时淘汰最久未访问的条目"""
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _flush_access(self):
+        """把读取命中的访问时间批量写回持久层（由调用方提交）"""
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE responses SET last_access = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._pending_access.items()]
+            )
+            self._pending_access.clear()
+
+    def _evict_sqlite(self):
+        """持久层超过容量时按最近访问时间淘汰，多淘汰一小部分，避免之后每次写入都要淘汰"""
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.sqlite_max_entries
+        if overflow > 0:
+            overflow = min(count, overflow + int(self.sqlite_max_entries * _EVICT_SLACK))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+            self._stats["evictions"] += overflow
+            count -= overflow
+        self._sqlite_count = count
+
+    def purge_expired(self) -> int:
+        """删除所有过期条目，返回删除数量"""
+        if self.ttl is None:
+            return 0
+        cutoff = time.time() - self.ttl
+        removed = 0
+        with self._lock:
+            for key in [k for k, (_, created_at) in self._memory.items() if created_at < cutoff]:
+                del self._memory[key]
+                removed += 1
+            if self._conn is not None:
+                self._flush_access()
+                cursor = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+                self._conn.commit()
+                removed += cursor.rowcount
+                self._sqlite_count -= cursor.rowcount
+        return removed
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._pending_access.clear()
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+                self._sqlite_count = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中计数和当前容量"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            if self._conn is not None:
+                stats["sqlite_entries"] = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        hits = stats["memory_hits"] + stats["sqlite_hits"]
+        total = hits + stats["misses"]
+        stats["hit_rate"] = hits / total if total else 0.0
+        return stats
+
+    @classmethod
+    def from_config(cls, cache_config: Optional[Dict[str, Any]]) -> Optional["ResponseCache"]:
+        """根据 models.text.cache 配置创建缓存，未启用时返回None"""
+        if not cache_config or not cache_config.get("enabled", False):
+            return None
+        return cls(
+            max_entries=cache_config.get("max_entries", 256),
+            ttl=cache_config.get("ttl", 3600),
+            sqlite_path=cache_config.get("sqlite_path"),
+            sqlite_max_entries=cache_config.get("sqlite_max_entries", 5000)
+        )
@@ -3,20 +3,54 @@
 使用Ollama运行Qwen2.5模型
 """
 import os
-import yaml
 import json
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import Dict, List, Optional, Any, Iterator, AsyncIterator, Union, Tuple
+import httpx
 import requests
-from typing import Dict, List, Optional, Any
 from langchain_core.language_models.llms import LLM
-from langchain_core.callbacks.manager import CallbackManagerForLLMRun
+from langchain_core.callbacks.manager import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.outputs import GenerationChunk
 from pydantic import BaseModel, Field
+from models.config import load_config
+from models.ollama_client import (
+    AsyncOllamaClient,
+    OllamaClient,
+    get_async_ollama_client,
+    get_ollama_client,
+)
+from models.response_cache import ResponseCache
+from models.generation_metrics import record_generation
+from models.admission import ServerBusyError, get_limiter
+from models.residency import warmup_backend
+from models.backend_pool import (
+    BackendLease,
+    BackendPool,
+    HedgeAttempt,
+    acall_with_hedge,
+    call_with_hedge,
+    get_backend_pool,
+    remaining_time,
+)
 
 class TextAgent(LLM, BaseModel):
     """封装Ollama中的Qwen2.5模型为LangChain可用的LLM"""
     
     model_name: str = Field(..., description="模型名称")
     base_url: str = Field("http://localhost:11434", description="Ollama API地址")
+    base_urls: List[str] = Field(default_factory=list, description="多个Ollama地址（负载均衡），为空时只使用 base_url")
     api_key: Optional[str] = Field(None, description="API密钥（如果需要）")
+    http_settings: Dict[str, Any] = Field(default_factory=dict, description="连接池、超时和重试配置")
+    admission_settings: Dict[str, Any] = Field(default_factory=dict, description="并发上限和排队配置")
+    admission_lane: Optional[str] = Field(None, description="独立的准入名额名称，为空时与同一地址的其他模型共享名额")
+    balancer_settings: Dict[str, Any] = Field(default_factory=dict, description="多后端选择策略和健康探测配置")
+    check_service: bool = Field(True, description="初始化时是否同步检查Ollama服务")
+    keep_alive: Optional[Union[str, int]] = Field(None, description="请求后模型在内存中的保留时间，如 30m，-1 表示常驻")
+    response_cache: Optional[ResponseCache] = Field(None, description="生成结果缓存（可选）")
     
     class Config:
         """Pydantic配置"""
@@ -25,27 +59,152 @@ class TextAgent(LLM, BaseModel):
     def __init__(self, **kwargs):
         """初始化模型"""
         super().__init__(**kwargs)
-        # 检查Ollama服务是否可用
-        self._check_ollama_service()
+        # 检查Ollama服务是否可用（由 ModelRegistry 创建时改为后台探测）
+        if self.check_service:
+            self._check_ollama_service()
+    
+    @property
+    def backend_urls(self) -> List[str]:
+        """所有Ollama地址"""
+        return self.base_urls or [self.base_url]
+    
+    @property
+    def client(self) -> OllamaClient:
+        """第一个Ollama地址的连接池客户端"""
+        return get_ollama_client(self.backend_urls[0], self.http_settings)
+    
+    @property
+    def clients(self) -> List[OllamaClient]:
+        """所有Ollama地址的连接池客户端"""
+        return [get_ollama_client(url, self.http_settings) for url in self.backend_urls]
+    
+    @property
+    def async_client(self) -> AsyncOllamaClient:
+        """当前事件循环共享的异步Ollama客户端（第一个地址）"""
+        return get_async_ollama_client(self.backend_urls[0], self.http_settings)
+    
+    @property
+    def pool(self) -> BackendPool:
+        """地址列表相同的模型共享的后端池"""
+        return get_backend_pool(self.backend_urls, self.balancer_settings, self.http_settings)
+    
+    @contextmanager
+    def _backend(
+        self,
+        exclude: Tuple[str, ...] = (),
+        deadline: Optional[float] = None,
+        prefer: Optional[str] = None,
+        state: Optional[HedgeAttempt] = None
+    ) -> Iterator[BackendLease]:
+        """选择后端并在该后端上排队获取准入名额，排队时间不超过截止时间
+
+        state 记录选中的后端（排队之前）和获得名额的时间，供对冲请求排除该后端并从获得名额开始计时。
+        """
+        with self.pool.lease(exclude, prefer, deadline) as lease:
+            if state is not None:
+                state.choose(lease.url)
+            limiter = get_limiter(lease.url, self.admission_settings, self.admission_lane)
+            with limiter.slot(remaining_time(deadline)) if limiter is not None else nullcontext():
+                if state is not None:
+                    state.admit()
+                yield lease
+    
+    @asynccontextmanager
+    async def _abackend(
+        self,
+        exclude: Tuple[str, ...] = (),
+        deadline: Optional[float] = None,
+        state: Optional[HedgeAttempt] = None
+    ) -> AsyncIterator[BackendLease]:
+        """异步版本的 _backend"""
+        with self.pool.lease(exclude, deadline=deadline) as lease:
+            if state is not None:
+                state.choose(lease.url)
+            limiter = get_limiter(lease.url, self.admission_settings, self.admission_lane)
+            async with limiter.aslot(remaining_time(deadline)) if limiter is not None else nullcontext():
+                if state is not None:
+                    state.admit()
+                yield lease
+    
+    @staticmethod
+    def _backend_url(response: Any) -> str:
+        """从响应的请求地址中取出Ollama地址（对冲时可能不是首选后端）"""
+        return str(response.url).split("/api/", 1)[0]
+    
+    @staticmethod
+    def _deadline(timeout: Optional[float]) -> Optional[float]:
+        """把调用时限（秒）换算为截止时间"""
+        return time.monotonic() + timeout if timeout is not None else None
+    
+    @staticmethod
+    def _request_timeout(lease: BackendLease, deadline: Optional[float]) -> Dict[str, Any]:
+        """有截止时间时把读取超时缩短为剩余时间"""
+        if deadline is None:
+            return {}
+        return {"timeout": (lease.client.settings.connect_timeout, remaining_time(deadline))}
+    
+    @staticmethod
+    def _arequest_timeout(lease: BackendLease, deadline: Optional[float]) -> Dict[str, Any]:
+        """异步版本的 _request_timeout"""
+        if deadline is None:
+            return {}
+        return {"timeout": httpx.Timeout(remaining_time(deadline), connect=lease.async_client.settings.connect_timeout)}
+    
+    def _post_generate(self, request_data: Dict[str, Any], timeout: Optional[float] = None) -> requests.Response:
+        """发送非流式 /api/generate 请求，按配置向另一个后端发送对冲请求"""
+        deadline = self._deadline(timeout)
+        
+        def attempt(exclude: Tuple[str, ...], state: HedgeAttempt) -> requests.Response:
+            with self._backend(exclude, deadline, state=state) as lease:
+                response = lease.client.post(
+                    "/api/generate", request_data, api_key=self.api_key,
+                    **self._request_timeout(lease, deadline)
+                )
+                if response.status_code >= 500:
+                    lease.fail(f"HTTP {response.status_code}")
+                return response
+        
+        return call_with_hedge(self.pool, self.model_name, attempt, lambda r: r.status_code == 200)
+    
+    async def _apost_generate(self, request_data: Dict[str, Any], timeout: Optional[float] = None) -> httpx.Response:
+        """异步版本的 _post_generate，对冲成功后取消另一个请求"""
+        deadline = self._deadline(timeout)
+        
+        async def attempt(exclude: Tuple[str, ...], state: HedgeAttempt) -> httpx.Response:
+            async with self._abackend(exclude, deadline, state=state) as lease:
+                response = await lease.async_client.post(
+                    "/api/generate", request_data, api_key=self.api_key,
+                    **self._arequest_timeout(lease, deadline)
+                )
+                if response.status_code >= 500:
+                    lease.fail(f"HTTP {response.status_code}")
+                return response
+        
+        return await acall_with_hedge(self.pool, self.model_name, attempt, lambda r: r.status_code == 200)
     
     def _check_ollama_service(self):
         """检查Ollama服务是否可用"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags")
-            if response.status_code == 200:
-                available_models = response.json().get("models", [])
-                model_names = [model.get("name") for model in available_models]
-                
-                # 检查模型是否已下载
-                if self.model_name in model_names:
-                    print(f"✅ 模型 {self.model_name} 已在Ollama中可用")
-                else:
-                    print(f"⚠️ 模型 {self.model_name} 在Ollama中不可用，将尝试在首次使用时拉取")
-            else:
-                print(f"⚠️ Ollama服务响应异常: {response.status_code}")
-        except Exception as e:
-            print(f"⚠️ 无法连接到Ollama服务 ({self.base_url}): {e}")
-            print("请确保Ollama服务已启动，命令: 'ollama serve'")
+        for client in self.clients:
+            client.check_model(self.model_name, api_key=self.api_key)
+    
+    def warmup(self) -> Dict[str, Any]:
+        """预加载模型（每个后端各一次），返回冷启动耗时"""
+        results = [warmup_backend(self, client) for client in self.clients]
+        if len(results) == 1:
+            return results[0]
+        
+        failed = [r for r in results if not r["ok"]]
+        combined = {
+            "model": self.model_name,
+            "ok": not failed,
+            "seconds": max(r["seconds"] for r in results),
+            "backends": results
+        }
+        if failed:
+            combined["error"] = "; ".join(r["error"] for r in failed)
+        else:
+            combined["load_seconds"] = max(r["load_seconds"] for r in results)
+        return combined
     
     @property
     def _llm_type(self) -> str:
@@ -59,64 +218,377 @@ class TextAgent(LLM, BaseModel):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs
     ) -> str:
-        """执行模型推理，调用Ollama API"""
-        # 构建请求数据
-        request_data = {
-            "model": self.model_name,
-            "prompt": prompt,
-            "stream": False,
-            "options": {}
-        }
+        """执行模型推理，调用Ollama API
+
+        kwargs 中的 system 为固定的系统前缀，format 为结构化输出格式（"json" 或 JSON Schema），
+        timeout 为本次调用的时限（秒，包括排队），
+        metrics_sink 为收集本次生成耗时指标（GenerationMetrics）的列表
+        """
+        request_data = self._build_request_data(prompt, stop, stream=False, **kwargs)
+        cache_key = self._cache_key(request_data)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
-        # 添加生成参数
-        if "temperature" in kwargs:
-            request_data["options"]["temperature"] = kwargs["temperature"]
-        if "top_p" in kwargs:
-            request_data["options"]["top_p"] = kwargs["top_p"]
-        if "max_tokens" in kwargs:
-            request_data["options"]["num_predict"] = kwargs["max_tokens"]
+        # 发送请求（排队等待准入名额）
+        try:
+            response = self._post_generate(request_data, kwargs.get("timeout"))
+            
+            if response.status_code == 200:
+                result = response.json()
+                record_generation(
+                    self.model_name, result, self._backend_url(response), kwargs.get("metrics_sink")
+                )
+                text = result.get("response", "")
+                if cache_key:
+                    self.response_cache.set(cache_key, text)
+                return text
+            else:
+                error_msg = f"Ollama API错误: {response.status_code} - {response.text}"
+                print(error_msg)
+                return f"模型调用失败: {error_msg}"
+        except ServerBusyError as e:
+            print(f"⚠️ {e}")
+            return str(e)
+        except Exception as e:
+            error_msg = f"调用Ollama API时发生错误: {str(e)}"
+            print(error_msg)
+            return f"模型调用失败: {error_msg}"
+    
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs
+    ) -> Iterator[GenerationChunk]:
+        """流式推理，逐行解析Ollama返回的NDJSON并逐个产出token"""
+        request_data = self._build_request_data(prompt, stop, stream=True, **kwargs)
+        cache_key = self._cache_key(request_data)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                # 命中缓存时整段返回，不再逐token生成
+                yield GenerationChunk(text=cached, generation_info={"done": True, "cached": True})
+                return
         
-        # 发送请求
+        generated = []
         try:
-            headers = {}
-            if self.api_key:
-                headers["Authorization"] = f"Bearer {self.api_key}"
+            deadline = self._deadline(kwargs.get("timeout"))
+            with self._backend(deadline=deadline) as lease, lease.client.post(
+                "/api/generate", request_data, api_key=self.api_key, stream=True,
+                **self._request_timeout(lease, deadline)
+            ) as response:
+                if response.status_code != 200:
+                    if response.status_code >= 500:
+                        lease.fail(f"HTTP {response.status_code}")
+                    error_msg = f"Ollama API错误: {response.status_code} - {response.text}"
+                    print(error_msg)
+                    yield GenerationChunk(text=f"模型调用失败: {error_msg}")
+                    return
                 
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                headers=headers,
-                json=request_data
-            )
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if "error" in data:
+                        error_msg = f"Ollama API错误: {data['error']}"
+                        print(error_msg)
+                        yield GenerationChunk(text=f"模型调用失败: {error_msg}")
+                        return
+                    
+                    chunk = GenerationChunk(
+                        text=data.get("response", ""),
+                        generation_info=data if data.get("done") else None
+                    )
+                    if run_manager:
+                        run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    generated.append(chunk.text)
+                    yield chunk
+                    
+                    if data.get("done"):
+                        record_generation(
+                            self.model_name, data, lease.url, kwargs.get("metrics_sink")
+                        )
+                        if cache_key:
+                            self.response_cache.set(cache_key, "".join(generated))
+                        break
+        except ServerBusyError as e:
+            print(f"⚠️ {e}")
+            yield GenerationChunk(text=str(e))
+        except Exception as e:
+            error_msg = f"调用Ollama API时发生错误: {str(e)}"
+            print(error_msg)
+            yield GenerationChunk(text=f"模型调用失败: {error_msg}")
+    
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs
+    ) -> str:
+        """异步执行模型推理，不占用工作线程"""
+        request_data = self._build_request_data(prompt, stop, stream=False, **kwargs)
+        cache_key = self._cache_key(request_data)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        try:
+            response = await self._apost_generate(request_data, kwargs.get("timeout"))
             
             if response.status_code == 200:
                 result = response.json()
-                return result.get("response", "")
+                record_generation(
+                    self.model_name, result, self._backend_url(response), kwargs.get("metrics_sink")
+                )
+                text = result.get("response", "")
+                if cache_key:
+                    self.response_cache.set(cache_key, text)
+                return text
             else:
                 error_msg = f"Ollama API错误: {response.status_code} - {response.text}"
                 print(error_msg)
                 return f"模型调用失败: {error_msg}"
+        except ServerBusyError as e:
+            print(f"⚠️ {e}")
+            return str(e)
         except Exception as e:
             error_msg = f"调用Ollama API时发生错误: {str(e)}"
             print(error_msg)
             return f"模型调用失败: {error_msg}"
+    
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs
+    ) -> AsyncIterator[GenerationChunk]:
+        """异步流式推理"""
+        request_data = self._build_request_data(prompt, stop, stream=True, **kwargs)
+        cache_key = self._cache_key(request_data)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                # 命中缓存时整段返回，不再逐token生成
+                yield GenerationChunk(text=cached, generation_info={"done": True, "cached": True})
+                return
+        
+        generated = []
+        try:
+            deadline = self._deadline(kwargs.get("timeout"))
+            async with self._abackend(deadline=deadline) as lease, lease.async_client.stream(
+                "/api/generate", request_data, api_key=self.api_key,
+                **self._arequest_timeout(lease, deadline)
+            ) as response:
+                if response.status_code != 200:
+                    if response.status_code >= 500:
+                        lease.fail(f"HTTP {response.status_code}")
+                    body = (await response.aread()).decode("utf-8", errors="replace")
+                    error_msg = f"Ollama API错误: {response.status_code} - {body}"
+                    print(error_msg)
+                    yield GenerationChunk(text=f"模型调用失败: {error_msg}")
+                    return
+                
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if "error" in data:
+                        error_msg = f"Ollama API错误: {data['error']}"
+                        print(error_msg)
+                        yield GenerationChunk(text=f"模型调用失败: {error_msg}")
+                        return
+                    
+                    chunk = GenerationChunk(
+                        text=data.get("response", ""),
+                        generation_info=data if data.get("done") else None
+                    )
+                    if run_manager:
+                        await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    generated.append(chunk.text)
+                    yield chunk
+                    
+                    if data.get("done"):
+                        record_generation(
+                            self.model_name, data, lease.url, kwargs.get("metrics_sink")
+                        )
+                        if cache_key:
+                            self.response_cache.set(cache_key, "".join(generated))
+                        break
+        except ServerBusyError as e:
+            print(f"⚠️ {e}")
+            yield GenerationChunk(text=str(e))
+        except Exception as e:
+            error_msg = f"调用Ollama API时发生错误: {str(e)}"
+            print(error_msg)
+            yield GenerationChunk(text=f"模型调用失败: {error_msg}")
+    
+    def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        prefer_backend: Optional[str] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """多轮对话流式推理（/api/chat），逐个产出token
+
+        系统提示词和历史消息不变时，Ollama会复用上一轮已处理的前缀，只需处理新增的消息。
+        出错时与 _stream 一样产出一条"模型调用失败"或"服务繁忙"信息。
+
+        Args:
+            messages: system/user/assistant 消息列表
+            prefer_backend: 优先使用的Ollama地址（会话上一轮所在的后端，缓存在该后端上）
+            kwargs: temperature、top_p、max_tokens、timeout 和 metrics_sink
+        """
+        request_data = self._build_chat_data(messages, stream=True, **kwargs)
+        try:
+            deadline = self._deadline(kwargs.get("timeout"))
+            with self._backend(deadline=deadline, prefer=prefer_backend) as lease, lease.client.post(
+                "/api/chat", request_data, api_key=self.api_key, stream=True,
+                **self._request_timeout(lease, deadline)
+            ) as response:
+                if response.status_code != 200:
+                    if response.status_code >= 500:
+                        lease.fail(f"HTTP {response.status_code}")
+                    error_msg = f"Ollama API错误: {response.status_code} - {response.text}"
+                    print(error_msg)
+                    yield f"模型调用失败: {error_msg}"
+                    return
+                
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if "error" in data:
+                        error_msg = f"Ollama API错误: {data['error']}"
+                        print(error_msg)
+                        yield f"模型调用失败: {error_msg}"
+                        return
+                    
+                    text = data.get("message", {}).get("content", "")
+                    if text:
+                        yield text
+                    
+                    if data.get("done"):
+                        record_generation(
+                            self.model_name, data, lease.url, kwargs.get("metrics_sink")
+                        )
+                        break
+        except ServerBusyError as e:
+            print(f"⚠️ {e}")
+            yield str(e)
+        except Exception as e:
+            error_msg = f"调用Ollama API时发生错误: {str(e)}"
+            print(error_msg)
+            yield f"模型调用失败: {error_msg}"
+    
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        prefer_backend: Optional[str] = None,
+        **kwargs
+    ) -> str:
+        """多轮对话推理，返回完整回答（参数同 stream_chat）"""
+        return "".join(self.stream_chat(messages, prefer_backend, **kwargs))
+    
+    def _cache_key(self, request_data: Dict[str, Any]) -> Optional[str]:
+        """计算缓存键，未启用缓存时返回None"""
+        if self.response_cache is None:
+            return None
+        extra = {key: request_data[key] for key in ("system", "format") if key in request_data}
+        return ResponseCache.make_key(self.model_name, request_data["prompt"], request_data["options"], **extra)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计，未启用缓存时返回空字典"""
+        return self.response_cache.stats() if self.response_cache is not None else {}
+    
+    def _build_request_data(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        stream: bool = False,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """构建 /api/generate 请求数据"""
+        request_data = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "options": self._build_options(stop, **kwargs)
+        }
+        if self.keep_alive is not None:
+            request_data["keep_alive"] = self.keep_alive
+        if kwargs.get("system"):
+            # 固定的系统前缀单独发送，Ollama可以复用已缓存的前缀
+            request_data["system"] = kwargs["system"]
+        if kwargs.get("format"):
+            # "json" 或 JSON Schema，要求模型输出结构化结果
+            request_data["format"] = kwargs["format"]
+        
+        return request_data
+    
+    def _build_chat_data(
+        self,
+        messages: List[Dict[str, str]],
+        stream: bool = False,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """构建 /api/chat 请求数据"""
+        stop = kwargs.pop("stop", None)
+        request_data = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": stream,
+            "options": self._build_options(stop, **kwargs)
+        }
+        if self.keep_alive is not None:
+            request_data["keep_alive"] = self.keep_alive
+        
+        return request_data
+    
+    @staticmethod
+    def _build_options(stop: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        """生成参数"""
+        options = {}
+        if "temperature" in kwargs:
+            options["temperature"] = kwargs["temperature"]
+        if "top_p" in kwargs:
+            options["top_p"] = kwargs["top_p"]
+        if "max_tokens" in kwargs:
+            options["num_predict"] = kwargs["max_tokens"]
+        if stop:
+            options["stop"] = stop
+        return options
 
     @classmethod
-    def from_config(cls, config_path: str = "config.yaml"):
-        """从配置文件加载模型配置"""
-        if not os.path.exists(config_path):
-            raise FileNotFoundError(f"配置文件 {config_path} 不存在")
-            
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+    def from_config(cls, config_path: str = "config.yaml", check_service: bool = True, section: str = "text"):
+        """从配置文件加载模型配置
+
+        Args:
+            section: models 下的配置节，text 为主文本模型，text_small 为处理短任务的小模型
+        """
+        config = load_config(config_path)
             
-        model_config = config.get("models", {}).get("text", {})
+        model_config = config.get("models", {}).get(section, {})
         if not model_config:
-            raise ValueError("配置文件中缺少文本模型配置")
+            raise ValueError(f"配置文件中缺少文本模型配置 models.{section}")
             
         return cls(
             model_name=model_config.get("model_name", "qwen2.5:latest"),
             base_url=model_config.get("base_url", "http://localhost:11434"),
-            api_key=model_config.get("api_key")
+            base_urls=model_config.get("base_urls") or [],
+            balancer_settings=config.get("models", {}).get("balancer", {}),
+            api_key=model_config.get("api_key"),
+            check_service=check_service,
+            keep_alive=model_config.get("keep_alive"),
+            http_settings=config.get("models", {}).get("http", {}),
+            admission_settings=config.get("models", {}).get("admission", {}),
+            admission_lane=model_config.get("admission_lane"),
+            response_cache=ResponseCache.from_config(model_config.get("cache"))
         )
 
 # 测试代码
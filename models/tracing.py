@@ -0,0 +1,374 @@
+"""
+请求链路追踪模块
+为一次请求中的各个阶段（图像编码、视觉调用、文本调用、每个京东关键词搜索、商品HTML渲染）记录嵌套的span，
+包括耗时和payload大小，可导出为JSON Lines或OpenTelemetry（OTLP/JSON）记录，用于定位单个请求中最慢的阶段。
+当前span保存在contextvars中：同一线程和asyncio任务内自动嵌套，提交到线程池的函数需要用 bind_context 包装。
+结束的span放入队列，由后台线程批量写入一直打开的导出文件，请求线程不做文件IO
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import inspect
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from pydantic import BaseModel, Field
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("fashion_trace_span", default=None)
+
+
+class TracingSettings(BaseModel):
+    """链路追踪配置，对应 config.yaml 中的 tracing"""
+
+    enabled: bool = Field(False, description="是否记录span")
+    exporter: str = Field("jsonl", description="导出格式: jsonl（每行一个span）、otlp（每行一个OTLP/JSON导出请求）、none（只保留在内存中）")
+    path: str = Field("logs/traces.jsonl", description="导出文件路径")
+    sample_rate: float = Field(1.0, description="记录的请求比例，同一请求内的span一起采样")
+    service_name: str = Field("fashion-agent", description="OTLP记录中的 service.name")
+    keep_traces: int = Field(200, description="内存中保留最近多少个请求的span，供 get_trace 查询")
+
+
+class Span:
+    """一个阶段的耗时记录，attributes 中记录模型、关键词、payload大小等"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error", "_tracer")
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self._tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent else random.getrandbits(128).to_bytes(16, "big").hex()
+        self.span_id = random.getrandbits(64).to_bytes(8, "big").hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set(self, **attributes) -> "Span":
+        """补充属性，值为None的属性不记录"""
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+        return self
+
+    def end(self, error: Optional[BaseException] = None):
+        """结束并导出，重复调用无效"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self._tracer._finish(self)
+
+    @contextmanager
+    def activate(self) -> Iterator["Span"]:
+        """在当前上下文中把本span设为父span（不结束它）"""
+        token = _current_span.set(self)
+        try:
+            yield self
+        finally:
+            _reset(token)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/JSON 中的 Span 对象"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """未启用或未被采样时使用，所有操作都不记录"""
+
+    trace_id = None
+    span_id = None
+    sampled = False
+
+    def set(self, **attributes) -> "_NoopSpan":
+        return self
+
+    def end(self, error: Optional[BaseException] = None):
+        pass
+
+    @contextmanager
+    def activate(self) -> Iterator["_NoopSpan"]:
+        token = _current_span.set(self)
+        try:
+            yield self
+        finally:
+            _reset(token)
+
+
+_NOOP = _NoopSpan()
+
+
+def _reset(token: contextvars.Token):
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # 生成器在不同的上下文中恢复执行（如界面框架每一步换一个线程），无法还原时保持原样
+        pass
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+class Tracer:
+    """创建span，结束时保留最近的请求并交给后台线程导出到文件（线程安全）"""
+
+    def __init__(self, settings: Optional[TracingSettings] = None):
+        self.settings = settings or TracingSettings()
+        self._lock = threading.Lock()
+        self._traces: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+    def start_span(self, name: str, **attributes) -> Any:
+        """在当前span下创建子span（没有时开始一个新的请求），需要调用 end 结束"""
+        parent = _current_span.get()
+        if not self.settings.enabled or parent is _NOOP:
+            return _NOOP
+        if parent is None and random.random() >= self.settings.sample_rate:
+            return _NOOP
+        return Span(self, name, parent, {key: value for key, value in attributes.items() if value is not None})
+
+    def _finish(self, span: Span):
+        record = span.to_dict()
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.settings.keep_traces:
+                    self._traces.popitem(last=False)
+            spans.append(record)
+            if self.settings.exporter == "none" or not self.settings.path:
+                return
+            if self._writer is None:
+                self._queue = queue.Queue()
+                self._writer = threading.Thread(
+                    target=self._write_loop, args=(self._queue,), name="trace-writer", daemon=True
+                )
+                self._writer.start()
+            pending = self._queue
+        pending.put((span, record))
+
+    def _line(self, span: Span, record: Dict[str, Any]) -> str:
+        if self.settings.exporter == "otlp":
+            record = {
+                "resourceSpans": [{
+                    "resource": {"attributes": _otlp_attributes({"service.name": self.settings.service_name})},
+                    "scopeSpans": [{"scope": {"name": "fashion_agent"}, "spans": [span.to_otlp()]}]
+                }]
+            }
+        return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+    def _write_loop(self, pending: "queue.Queue[Optional[tuple]]"):
+        """后台写入线程：文件只打开一次，每次取出队列中积压的所有span一起写入，收到None时退出"""
+        handle = None
+        stopping = False
+        while not stopping:
+            batch = [pending.get()]
+            while True:
+                try:
+                    batch.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = None in batch
+            try:
+                lines = [self._line(*item) for item in batch if item is not None]
+                if lines:
+                    if handle is None:
+                        directory = os.path.dirname(self.settings.path)
+                        if directory:
+                            os.makedirs(directory, exist_ok=True)
+                        handle = open(self.settings.path, "a", encoding="utf-8")
+                    handle.write("".join(lines))
+                    handle.flush()
+            except Exception as e:
+                print(f"⚠️ 写入链路追踪记录失败: {str(e)}")
+            finally:
+                for _ in batch:
+                    pending.task_done()
+        if handle is not None:
+            handle.close()
+
+    def flush(self):
+        """等待已结束的span全部写入文件"""
+        self._queue.join()
+
+    def close(self):
+        """写完剩余的span后停止后台线程并关闭文件（之后结束的span会重新启动写入线程）"""
+        with self._lock:
+            writer, pending, self._writer = self._writer, self._queue, None
+        if writer is not None:
+            pending.put(None)
+            writer.join()
+
+    def get_trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        """一个请求中已结束的span，按开始时间排序"""
+        with self._lock:
+            spans = list(self._traces.get(trace_id, []))
+        return sorted(spans, key=lambda span: span["start"])
+
+
+_tracer = Tracer()
+
+
+def configure_tracing(settings: TracingSettings) -> Tracer:
+    """按配置替换进程内的追踪器，原追踪器写完剩余的span后关闭"""
+    global _tracer
+    previous, _tracer = _tracer, Tracer(settings)
+    previous.close()
+    return _tracer
+
+
+@atexit.register
+def _close_tracer():
+    """进程退出前写完剩余的span"""
+    _tracer.close()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Any]:
+    """记录一个阶段：在当前span下创建子span并设为当前span，退出时结束（异常记录为错误）"""
+    current = _tracer.start_span(name, **attributes)
+    try:
+        with current.activate():
+            yield current
+    except BaseException as e:
+        current.end(None if isinstance(e, GeneratorExit) else e)
+        raise
+    else:
+        current.end()
+
+
+def trace_iter(name: str, source: Iterable[Any], **attributes) -> Iterator[Any]:
+    """记录一个跨越多次产出的阶段（流式输出）
+
+    span只在每次取下一个元素时设为当前span，不会泄漏到消费方的代码中；
+    消费方在每一步切换线程或上下文时子span仍能正确嵌套。
+    """
+    current = _tracer.start_span(name, **attributes)
+    iterator = iter(source)
+    items = 0
+    try:
+        while True:
+            with current.activate():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+            items += 1
+            yield item
+    except GeneratorExit:
+        current.set(closed_early=True)
+        close = getattr(iterator, "close", None)
+        if close:
+            with current.activate():
+                close()
+        raise
+    except BaseException as e:
+        current.set(items=items)
+        current.end(e)
+        raise
+    finally:
+        current.set(items=items)
+        current.end()
+
+
+def traced(name: str) -> Callable:
+    """函数装饰器：每次调用记录一个span；生成器函数按 trace_iter 记录，协程函数记录到返回为止"""
+    def decorator(fn: Callable) -> Callable:
+        if inspect.isgeneratorfunction(fn):
+            @wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                yield from trace_iter(name, fn(*args, **kwargs))
+            return generator_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def coroutine_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return coroutine_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**attributes):
+    """给当前span补充属性（没有当前span时忽略）"""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace_id if current is not None else None
+
+
+def bind_context(fn: Callable) -> Callable:
+    """把当前上下文（包括当前span）绑定到将在其他线程中执行的函数上"""
+    context = contextvars.copy_context()
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+    return wrapper
+
+
+def get_trace(trace_id: str) -> List[Dict[str, Any]]:
+    """一个请求中已结束的span"""
+    return _tracer.get_trace(trace_id)
@@ -0,0 +1,191 @@
+"""
+准入控制测试：先来先服务、排队超时和队列已满时拒绝、同步与异步等待者共享名额
+"""
+import time
+import asyncio
+import threading
+from typing import List
+
+import pytest
+
+from models.admission import AdmissionLimiter, AdmissionSettings, ServerBusyError
+
+
+def _limiter(max_concurrent: int = 1, max_queue: int = 8, queue_timeout: float = 5.0) -> AdmissionLimiter:
+    return AdmissionLimiter("test", AdmissionSettings(
+        max_concurrent=max_concurrent, max_queue=max_queue, queue_timeout=queue_timeout
+    ))
+
+
+def _wait_for_queue(limiter: AdmissionLimiter, depth: int, timeout: float = 2.0):
+    """等到队列中有 depth 个等待者，保证后续等待者按启动顺序入队"""
+    end = time.monotonic() + timeout
+    while limiter.stats()["queue_depth"] < depth:
+        assert time.monotonic() < end, "等待者没有按预期入队"
+        time.sleep(0.005)
+
+
+def _start_waiter(limiter: AdmissionLimiter, name: str, order: List[str]) -> threading.Thread:
+    def run():
+        with limiter.slot():
+            order.append(name)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    limiter = _limiter()
+    limiter.acquire()
+    order: List[str] = []
+    threads = []
+    for index, name in enumerate(["a", "b", "c"]):
+        threads.append(_start_waiter(limiter, name, order))
+        _wait_for_queue(limiter, index + 1)
+
+    limiter.release()
+    for thread in threads:
+        thread.join(2.0)
+
+    assert order == ["a", "b", "c"]
+    stats = limiter.stats()
+    assert stats["active"] == 0
+    assert stats["admitted"] == 4
+    assert stats["max_queue_depth"] == 3
+
+
+def test_try_acquire_does_not_jump_the_queue():
+    limiter = _limiter()
+    limiter.acquire()
+    order: List[str] = []
+    thread = _start_waiter(limiter, "queued", order)
+    _wait_for_queue(limiter, 1)
+
+    # 释放的名额直接移交给队首等待者，新请求拿不到
+    limiter.release()
+    assert not limiter.try_acquire()
+    thread.join(2.0)
+    assert order == ["queued"]
+
+
+def test_queue_timeout_raises_server_busy_and_leaves_the_queue():
+    limiter = _limiter(queue_timeout=0.05)
+    limiter.acquire()
+
+    with pytest.raises(ServerBusyError) as excinfo:
+        limiter.acquire()
+
+    assert excinfo.value.reason == "timeout"
+    stats = limiter.stats()
+    assert stats["timed_out"] == 1
+    assert stats["queue_depth"] == 0
+    # 超时的等待者已经离开队列，释放后名额回到空闲状态
+    limiter.release()
+    assert limiter.try_acquire()
+
+
+def test_caller_timeout_shortens_the_queue_timeout():
+    limiter = _limiter(queue_timeout=5.0)
+    limiter.acquire()
+
+    start = time.monotonic()
+    with pytest.raises(ServerBusyError):
+        limiter.acquire(timeout=0.05)
+    assert time.monotonic() - start < 1.0
+
+
+def test_full_queue_rejects_immediately():
+    limiter = _limiter(max_queue=1)
+    limiter.acquire()
+    order: List[str] = []
+    thread = _start_waiter(limiter, "queued", order)
+    _wait_for_queue(limiter, 1)
+
+    with pytest.raises(ServerBusyError) as excinfo:
+        limiter.acquire()
+    assert excinfo.value.reason == "queue_full"
+    assert limiter.stats()["rejected"] == 1
+
+    limiter.release()
+    thread.join(2.0)
+    assert order == ["queued"]
+
+
+def test_async_waiters_are_admitted_in_arrival_order():
+    limiter = _limiter()
+    order: List[str] = []
+
+    async def waiter(name: str):
+        async with limiter.aslot():
+            order.append(name)
+
+    async def main():
+        await limiter.aacquire()
+        tasks = []
+        for index, name in enumerate(["a", "b", "c"]):
+            tasks.append(asyncio.ensure_future(waiter(name)))
+            while limiter.stats()["queue_depth"] < index + 1:
+                await asyncio.sleep(0.005)
+        limiter.release()
+        await asyncio.wait_for(asyncio.gather(*tasks), 2.0)
+
+    asyncio.run(main())
+    assert order == ["a", "b", "c"]
+    assert limiter.stats()["active"] == 0
+
+
+def test_async_queue_timeout_raises_server_busy():
+    limiter = _limiter(queue_timeout=0.05)
+
+    async def main():
+        await limiter.aacquire()
+        with pytest.raises(ServerBusyError) as excinfo:
+            await limiter.aacquire()
+        assert excinfo.value.reason == "timeout"
+
+    asyncio.run(main())
+    assert limiter.stats()["queue_depth"] == 0
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    limiter = _limiter()
+
+    async def main():
+        await limiter.aacquire()
+        task = asyncio.ensure_future(limiter.aacquire())
+        while limiter.stats()["queue_depth"] < 1:
+            await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        limiter.release()
+
+    asyncio.run(main())
+    stats = limiter.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["active"] == 0
+
+
+def test_sync_and_async_waiters_share_one_queue():
+    limiter = _limiter()
+    order: List[str] = []
+    limiter.acquire()
+
+    sync_thread = _start_waiter(limiter, "sync", order)
+    _wait_for_queue(limiter, 1)
+
+    async def main():
+        task = asyncio.ensure_future(limiter.aacquire())
+        while limiter.stats()["queue_depth"] < 2:
+            await asyncio.sleep(0.005)
+        # 同步等待者先入队，先获得名额，归还后移交给异步等待者
+        limiter.release()
+        await asyncio.wait_for(task, 2.0)
+        order.append("async")
+        limiter.release()
+
+    asyncio.run(main())
+    sync_thread.join(2.0)
+    assert order == ["sync", "async"]
+    assert limiter.stats()["active"] == 0
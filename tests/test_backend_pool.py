@@ -0,0 +1,229 @@
+"""
+后端池测试：连续失败后熔断、冷却后只放行一个试探请求、被取消的请求不计入健康状况，
+以及对冲请求从获得准入名额开始计时并排除首个请求所在的后端
+"""
+import time
+import socket
+import asyncio
+from typing import Dict, Tuple
+
+import pytest
+import requests
+
+from benchmarks.fake_ollama import FakeOllamaSettings, start_server
+from models.admission import ServerBusyError
+from models.backend_pool import (
+    BackendPool,
+    BackendPoolSettings,
+    CircuitOpenError,
+    HedgeAttempt,
+    acall_with_hedge,
+    call_with_hedge,
+)
+
+A = "http://backend-a"
+B = "http://backend-b"
+
+
+def _pool(urls=(A, B), **settings) -> BackendPool:
+    settings.setdefault("health_interval", 0)
+    settings.setdefault("failure_threshold", 2)
+    return BackendPool(list(urls), BackendPoolSettings(**settings))
+
+
+def _fail(pool: BackendPool, url: str):
+    with pytest.raises(requests.ConnectionError):
+        with pool.lease(prefer=url):
+            raise requests.ConnectionError("connection refused")
+
+
+def test_consecutive_failures_trip_the_backend():
+    pool = _pool(ejection_seconds=60)
+    _fail(pool, A)
+    assert pool.stats()[A]["circuit"] == "closed"
+    _fail(pool, A)
+
+    stats = pool.stats()[A]
+    assert stats["circuit"] == "open"
+    assert stats["ejections"] == 1
+    assert stats["outstanding"] == 0
+    # 熔断的后端不再被选中，即使调用方指定了它
+    with pool.lease(prefer=A) as lease:
+        assert lease.url == B
+
+
+def test_all_backends_open_fails_fast():
+    pool = _pool(urls=(A,), ejection_seconds=60)
+    _fail(pool, A)
+    _fail(pool, A)
+    with pytest.raises(CircuitOpenError):
+        with pool.lease():
+            pass
+
+
+def test_success_resets_consecutive_failures():
+    pool = _pool(urls=(A,))
+    _fail(pool, A)
+    with pool.lease():
+        pass
+    _fail(pool, A)
+    assert pool.stats()[A]["circuit"] == "closed"
+
+
+def test_half_open_admits_a_single_trial():
+    pool = _pool(urls=(A,), ejection_seconds=0.05)
+    _fail(pool, A)
+    _fail(pool, A)
+    time.sleep(0.06)
+    assert pool.stats()[A]["circuit"] == "half_open"
+
+    with pool.lease() as trial:
+        assert trial.trial
+        # 试探请求进行中，其余请求继续快速失败
+        with pytest.raises(CircuitOpenError):
+            with pool.lease():
+                pass
+
+    assert pool.stats()[A]["circuit"] == "closed"
+    with pool.lease() as lease:
+        assert not lease.trial
+
+
+def test_failed_trial_reopens_the_circuit():
+    pool = _pool(urls=(A,), ejection_seconds=0.05)
+    _fail(pool, A)
+    _fail(pool, A)
+    time.sleep(0.06)
+
+    _fail(pool, A)
+    stats = pool.stats()[A]
+    assert stats["circuit"] == "open"
+    assert stats["ejections"] == 2
+    with pytest.raises(CircuitOpenError):
+        with pool.lease():
+            pass
+
+
+@pytest.mark.parametrize("error", [
+    ServerBusyError("timeout", "服务繁忙"),
+    TimeoutError("已超过调用时限"),
+    asyncio.CancelledError(),
+    GeneratorExit(),
+])
+def test_cancelled_leases_are_not_counted(error):
+    pool = _pool(urls=(A,), failure_threshold=1)
+    for _ in range(3):
+        with pytest.raises(type(error)):
+            with pool.lease():
+                raise error
+
+    stats = pool.stats()[A]
+    assert stats["circuit"] == "closed"
+    assert stats["failures"] == 0
+    assert stats["latency_ewma"] is None
+    assert stats["outstanding"] == 0
+
+
+def test_read_timeout_counts_only_before_the_caller_deadline():
+    pool = _pool(urls=(A,), failure_threshold=1, ejection_seconds=60)
+    with pytest.raises(requests.ReadTimeout):
+        with pool.lease(deadline=time.monotonic() - 1):
+            raise requests.ReadTimeout()
+    assert pool.stats()[A]["failures"] == 0
+
+    with pytest.raises(requests.ReadTimeout):
+        with pool.lease(deadline=time.monotonic() + 60):
+            raise requests.ReadTimeout()
+    assert pool.stats()[A]["circuit"] == "open"
+
+
+def _unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_probe_ejects_unreachable_backends_and_restores_them():
+    servers = [start_server(FakeOllamaSettings(port=0, latency=0.0))]
+    try:
+        live = f"http://127.0.0.1:{servers[0].server_port}"
+        port = _unused_port()
+        dead = f"http://127.0.0.1:{port}"
+        pool = _pool(urls=(live, dead), ejection_seconds=60, probe_timeout=1.0)
+
+        pool.probe_once()
+        stats = pool.stats()
+        assert stats[live]["circuit"] == "closed"
+        assert stats[dead]["circuit"] == "open"
+
+        servers.append(start_server(FakeOllamaSettings(port=port, latency=0.0)))
+        pool.probe_once()
+        assert pool.stats()[dead]["circuit"] == "closed"
+        with pool.lease(prefer=dead) as lease:
+            assert lease.url == dead
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+
+def _hedge_pool() -> BackendPool:
+    pool = _pool(hedge_enabled=True, hedge_min_samples=1, hedge_min_delay=0.1)
+    pool.record_latency("m", 0.1)
+    return pool
+
+
+def _attempt(pool: BackendPool, queue: Dict[str, float], work: Dict[str, float]):
+    """在 queue[url] 秒后获得准入名额，再用 work[url] 秒完成，返回所在后端"""
+    def attempt(exclude: Tuple[str, ...], state: HedgeAttempt) -> str:
+        with pool.lease(exclude, prefer=A) as lease:
+            state.choose(lease.url)
+            time.sleep(queue.get(lease.url, 0.0))
+            state.admit()
+            time.sleep(work.get(lease.url, 0.0))
+            return lease.url
+    return attempt
+
+
+def _aattempt(pool: BackendPool, queue: Dict[str, float], work: Dict[str, float]):
+    async def attempt(exclude: Tuple[str, ...], state: HedgeAttempt) -> str:
+        with pool.lease(exclude, prefer=A) as lease:
+            state.choose(lease.url)
+            await asyncio.sleep(queue.get(lease.url, 0.0))
+            state.admit()
+            await asyncio.sleep(work.get(lease.url, 0.0))
+            return lease.url
+    return attempt
+
+
+def test_queueing_for_admission_does_not_trigger_a_hedge():
+    pool = _hedge_pool()
+    result = call_with_hedge(pool, "m", _attempt(pool, {A: 0.3}, {A: 0.01}), bool)
+    assert result == A
+    assert pool.hedges == 0
+
+
+def test_slow_generation_hedges_to_another_backend():
+    pool = _hedge_pool()
+    result = call_with_hedge(pool, "m", _attempt(pool, {}, {A: 0.5, B: 0.01}), bool)
+    assert result == B
+    assert pool.hedges == 1
+    assert pool.hedge_wins == 1
+
+
+def test_async_queueing_for_admission_does_not_trigger_a_hedge():
+    pool = _hedge_pool()
+    result = asyncio.run(acall_with_hedge(pool, "m", _aattempt(pool, {A: 0.3}, {A: 0.01}), bool))
+    assert result == A
+    assert pool.hedges == 0
+
+
+def test_async_hedge_excludes_the_primary_backend_and_cancels_the_loser():
+    pool = _hedge_pool()
+    result = asyncio.run(acall_with_hedge(pool, "m", _aattempt(pool, {}, {A: 0.5, B: 0.01}), bool))
+    assert result == B
+    assert pool.hedge_wins == 1
+    stats = pool.stats()
+    # 被取消的首个请求不计入失败，在途名额已归还
+    assert stats[A]["failures"] == 0
+    assert stats[A]["outstanding"] == 0
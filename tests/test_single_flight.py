@@ -0,0 +1,162 @@
+"""
+请求合并测试：相同键的进行中调用共享结果和异常，流式订阅者全部离开时停止生成
+"""
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List
+
+import pytest
+
+from agents.single_flight import SingleFlight, SingleFlightSettings
+
+
+def _wait_until(predicate, timeout: float = 2.0):
+    end = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < end, "条件未在时限内满足"
+        time.sleep(0.005)
+
+
+def test_do_shares_the_result_of_an_in_flight_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls: List[int] = []
+
+    def fn():
+        calls.append(1)
+        release.wait(2.0)
+        return {"answer": 42}
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, ("q",), fn)
+        _wait_until(lambda: calls)
+        follower = executor.submit(flight.do, ("q",), fn)
+        _wait_until(lambda: flight.stats()["shared"] == 1)
+        release.set()
+        assert leader.result(2.0) is follower.result(2.0)
+
+    assert len(calls) == 1
+    assert flight.stats() == {"executed": 1, "shared": 1, "in_flight": 0}
+
+
+def test_do_propagates_the_error_to_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(2.0)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, ("q",), fn)
+        _wait_until(lambda: flight.stats()["in_flight"] == 1)
+        follower = executor.submit(flight.do, ("q",), fn)
+        _wait_until(lambda: flight.stats()["shared"] == 1)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError, match="boom"):
+                future.result(2.0)
+
+    # 失败的调用不会留下，下一次重新执行
+    assert flight.do(("q",), lambda: "ok") == "ok"
+
+
+def test_do_runs_directly_when_disabled():
+    flight = SingleFlight(SingleFlightSettings(enabled=False))
+    assert flight.do(("q",), lambda: 1) == 1
+    assert flight.stats()["executed"] == 0
+
+
+def test_ado_shares_one_task_and_survives_a_cancelled_waiter():
+    flight = SingleFlight()
+    calls: List[int] = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flight.ado(("q",), factory))
+        second = asyncio.ensure_future(flight.ado(("q",), factory))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "done"
+    assert len(calls) == 1
+    assert flight.stats()["shared"] == 1
+
+
+def test_stream_replays_items_to_late_subscribers():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls: List[int] = []
+
+    def factory() -> Iterator[str]:
+        calls.append(1)
+        yield "a"
+        started.set()
+        release.wait(2.0)
+        yield "b"
+
+    first = flight.stream(("q",), factory)
+    assert next(first) == "a"
+    started.wait(2.0)
+    second = flight.stream(("q",), factory)
+    release.set()
+
+    assert list(second) == ["a", "b"]
+    assert list(first) == ["b"]
+    assert len(calls) == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_stream_propagates_an_error_raised_mid_stream():
+    flight = SingleFlight()
+
+    def factory() -> Iterator[str]:
+        yield "a"
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        list(flight.stream(("q",), factory))
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_stream_propagates_an_error_raised_by_the_factory():
+    flight = SingleFlight()
+
+    def factory():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        list(flight.stream(("q",), factory))
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_stream_closes_the_source_when_every_subscriber_leaves():
+    flight = SingleFlight()
+    closed = threading.Event()
+    produced = threading.Event()
+
+    def factory() -> Iterator[int]:
+        try:
+            for index in range(1000):
+                yield index
+                produced.set()
+        finally:
+            closed.set()
+
+    stream = flight.stream(("q",), factory)
+    assert next(stream) == 0
+    produced.wait(2.0)
+    stream.close()
+
+    assert closed.wait(2.0)
+    _wait_until(lambda: flight.stats()["in_flight"] == 0)
+    # 放弃的生成不会被新的订阅者复用，新的订阅者从头开始
+    assert next(flight.stream(("q",), lambda: iter(["fresh"]))) == "fresh"
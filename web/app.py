@@ -15,6 +15,8 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from agents.fashion_agent import FashionAgent
+from agents.quick_answers import DEFAULT_QUESTIONS
+from models.tracing import span, traced
 
 class FashionWebApp:
     """Fashion Agent Web应用类"""
@@ -36,12 +38,18 @@ class FashionWebApp:
             print(f"❌ Fashion Agent初始化失败: {e}")
             self.agent = None
     
-    def analyze_image_with_recommendations(self, image: Image.Image) -> Tuple[str, str, str]:
+    @traced("web.analyze_image")
+    def analyze_image_with_recommendations(
+        self,
+        image: Image.Image,
+        request: gr.Request = None
+    ) -> Tuple[str, str, str]:
         """
         分析图片并提供搭配建议和商品推荐
         
         Args:
             image: 上传的图片
+            request: Gradio请求，按其会话复用分析历史
             
         Returns:
             Tuple[str, str, str]: (图片分析结果, 搭配建议, 商品推荐HTML)
@@ -53,15 +61,10 @@ class FashionWebApp:
             return "❌ 请先上传图片", "", ""
         
         try:
-            # 保存临时图片
-            temp_path = os.path.join(project_root, "web", "uploads", "temp_upload.jpg")
-            os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-            image.save(temp_path, "JPEG")
+            print(f"开始分析图片: {image.size[0]}x{image.size[1]}")
             
-            print(f"开始分析图片: {temp_path}")
-            
-            # 调用agent分析图片并获取推荐
-            result = self.agent.analyze_and_recommend(temp_path)
+            # 直接传入内存中的图片，由agent统一编码，不写临时文件
+            result = self.agent.analyze_and_recommend(image, request.session_hash if request else None)
             
             if "error" in result:
                 return f"❌ 分析失败: {result['error']}", "", ""
@@ -87,6 +90,7 @@ class FashionWebApp:
             print(error_msg)
             return f"❌ {error_msg}", "", ""
     
+    @traced("web.text_query")
     def process_text_query(self, query: str) -> Tuple[str, str]:
         """
         处理文本查询
@@ -127,6 +131,14 @@ class FashionWebApp:
             return f"❌ {error_msg}", ""
     
     def _format_products_html(self, products_data: Dict[str, Any]) -> str:
+        """将商品数据格式化为HTML，渲染耗时和HTML大小记录为 web.render_products span"""
+        goods = products_data.get("goods") if isinstance(products_data, dict) else None
+        with span("web.render_products", goods=len(goods) if isinstance(goods, list) else 0) as current:
+            html = self._render_products_html(products_data)
+            current.set(html_bytes=len(html.encode("utf-8")))
+        return html
+    
+    def _render_products_html(self, products_data: Dict[str, Any]) -> str:
         """
         将商品数据格式化为HTML
         
@@ -544,13 +556,8 @@ def create_interface():
                     
                     with gr.Column(scale=1):
                         gr.Markdown("#### 🔥 热门问题")
-                        # 定义快捷问题和对应的按钮
-                        quick_questions = [
-                            "春季流行什么颜色？",
-                            "职场穿搭推荐",
-                            "约会服装搭配",
-                            "休闲装怎么搭配？"
-                        ]
+                        # 快捷问题来自 config.yaml 的 quick_answers，回答已在后台预计算
+                        quick_questions = app.agent.quick_answers.questions if app.agent else list(DEFAULT_QUESTIONS)
                         
                         # 创建按钮列表，用于后续绑定事件
                         quick_buttons = []
@@ -589,11 +596,15 @@ def create_interface():
                 def set_question(question_text):
                     return question_text
                 
-                # 绑定快捷问题按钮事件 - 修复的版本
+                # 绑定快捷问题按钮事件：填入问题后直接返回预计算的回答
                 for i, (question, btn) in enumerate(zip(quick_questions, quick_buttons)):
                     btn.click(
                         fn=lambda q=question: q,  # 使用闭包捕获当前问题
                         outputs=[text_input]
+                    ).then(
+                        fn=app.process_text_query,
+                        inputs=[text_input],
+                        outputs=[advice_text_output, products_text_output]
                     )
                 
                 # 绑定主要事件
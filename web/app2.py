@@ -6,7 +6,7 @@ import os
 import sys
 import json
 import gradio as gr
-from typing import Dict, Any, Optional, Tuple, List
+from typing import Dict, Any, Optional, Tuple, List, Iterator
 from PIL import Image
 import time
 import traceback
@@ -15,6 +15,8 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from agents.fashion_agent import FashionAgent
+from agents.quick_answers import DEFAULT_QUESTIONS
+from models.tracing import span, traced
 
 class FashionWebApp:
     """Fashion Agent Web应用类 """
@@ -41,95 +43,144 @@ class FashionWebApp:
             self.init_status = error_msg
     
     def get_system_status(self) -> str:
-        """获取系统状态"""
+        """获取系统状态（包含Ollama后台探测结果）"""
+        if not self.agent:
+            return self.init_status
+        
+        backend = self.agent.registry.status()
+        if backend["probe"] == "pending":
+            return f"{self.init_status}（正在检测模型服务...）"
+        if backend["probe"] == "unreachable":
+            return f"⚠️ 模型服务不可用: {'; '.join(backend['probe_errors'].values())}"
+        if backend["probe"] == "degraded":
+            return f"⚠️ 部分模型服务不可用: {'; '.join(backend['probe_errors'].keys())}"
+        
+        # 有请求排队时显示队列深度和近期排队耗时
+        queued = [stats for stats in self.agent.get_load_stats().values() if stats.get("queue_depth")]
+        if queued:
+            depth = sum(stats["queue_depth"] for stats in queued)
+            wait_p95 = max(stats["wait_p95"] for stats in queued)
+            return f"{self.init_status}（{depth} 个请求排队中，p95等待 {wait_p95:.1f}s）"
         return self.init_status
     
-    def analyze_uploaded_image(self, image: Image.Image) -> Dict[str, str]:
+    def analyze_uploaded_image(self, image: Image.Image, session_id: Optional[str] = None) -> Dict[str, str]:
         """
         分析上传的图片并返回完整结果
         
         Args:
             image: 上传的PIL图片对象
+            session_id: 用户会话，分析过的图片直接返回历史结果
             
         Returns:
             Dict[str, str]: 包含分析结果的字典
         """
+        result = {}
+        for result in self.stream_uploaded_image(image, session_id):
+            pass
+        return result
+    
+    @traced("web.analyze_image")
+    def stream_uploaded_image(self, image: Image.Image, session_id: Optional[str] = None) -> Iterator[Dict[str, str]]:
+        """
+        流式分析上传的图片，边生成边产出格式化后的结果
+        
+        Args:
+            image: 上传的PIL图片对象
+            session_id: 用户会话，分析过的图片直接返回历史结果
+            
+        Yields:
+            Dict[str, str]: 包含分析结果的字典，status 为 running 表示仍在生成
+        """
         if not self.agent:
-            return {
+            yield {
                 "status": "error",
                 "message": "系统未初始化，请刷新页面重试",
                 "analysis": "",
                 "recommendations": "",
                 "products": ""
             }
+            return
         
         if image is None:
-            return {
+            yield {
                 "status": "error", 
                 "message": "请先上传一张服装图片",
                 "analysis": "",
                 "recommendations": "", 
                 "products": ""
             }
+            return
         
         try:
-            # 保存临时图片
-            temp_path = os.path.join(project_root, "web", "uploads", f"temp_{int(time.time())}.jpg")
-            os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-            
-            # 处理图片格式
-            if image.mode in ('RGBA', 'LA', 'P'):
-                # 转换为RGB格式
-                rgb_image = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'P':
-                    image = image.convert('RGBA')
-                rgb_image.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
-                image = rgb_image
+            # 图片直接在内存中传给agent，透明背景和调色板模式在编码时统一处理，不写临时文件
+            print(f"📸 开始分析图片: {image.size[0]}x{image.size[1]}")
             
-            image.save(temp_path, "JPEG", quality=85)
-            print(f"📸 开始分析图片: {temp_path}")
-            
-            # 调用agent分析
-            result = self.agent.analyze_and_recommend(temp_path)
-            
-            if "error" in result:
-                return {
-                    "status": "error",
-                    "message": f"分析过程出错: {result['error']}",
-                    "analysis": "",
-                    "recommendations": "",
-                    "products": ""
+            # 调用agent流式分析
+            for result in self.agent.stream_analyze_and_recommend(image, session_id):
+                if result.get("busy"):
+                    yield {
+                        "status": "busy",
+                        "message": result["error"],
+                        "analysis": "",
+                        "recommendations": "",
+                        "products": ""
+                    }
+                    return
+                if "error" in result:
+                    yield {
+                        "status": "error",
+                        "message": f"分析过程出错: {result['error']}",
+                        "analysis": "",
+                        "recommendations": "",
+                        "products": ""
+                    }
+                    return
+                
+                # 提取和格式化结果
+                image_analysis = result.get("image_analysis", "")
+                recommendations = result.get("recommendations", "")
+                
+                if result["stage"] != "done":
+                    # 提前开始的商品搜索完成后，商品先于搭配建议展示
+                    early_products = result.get("product_suggestions")
+                    yield {
+                        "status": "running",
+                        "message": "正在生成搭配建议...",
+                        "analysis": self._format_analysis_text(image_analysis),
+                        "recommendations": recommendations or "🔄 正在生成搭配建议...",
+                        "products": self._create_product_cards(early_products) if early_products else ""
+                    }
+                    continue
+                
+                product_suggestions = result.get("product_suggestions", {})
+                
+                # 格式化输出
+                formatted_analysis = self._format_analysis_text(image_analysis)
+                formatted_recommendations = self._format_recommendations_text(recommendations)
+                formatted_products = self._create_product_cards(product_suggestions)
+                
+                # 部分阶段超时时提示用户结果不完整
+                if result.get("partial"):
+                    stage_names = {"vision": "图片分析", "advice": "搭配建议", "jd": "商品搜索"}
+                    stages = "、".join(stage_names.get(stage, stage) for stage in result.get("timed_out", []))
+                    formatted_recommendations += f"\n\n> ⏱️ {stages}超时，以上为已完成的部分结果"
+                if result.get("from_history"):
+                    analyzed_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(result["analyzed_at"]))
+                    formatted_recommendations += f"\n\n> 📚 这张图片已于 {analyzed_at} 分析过，以上为保存的结果"
+                
+                yield {
+                    "status": "success",
+                    "message": "分析完成！",
+                    "analysis": formatted_analysis,
+                    "recommendations": formatted_recommendations,
+                    "products": formatted_products
                 }
             
-            # 提取和格式化结果
-            image_analysis = result.get("image_analysis", "")
-            recommendations = result.get("recommendations", "")
-            product_suggestions = result.get("product_suggestions", {})
-            
-            # 格式化输出
-            formatted_analysis = self._format_analysis_text(image_analysis)
-            formatted_recommendations = self._format_recommendations_text(recommendations)
-            formatted_products = self._create_product_cards(product_suggestions)
-            
-            # 清理临时文件
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-            
-            return {
-                "status": "success",
-                "message": "分析完成！",
-                "analysis": formatted_analysis,
-                "recommendations": formatted_recommendations,
-                "products": formatted_products
-            }
-            
         except Exception as e:
             error_msg = f"图片分析出错: {str(e)}"
             print(error_msg)
             print(traceback.format_exc())
-            return {
+            yield {
                 "status": "error",
                 "message": error_msg,
                 "analysis": "",
@@ -147,62 +198,185 @@ class FashionWebApp:
         Returns:
             Dict[str, str]: 包含回答和推荐的字典
         """
+        result = {}
+        for result in self.stream_fashion_query(query):
+            pass
+        return result
+    
+    @traced("web.text_query")
+    def stream_fashion_query(self, query: str) -> Iterator[Dict[str, str]]:
+        """
+        流式处理时尚相关的文本查询，逐token产出回答
+        
+        Args:
+            query: 用户输入的查询文本
+            
+        Yields:
+            Dict[str, str]: 包含回答和推荐的字典，status 为 running 表示仍在生成
+        """
         if not self.agent:
-            return {
+            yield {
                 "status": "error",
                 "message": "系统未初始化，请刷新页面重试",
                 "answer": "",
                 "products": ""
             }
+            return
         
         if not query or not query.strip():
-            return {
+            yield {
                 "status": "error",
                 "message": "请输入您的时尚问题",
                 "answer": "",
                 "products": ""
             }
+            return
         
         try:
             print(f"💭 处理查询: {query}")
             
-            # 调用agent处理查询
-            result = self.agent.process_text_query(query.strip())
-            
-            if "error" in result:
-                return {
-                    "status": "error", 
-                    "message": f"查询处理出错: {result['error']}",
-                    "answer": "",
-                    "products": ""
+            # 调用agent流式处理查询
+            for result in self.agent.stream_text_query(query.strip()):
+                if result.get("busy"):
+                    yield {
+                        "status": "busy",
+                        "message": result["error"],
+                        "answer": "",
+                        "products": ""
+                    }
+                    return
+                if "error" in result:
+                    yield {
+                        "status": "error", 
+                        "message": f"查询处理出错: {result['error']}",
+                        "answer": "",
+                        "products": ""
+                    }
+                    return
+                
+                # 提取结果
+                analysis = result.get("analysis", "")
+                
+                if result["stage"] != "done":
+                    yield {
+                        "status": "running",
+                        "message": "正在生成回答...",
+                        "answer": self._format_query_answer(analysis),
+                        "products": ""
+                    }
+                    continue
+                
+                recommendations = result.get("recommendations", {})
+                
+                # 格式化输出
+                formatted_answer = self._format_query_answer(analysis)
+                formatted_products = self._create_product_cards(recommendations)
+                
+                yield {
+                    "status": "success",
+                    "message": "查询完成！",
+                    "answer": formatted_answer,
+                    "products": formatted_products
                 }
             
-            # 提取结果
-            analysis = result.get("analysis", "")
-            recommendations = result.get("recommendations", {})
-            
-            # 格式化输出
-            formatted_answer = self._format_query_answer(analysis)
-            formatted_products = self._create_product_cards(recommendations)
-            
-            return {
-                "status": "success",
-                "message": "查询完成！",
-                "answer": formatted_answer,
-                "products": formatted_products
-            }
-            
         except Exception as e:
             error_msg = f"文本查询出错: {str(e)}"
             print(error_msg)
             print(traceback.format_exc())
-            return {
+            yield {
                 "status": "error",
                 "message": error_msg,
                 "answer": "",
                 "products": ""
             }
     
+    @traced("web.chat")
+    def stream_chat_message(
+        self,
+        message: str,
+        history: List[Dict[str, str]],
+        session_id: Optional[str]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式处理连续对话中的一条消息
+        
+        Args:
+            message: 用户输入的消息
+            history: 对话框中已有的消息（messages格式）
+            session_id: 会话ID，首轮为空
+            
+        Yields:
+            Dict[str, Any]: 包含对话框消息、会话ID和商品卡片的字典
+        """
+        history = list(history or [])
+        if not self.agent:
+            yield {
+                "status": "error",
+                "history": history + [{"role": "assistant", "content": "❌ 系统未初始化，请刷新页面重试"}],
+                "session_id": session_id,
+                "products": ""
+            }
+            return
+        
+        if not message or not message.strip():
+            yield {"status": "error", "history": history, "session_id": session_id, "products": ""}
+            return
+        
+        history.append({"role": "user", "content": message.strip()})
+        try:
+            for result in self.agent.stream_chat(message.strip(), session_id):
+                session_id = result.get("session_id", session_id)
+                if result.get("busy"):
+                    yield {
+                        "status": "busy",
+                        "history": history + [{"role": "assistant", "content": f"🚦 {result['error']}"}],
+                        "session_id": session_id,
+                        "products": ""
+                    }
+                    return
+                if "error" in result:
+                    yield {
+                        "status": "error",
+                        "history": history + [{"role": "assistant", "content": f"❌ {result['error']}"}],
+                        "session_id": session_id,
+                        "products": ""
+                    }
+                    return
+                
+                answer = result.get("analysis", "")
+                if result["stage"] != "done":
+                    yield {
+                        "status": "running",
+                        "history": history + [{"role": "assistant", "content": answer}],
+                        "session_id": session_id,
+                        "products": ""
+                    }
+                    continue
+                
+                recommendations = result.get("recommendations")
+                yield {
+                    "status": "success",
+                    "history": history + [{"role": "assistant", "content": answer}],
+                    "session_id": session_id,
+                    "products": self._create_product_cards(recommendations) if recommendations else ""
+                }
+        
+        except Exception as e:
+            error_msg = f"对话出错: {str(e)}"
+            print(error_msg)
+            print(traceback.format_exc())
+            yield {
+                "status": "error",
+                "history": history + [{"role": "assistant", "content": f"❌ {error_msg}"}],
+                "session_id": session_id,
+                "products": ""
+            }
+    
+    def reset_chat(self, session_id: Optional[str]):
+        """清空会话"""
+        if self.agent and session_id:
+            self.agent.reset_chat(session_id)
+    
     def _format_analysis_text(self, text: str) -> str:
         """格式化图片分析文本"""
         if not text:
@@ -244,6 +418,14 @@ class FashionWebApp:
         return text
     
     def _create_product_cards(self, products_data: Dict[str, Any]) -> str:
+        """创建商品卡片HTML，渲染耗时和HTML大小记录为 web.render_products span"""
+        goods = products_data.get("goods") if isinstance(products_data, dict) else None
+        with span("web.render_products", goods=len(goods) if isinstance(goods, list) else 0) as current:
+            html = self._render_product_cards(products_data)
+            current.set(html_bytes=len(html.encode("utf-8")))
+        return html
+    
+    def _render_product_cards(self, products_data: Dict[str, Any]) -> str:
         """
         创建美观的商品卡片HTML
         
@@ -808,6 +990,12 @@ def create_app_interface():
         with gr.Row():
             status_display = gr.HTML(value=f'<div class="status-indicator status-success">{app.get_system_status()}</div>')
         
+        # 页面加载时刷新状态，后台探测完成后显示实际的服务状态
+        interface.load(
+            fn=lambda: f'<div class="status-indicator status-success">{app.get_system_status()}</div>',
+            outputs=[status_display]
+        )
+        
         # 主要功能区域
         with gr.Tabs(elem_classes="tab-nav") as main_tabs:
             
@@ -860,8 +1048,8 @@ def create_app_interface():
                 )
                 
                 # 绑定分析事件
-                def handle_image_analysis(image):
-                    """处理图片分析"""
+                def handle_image_analysis(image, request: gr.Request):
+                    """处理图片分析（按浏览器会话复用分析历史）"""
                     if image is None:
                         return (
                             "❌ 请先上传图片",
@@ -875,14 +1063,18 @@ def create_app_interface():
                     
                     yield processing_msg, processing_msg, processing_html
                     
-                    # 执行实际分析
-                    result = app.analyze_uploaded_image(image)
-                    
-                    if result["status"] == "error":
-                        error_html = f'<div class="empty-products"><div class="empty-icon">❌</div><h3>分析失败</h3><p>{result["message"]}</p></div>'
-                        yield f"❌ {result['message']}", "分析失败，请重试", error_html
-                    else:
-                        yield result["analysis"], result["recommendations"], result["products"]
+                    # 执行实际分析，边生成边刷新
+                    for result in app.stream_uploaded_image(image, request.session_hash if request else None):
+                        if result["status"] == "error":
+                            error_html = f'<div class="empty-products"><div class="empty-icon">❌</div><h3>分析失败</h3><p>{result["message"]}</p></div>'
+                            yield f"❌ {result['message']}", "分析失败，请重试", error_html
+                        elif result["status"] == "busy":
+                            busy_html = f'<div class="empty-products"><div class="empty-icon">🚦</div><h3>服务繁忙</h3><p>{result["message"]}</p></div>'
+                            yield f"🚦 {result['message']}", "当前请求较多，请稍后重试", busy_html
+                        elif result["status"] == "running":
+                            yield result["analysis"], result["recommendations"], result["products"] or processing_html
+                        else:
+                            yield result["analysis"], result["recommendations"], result["products"]
                 
                 analyze_btn.click(
                     fn=handle_image_analysis,
@@ -898,14 +1090,8 @@ def create_app_interface():
                 with gr.Row():
                     with gr.Column():
                         gr.Markdown("#### 🔥 热门问题 (点击快速提问)")
-                        quick_questions = [
-                            "春季流行什么颜色和款式？",
-                            "职场正装如何搭配？",
-                            "约会穿什么比较合适？",
-                            "休闲装怎么穿出时尚感？",
-                            "如何根据体型选择服装？",
-                            "秋冬外套推荐"
-                        ]
+                        # 问题列表来自 config.yaml 的 quick_answers，回答已在后台预计算
+                        quick_questions = app.agent.quick_answers.questions if app.agent else list(DEFAULT_QUESTIONS)
                         
                         # 创建快捷按钮
                         quick_buttons = []
@@ -966,14 +1152,18 @@ def create_app_interface():
                     
                     yield processing_msg, processing_html
                     
-                    # 执行实际查询
-                    result = app.process_fashion_query(query)
-                    
-                    if result["status"] == "error":
-                        error_html = f'<div class="empty-products"><div class="empty-icon">❌</div><h3>查询失败</h3><p>{result["message"]}</p></div>'
-                        yield f"❌ {result['message']}", error_html
-                    else:
-                        yield result["answer"], result["products"]
+                    # 执行实际查询，逐token刷新回答
+                    for result in app.stream_fashion_query(query):
+                        if result["status"] == "error":
+                            error_html = f'<div class="empty-products"><div class="empty-icon">❌</div><h3>查询失败</h3><p>{result["message"]}</p></div>'
+                            yield f"❌ {result['message']}", error_html
+                        elif result["status"] == "busy":
+                            busy_html = f'<div class="empty-products"><div class="empty-icon">🚦</div><h3>服务繁忙</h3><p>{result["message"]}</p></div>'
+                            yield f"🚦 {result['message']}", busy_html
+                        elif result["status"] == "running":
+                            yield result["answer"], processing_html
+                        else:
+                            yield result["answer"], result["products"]
                 
                 # 绑定查询事件
                 query_btn.click(
@@ -989,12 +1179,70 @@ def create_app_interface():
                     outputs=[answer_result, text_products_result]
                 )
                 
-                # 绑定快捷按钮事件
+                # 绑定快捷按钮事件：填入问题后直接展示预计算的回答
                 for btn, question in quick_buttons:
                     btn.click(
                         fn=lambda q=question: q,
                         outputs=[query_input]
+                    ).then(
+                        fn=handle_text_query,
+                        inputs=[query_input],
+                        outputs=[answer_result, text_products_result]
+                    )
+            
+            # 连续对话功能
+            with gr.TabItem("🗨️ 连续对话", id="chat_tab"):
+                gr.Markdown("### 🗨️ 与AI时尚顾问连续对话，可以针对上一轮的建议继续追问")
+                
+                chat_session = gr.State(None)
+                chat_empty_html = '<div class="empty-products"><div class="empty-icon">🛍️</div><h3>暂无商品推荐</h3><p>回答中提到具体单品时将为您推荐相关商品</p></div>'
+                
+                chatbot = gr.Chatbot(
+                    label="💬 对话记录",
+                    type="messages",
+                    height=480
+                )
+                
+                with gr.Row():
+                    chat_input = gr.Textbox(
+                        label="💭 输入您的问题",
+                        placeholder="例如：我下周要参加婚礼，穿什么合适？→ 那鞋子怎么搭配？",
+                        lines=2,
+                        scale=4
                     )
+                    with gr.Column(scale=1):
+                        chat_btn = gr.Button("📨 发送", elem_classes="action-button")
+                        chat_clear_btn = gr.Button("🧹 开始新对话", size="sm")
+                
+                chat_products_result = gr.HTML(value=chat_empty_html)
+                
+                def handle_chat(message, history, session_id):
+                    """发送一条消息，逐token刷新对话框"""
+                    for result in app.stream_chat_message(message, history, session_id):
+                        yield result["history"], result["session_id"], result["products"] or chat_empty_html, ""
+                
+                def handle_chat_clear(session_id):
+                    """清空对话框和会话历史"""
+                    app.reset_chat(session_id)
+                    return [], None, chat_empty_html, ""
+                
+                chat_btn.click(
+                    fn=handle_chat,
+                    inputs=[chat_input, chatbot, chat_session],
+                    outputs=[chatbot, chat_session, chat_products_result, chat_input]
+                )
+                
+                chat_input.submit(
+                    fn=handle_chat,
+                    inputs=[chat_input, chatbot, chat_session],
+                    outputs=[chatbot, chat_session, chat_products_result, chat_input]
+                )
+                
+                chat_clear_btn.click(
+                    fn=handle_chat_clear,
+                    inputs=[chat_session],
+                    outputs=[chatbot, chat_session, chat_products_result, chat_input]
+                )
         
         # 页脚信息
         gr.HTML("""